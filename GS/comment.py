@@ -3,17 +3,41 @@ from TS import ntext_similarity
 
 class Comment:
 
-    def __init__(self, THRESHOLD_COSINE_SIM=0.4, verbose=0, parallel_iteration=0, p_name=None):
+    def __init__(self, THRESHOLD_COSINE_SIM=0.4, verbose=0, parallel_iteration=0, p_name=None, tfidf_artifact_dir=None, top_k=None, vectorizer="tfidf", n_hash_features=2**20, tokenizer="nltk",
+                 engine="matrix", lsh_family="simhash", lsh_num_bands=None, lsh_band_size=None, lsh_min_recall=0.9, similarity_store=0):
         """
         Arguments:
         THRESHOLD_COSINE_SIM [float] -- cosine similarity threshold for ntext_similarity.py (NtextSimilarity)
         verbose [int] -- verbose parameter
         parallel_iteration [int] -- parallel iteration indicator
+        tfidf_artifact_dir [string] -- path to the TF-IDF artifact (TS/tfidf_artifact.py) shared by the parallel iterations
+        top_k [int] -- if it is given, only the top_k commits are kept for each issue (NtextSimilarity)
+        vectorizer [string] -- "tfidf" or "hashing" (NtextSimilarity)
+        n_hash_features [int] -- number of features of the "hashing" vectorizer
+        tokenizer [string] -- "nltk" or "regex" (NtextSimilarity)
+        engine [string] -- engine of NtextSimilarity ("matrix", "apss", "pairwise", or "lsh")
+        lsh_family [string] -- "simhash" or "minhash" (the "lsh" engine of NtextSimilarity)
+        lsh_num_bands [int] -- number of bands of the "lsh" engine (None: chosen from THRESHOLD_COSINE_SIM for simhash; minhash needs it)
+        lsh_band_size [int] -- number of hash values in a band of the "lsh" engine (None: chosen in the same way)
+        lsh_min_recall [float] -- the "lsh" engine stops with an error if its measured recall is below it (None: no check)
+        similarity_store [int] -- if it is not zero, the similarities are written in the similarity store (NtextSimilarity).
+                                  the "hashing" vectorizer needs it (or top_k)
         """
         self.THRESHOLD_COSINE_SIM = THRESHOLD_COSINE_SIM # NEED TO OPTIMIZE
         self.verbose = verbose
         self.parallel_iteration = parallel_iteration
         self.p_name = p_name
+        self.tfidf_artifact_dir = tfidf_artifact_dir
+        self.top_k = top_k
+        self.vectorizer = vectorizer
+        self.n_hash_features = n_hash_features
+        self.tokenizer = tokenizer
+        self.engine = engine
+        self.lsh_family = lsh_family
+        self.lsh_num_bands = lsh_num_bands
+        self.lsh_band_size = lsh_band_size
+        self.lsh_min_recall = lsh_min_recall
+        self.similarity_store = similarity_store
 
 
 
@@ -62,7 +86,12 @@ class Comment:
         comment_issue_dict [dict<issue id, comments (a string)>] -- a string of comments for each issue id
         # dsc_com_content_dict [dict<issue id, words>] -- words in the parsed description and comments
         """
-        ntext_similarity_obj = ntext_similarity.NtextSimilarity(THRESHOLD_COSINE_SIM=self.THRESHOLD_COSINE_SIM, verbose=self.verbose, parallel_iteration=self.parallel_iteration)
+        ntext_similarity_obj = ntext_similarity.NtextSimilarity(THRESHOLD_COSINE_SIM=self.THRESHOLD_COSINE_SIM, verbose=self.verbose, parallel_iteration=self.parallel_iteration,
+                                                                tfidf_artifact_dir=self.tfidf_artifact_dir, top_k=self.top_k,
+                                                                vectorizer=self.vectorizer, n_hash_features=self.n_hash_features, tokenizer=self.tokenizer,
+                                                                engine=self.engine, lsh_family=self.lsh_family, lsh_num_bands=self.lsh_num_bands,
+                                                                lsh_band_size=self.lsh_band_size, lsh_min_recall=self.lsh_min_recall,
+                                                                similarity_store=self.similarity_store)
 
 
 
@@ -60,7 +60,7 @@ class KeywordExtraction:
         """
         repo_dict [dict<commit hash, dict<key name, data>>] -- key name list: author_date, commit_date, author, committer, issue_id
         """
-        repo_dict = util.load_pickle(log_message_info_pickle_path)
+        repo_dict = util.load_log_message_info(log_message_info_pickle_path)
 
         issue2hash_dict = self.combine_issue2hash(repo_dict, hash_list, set(issue_id_list))
 
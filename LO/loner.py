@@ -181,20 +181,19 @@ class Loner:
         # time condition
         # time_filtering_dict [dict<issue id, list<commit hash>>] -- issue id to list of commit hashes. these commit hashes modified the same files with the patches in issue id
 
+        """
+        date_repo_dict [dict<commit hash, dict<key name, data>>] -- key name list: author_date, commit_date, author, committer, issue_id
+        """
+        date_repo_dict = util.load_log_message_info(log_message_info_pickle_path)
+
         print("time filtering start...")
         time_filtering_obj = time_filtering.TimeFiltering(TIME_INTERVAL_AFTER=timedelta(minutes=self.time_interval_after), verbose=self.verbose)
-        time_filtering_dict = time_filtering_obj.run(hash_list, issue_id_list, date_issue_dict, log_message_info_pickle_path)
+        time_filtering_dict = time_filtering_obj.compare_date(date_issue_dict, date_repo_dict, hash_list, issue_id_list)
         hash_list, issue_id_list = self.update_hash_issue_list_match(time_filtering_dict)
 
 
         comb_filtering_dict = time_filtering_dict
 
-
-        """
-        date_repo_dict [dict<commit hash, dict<key name, data>>] -- key name list: author_date, commit_date, author, committer, issue_id
-        """
-        date_repo_dict = util.load_pickle(log_message_info_pickle_path)
-
         commit_filtering_dict = self.check_commit_condition(date_issue_dict, date_repo_dict, comb_filtering_dict, time_filtering_obj)
 
 
@@ -210,6 +209,44 @@ class Loner:
 
         return issue2hash_dict
 
+    def run_sweep(self, hash_list, issue_id_list, log_message_info_pickle_path, date_issue_dict, time_interval_after_list, result_idx_list=None):
+        """
+        Same as run, but for several time_interval_after settings at once.
+        The interlink condition is computed once, and the time filtering of all settings
+        is done in one sweep (TimeFiltering.compare_date_sweep).
+
+        Arguments:
+        time_interval_after_list [list<int>] -- time_interval_after (minutes) for each setting
+        result_idx_list [list<int>] -- indices of time_interval_after_list whose results are built (None: all, []: only the counts)
+
+        Returns:
+        issue2hash_dict_list [list<dict<issue id, list<commit hash>>>] -- result of run for each setting (the same order with time_interval_after_list,
+                                                                          None if not built)
+        count_list [list<int>] -- number of the (issue id, commit hash) pairs after the time filtering for each setting
+        """
+        if self.keyword_extraction_flag>0:
+            if self.keyword_extraction_dict_path:
+                keyword_extraction_dict = util.load_pickle(self.keyword_extraction_dict_path)
+            else:
+                ins = keyword_extraction.KeywordExtraction()
+                keyword_extraction_dict = ins.run(hash_list, issue_id_list, log_message_info_pickle_path) # train data
+                keyword_extraction_dict = generate_delete_data.main(keyword_extraction_dict, self.delete_rate)
+
+            hash_list, issue_id_list = self.update_hash_issue_list_not_match(keyword_extraction_dict, hash_list, issue_id_list)
+
+        date_repo_dict = util.load_log_message_info(log_message_info_pickle_path)
+
+        print("time filtering start...")
+        time_filtering_obj = time_filtering.TimeFiltering(verbose=self.verbose)
+        window_list = [(time_filtering_obj.TIME_INTERVAL_BEFORE, timedelta(minutes=time_interval_after)) for time_interval_after in time_interval_after_list]
+        time_filtering_dict_list, count_list = time_filtering_obj.compare_date_sweep(date_issue_dict, date_repo_dict, hash_list, issue_id_list, window_list,
+                                                                                    result_idx_list=result_idx_list)
+
+        issue2hash_dict_list = [None if time_filtering_dict is None else self.check_commit_condition(date_issue_dict, date_repo_dict, time_filtering_dict, time_filtering_obj)
+                                for time_filtering_dict in time_filtering_dict_list]
+
+        return issue2hash_dict_list, count_list
+
 
 
 
@@ -53,7 +53,7 @@ class MLModel:
                                      keyword_extraction_dict_path=self.keyword_extraction_dict_path,
                                      delete_rate=self.delete_rate, max_iteration=self.max_iteration,
                                      execute_flag_ntext=self.execute_flag_ntext)
-        data_array, label_list, name_list, candidate_issue2hash_dict = pu_link_obj.extract_features(hash_list, issue_id_list, keyword_extraction_dict,
+        data_array, label_list, pair_table, candidate_issue2hash_dict = pu_link_obj.extract_features(hash_list, issue_id_list, keyword_extraction_dict,
                                                                                                     log_message_info_path, log_message_without_issueid_path,
                                                                                                     dsc_issue_dict, comment_issue_dict, output_dir)
 
@@ -69,14 +69,7 @@ class MLModel:
         
         prediction_result = self.Model.predict(data_array)
 
-        issue2hash_dict = {}
-        for issue_id in candidate_issue2hash_dict.keys():
-            for commit_hash in candidate_issue2hash_dict[issue_id]:
-                idx = name_list.index("{0}:{1}".format(issue_id, commit_hash))
-                if prediction_result[idx]:
-                    if not issue_id in issue2hash_dict:
-                        issue2hash_dict[issue_id] = []
-                    issue2hash_dict[issue_id].append(commit_hash)
+        issue2hash_dict = pair_table.to_issue2hash_dict(prediction_result)
 
         return issue2hash_dict
 
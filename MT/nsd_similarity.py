@@ -4,13 +4,33 @@ import sys
 import os
 
 from Utils import git_reader
+from Utils import modified_file_index
 
 from TS import ntext_similarity
+from TS import tfidf_artifact
 
 
 class NSDSimilarity:
     
-    def __init__(self, repodir, extension_set=set([".md",".txt"]), THRESHOLD_COSINE_SIM=0.2, CONTEXT_LINE=3, verbose=0, parallel_iteration=0, output_dir_cosine_sim="./data"):
+    def __init__(self, repodir, extension_set=set([".md",".txt"]), THRESHOLD_COSINE_SIM=0.2, CONTEXT_LINE=3, verbose=0, parallel_iteration=0, output_dir_cosine_sim="./data", tfidf_artifact_dir=None, top_k=None,
+                 vectorizer="tfidf", n_hash_features=2**20, tokenizer="nltk",
+                 engine="matrix", lsh_family="simhash", lsh_num_bands=None, lsh_band_size=None, lsh_min_recall=0.9, similarity_store=0):
+        """
+        tfidf_artifact_dir [string] -- path to the TF-IDF artifact of the nsd texts (TS/tfidf_artifact.py).
+                                       if the artifact exists, we do not extract the nsd texts again
+        top_k [int] -- if it is given, only the top_k commits are kept for each issue (NtextSimilarity)
+        vectorizer [string] -- "tfidf" or "hashing" (NtextSimilarity). with "hashing", the nsd texts are extracted from the repository
+                               for each commit while they are vectorized (once), and they are not kept in memory
+        n_hash_features [int] -- number of features of the "hashing" vectorizer
+        tokenizer [string] -- "nltk" or "regex" (NtextSimilarity)
+        engine [string] -- engine of NtextSimilarity ("matrix", "apss", "pairwise", or "lsh")
+        lsh_family [string] -- "simhash" or "minhash" (the "lsh" engine of NtextSimilarity)
+        lsh_num_bands [int] -- number of bands of the "lsh" engine (None: chosen from THRESHOLD_COSINE_SIM for simhash; minhash needs it)
+        lsh_band_size [int] -- number of hash values in a band of the "lsh" engine (None: chosen in the same way)
+        lsh_min_recall [float] -- the "lsh" engine stops with an error if its measured recall is below it (None: no check)
+        similarity_store [int] -- if it is not zero, the similarities are written in the similarity store (NtextSimilarity).
+                                  the "hashing" vectorizer needs it (or top_k)
+        """
 
         self.repodir = repodir
         self.extension_set = extension_set
@@ -19,6 +39,17 @@ class NSDSimilarity:
         self.verbose = verbose
         self.parallel_iteration = parallel_iteration
         self.output_dir_cosine_sim = output_dir_cosine_sim
+        self.tfidf_artifact_dir = tfidf_artifact_dir
+        self.top_k = top_k
+        self.vectorizer = vectorizer
+        self.n_hash_features = n_hash_features
+        self.tokenizer = tokenizer
+        self.engine = engine
+        self.lsh_family = lsh_family
+        self.lsh_num_bands = lsh_num_bands
+        self.lsh_band_size = lsh_band_size
+        self.lsh_min_recall = lsh_min_recall
+        self.similarity_store = similarity_store
 
     def compare_nsd(self, dsc_issue_dict, comment_issue_dict, nsd_dict, hash_list, issue_id_list, ntext_similarity_obj, target_issue_id_list):
         """
@@ -29,6 +60,7 @@ class NSDSimilarity:
         dsc_issue_dict [dict<issue id, description] -- description for each issue
         comment_issue_dict [dict<issue id, comments (a string)] -- a string of comments for each issue id
         nsd_dict [dict<commit hash, nsd text (a string)] -- all modified and context words of all modified nsds for each commit (not parsed yet)
+                                                            (or a function that returns an iterator of the nsd texts for the "hashing" vectorizer)
         hash_list [list<commit hash>] -- studied commit hash list
         issue_id_list [list<issue id>] -- studied issue id list
 
@@ -54,15 +86,7 @@ class NSDSimilarity:
         return_dict [dict<commit hash, list<modified files>>] -- modified files list for each commit hash
         """
 
-        print("Extract modified files")
-        return_dict = {}
-        num_hash_list = len(hash_list)
-        for idx, commit_hash in enumerate(hash_list):
-            if idx%1000==0:
-                print("{0}/{1}".format(idx, num_hash_list))
-            return_dict[commit_hash] = git_reader.get_all_modified_files(self.repodir, commit_hash)
-
-        return return_dict
+        return modified_file_index.extract_modified_file_repo(self.repodir, hash_list)
 
     def extract_diff_with_fpath(self, content):
         """
@@ -123,12 +147,22 @@ class NSDSimilarity:
         nsd_dict [dict<commit_hash, tokens as a string>] -- modified and context tokens of all the modified text files in this modification.
         """
 
+        return dict(self.iter_nsd_text(hash_list, context))
+
+    def iter_nsd_text(self, hash_list, context):
+        """
+        Same as extract_nsd_text, but yield the nsd text of each commit in the order of hash_list
+
+        Returns:
+        (yield) commit_hash [commit hash] -- commit hash
+        (yield) nsd_text [string] -- modified and context tokens of all the modified text files in this commit
+        """
+
         """
         modified_file_repo_dict [dict<commit hash, list<modified files>>] -- modified files list for each commit hash
         """
         modified_file_repo_dict = self.extract_modified_file_repo(hash_list)
 
-        nsd_dict = {}
         error_information = {}
         rename_information = {}
         len_hash_list = len(hash_list)
@@ -140,7 +174,7 @@ class NSDSimilarity:
                 if (idx_commit_hash%100)==0:
                     print("Done commit hash: {0}/{1}".format(idx_commit_hash, len_hash_list))
 
-            nsd_dict[commit_hash] = ""
+            nsd_text = ""
             content = git_reader.git_show_with_context(self.repodir, commit_hash, context)
             diff_content_dict = self.extract_diff_with_fpath(content)
 
@@ -162,7 +196,9 @@ class NSDSimilarity:
                         rename_information[commit_hash].append(f_path)
                         continue
 
-                    nsd_dict[commit_hash] += diff_content_dict[f_path]
+                    nsd_text += diff_content_dict[f_path]
+
+            yield commit_hash, nsd_text
 
 
         #if len(error_information) > 0:
@@ -170,9 +206,6 @@ class NSDSimilarity:
         #if len(rename_information) > 0:
         #    util.dump_pickle("./error/{0}_file_path_rename_ite{1}.pickle".format(self.p_name, self.parallel_iteration), rename_information)
 
-
-        return nsd_dict
-
     def run(self, hash_list, issue_id_list, target_issue_id_list,
             dsc_issue_dict, comment_issue_dict):
         """
@@ -188,9 +221,19 @@ class NSDSimilarity:
         issue2hash_dict [dict<issue id, list<commit hash>>] -- issue id to list of commit hashes. these commit hashes are the similar natural language with that issue
         """
 
-        ntext_similarity_obj = ntext_similarity.NtextSimilarity(THRESHOLD_COSINE_SIM=self.THRESHOLD_COSINE_SIM, verbose=self.verbose, parallel_iteration=self.parallel_iteration)
-
-        nsd_dict = self.extract_nsd_text(hash_list, self.CONTEXT_LINE)
+        ntext_similarity_obj = ntext_similarity.NtextSimilarity(THRESHOLD_COSINE_SIM=self.THRESHOLD_COSINE_SIM, verbose=self.verbose, parallel_iteration=self.parallel_iteration,
+                                                                tfidf_artifact_dir=self.tfidf_artifact_dir, top_k=self.top_k,
+                                                                vectorizer=self.vectorizer, n_hash_features=self.n_hash_features, tokenizer=self.tokenizer,
+                                                                engine=self.engine, lsh_family=self.lsh_family, lsh_num_bands=self.lsh_num_bands,
+                                                                lsh_band_size=self.lsh_band_size, lsh_min_recall=self.lsh_min_recall,
+                                                                similarity_store=self.similarity_store)
+
+        if self.tfidf_artifact_dir is not None and tfidf_artifact.exists(self.tfidf_artifact_dir):
+            nsd_dict = None # the nsd texts were already vectorized in the artifact
+        elif self.vectorizer=="hashing":
+            nsd_dict = lambda: (nsd_text for _, nsd_text in self.iter_nsd_text(hash_list, self.CONTEXT_LINE))
+        else:
+            nsd_dict = self.extract_nsd_text(hash_list, self.CONTEXT_LINE)
 
         issue2hash_dict = self.compare_nsd(dsc_issue_dict, comment_issue_dict, nsd_dict, hash_list, issue_id_list, ntext_similarity_obj, target_issue_id_list)
         return issue2hash_dict
@@ -1,6 +1,7 @@
 from datetime import timedelta
 from Utils import util
 from Utils import git_reader
+from Utils import modified_file_index
 from Utils import generate_delete_data
 
 from KE import keyword_extraction
@@ -134,15 +135,7 @@ class Phantom:
         return_dict [dict<commit hash, list<modified files>>] -- modified files list for each commit hash
         """
 
-        print("Extract modified files")
-        return_dict = {}
-        num_hash_list = len(hash_list)
-        for idx, commit_hash in enumerate(hash_list):
-            if idx%1000==0:
-                print("{0}/{1}".format(idx, num_hash_list))
-            return_dict[commit_hash] = git_reader.get_all_modified_files(self.repo_dir, commit_hash)
-
-        return return_dict
+        return modified_file_index.extract_modified_file_repo(self.repo_dir, hash_list)
 
     def resource_condition(self, hash_pair_set):
         """
@@ -250,7 +243,7 @@ class Phantom:
         """
         date_repo_dict [dict<commit hash, dict<key name, data>>] -- key name list: author_date, commit_date, author, committer, issue_id
         """
-        date_repo_dict = util.load_pickle(log_message_info_path) #
+        date_repo_dict = util.load_log_message_info(log_message_info_path) #
 
         # dev condition
         hash_pair_set = self.dev_condition(date_repo_dict, linked_hash_set, non_linked_hash_set)
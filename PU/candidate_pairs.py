@@ -0,0 +1,84 @@
+import numpy as np
+
+
+class CandidatePairs:
+    def __init__(self, issue_vocab, commit_vocab, issue_idx, commit_idx, feature_array=None, label_array=None):
+        """
+        Candidate links (issue id, commit hash) as integer arrays.
+        Row i is the link (issue_vocab[issue_idx[i]], commit_vocab[commit_idx[i]]) and
+        feature_array[i] and label_array[i] are its features and label.
+
+        Arguments:
+        issue_vocab [list<issue id>] -- issue ids
+        commit_vocab [list<commit hash>] -- commit hashes
+        issue_idx [np.array<int32>] -- index of issue_vocab for each link
+        commit_idx [np.array<int32>] -- index of commit_vocab for each link
+        feature_array [np.array<np.array<features>>] -- features for each link (None if not extracted yet)
+        label_array [np.array<labels>] -- labels for each link (None if not extracted yet)
+        """
+        assert len(issue_idx)==len(commit_idx), "issue_idx and commit_idx must have the same length"
+
+        self.issue_vocab = issue_vocab
+        self.commit_vocab = commit_vocab
+        self.issue_idx = np.asarray(issue_idx, dtype=np.int32)
+        self.commit_idx = np.asarray(commit_idx, dtype=np.int32)
+        self.feature_array = feature_array
+        self.label_array = label_array
+
+    def __len__(self):
+        return len(self.issue_idx)
+
+    @classmethod
+    def from_issue2hash_dict(cls, issue2hash_dict, hash_list):
+        """
+        Arguments:
+        issue2hash_dict [dict<issue id, iterable<commit hash>>] -- candidate commit hashes for each issue id
+        hash_list [list<commit hash>] -- studied commit hash list (commit vocabulary)
+
+        Returns:
+        candidate_pairs [CandidatePairs] -- links in the iteration order of issue2hash_dict
+        """
+        issue_vocab = list(issue2hash_dict.keys())
+        commit_vocab = list(dict.fromkeys(hash_list))
+        commit_index_dict = {commit_hash: idx for idx, commit_hash in enumerate(commit_vocab)}
+
+        count_array = np.array([len(issue2hash_dict[issue_id]) for issue_id in issue_vocab], dtype=np.int64)
+        issue_idx = np.repeat(np.arange(len(issue_vocab), dtype=np.int32), count_array)
+        commit_idx = np.array([commit_index_dict[commit_hash] for issue_id in issue_vocab for commit_hash in issue2hash_dict[issue_id]],
+                              dtype=np.int32)
+
+        return cls(issue_vocab, commit_vocab, issue_idx, commit_idx)
+
+    def name_list(self):
+        """
+        Returns:
+        name_list [list<string>] -- "{issue id}:{commit hash}" for each link
+        """
+        return ["{0}:{1}".format(self.issue_vocab[i], self.commit_vocab[c]) for i, c in zip(self.issue_idx.tolist(), self.commit_idx.tolist())]
+
+    def to_issue2hash_dict(self, mask=None):
+        """
+        Group the selected links by issue id
+
+        Arguments:
+        mask [np.array<bool>] -- links to keep (e.g., the prediction result). all links if None
+
+        Returns:
+        issue2hash_dict [dict<issue id, list<commit hash>>] -- issue ids in the order of issue_vocab and
+                                                               commit hashes in the row order for each issue id
+        """
+        if mask is None:
+            row_array = np.arange(len(self), dtype=np.int64)
+        else:
+            row_array = np.flatnonzero(np.asarray(mask))
+        if len(row_array)==0:
+            return {}
+
+        # stable sort keeps the row order in each issue id
+        row_array = row_array[np.argsort(self.issue_idx[row_array], kind='stable')]
+        issue_idx = self.issue_idx[row_array]
+        start_array = np.concatenate([[0], np.flatnonzero(np.diff(issue_idx)) + 1])
+        commit_group_list = np.split(self.commit_idx[row_array], start_array[1:])
+
+        return {self.issue_vocab[i]: [self.commit_vocab[c] for c in commit_group.tolist()]
+                for i, commit_group in zip(issue_idx[start_array].tolist(), commit_group_list)}
@@ -1,24 +1,23 @@
 import sqlite3
 
 import numpy as np
-import scipy
 
 import os
 import sys
 
 from datetime import datetime, timedelta
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 
 from Utils import generate_delete_data
 from Utils import git_reader
+from Utils import modified_file_index
+from Utils import timeline
 from Utils import util
 
-from PU import PUModel
+from PU import candidate_pairs
 from MT import nsd_similarity
-from TF import time_filtering
 from KE import keyword_extraction
 from TS import ntext_similarity
+from TS import similarity_store
 
 
 class PULink:
@@ -63,15 +62,7 @@ class PULink:
         return_dict [dict<commit hash, list<modified files>>] -- modified files list for each commit hash
         """
 
-        print("Extract modified files")
-        return_dict = {}
-        num_hash_list = len(hash_list)
-        for idx, commit_hash in enumerate(hash_list):
-            if idx%1000==0:
-                print("{0}/{1}".format(idx, num_hash_list))
-            return_dict[commit_hash] = git_reader.get_all_modified_files(self.repo_dir, commit_hash)
-
-        return return_dict
+        return modified_file_index.extract_modified_file_repo(self.repo_dir, hash_list)
 
 
     def extract_commit_modified_file_features(self, hash_list):
@@ -163,6 +154,55 @@ class PULink:
 
         return return_dict
 
+    def extract_time_feature_arrays(self, hash_list, issue_id_list, date_issue_dict, date_repo_dict):
+        """
+        Generate the candidate links and their time features with interval joins on the sorted dates.
+        A pair of an issue and a commit is a candidate if any date of the issue (created, updated, resolutiondate)
+        is in [commit date - CANDIDATE_TIME_FILTER_BEFORE, commit date + CANDIDATE_TIME_FILTER_AFTER]
+        for any date of the commit (author_date, commit_date).
+
+        Arguments:
+        hash_list [list<commit hash>] -- studied commit hash list
+        issue_id_list [list<issue id>] -- studied issue id list (duplicates are removed)
+        date_issue_dict [dict<issue id, dict<date keyword, date (datetime object)>>] -- date keywords are created, updated, and resolutiondate
+        date_repo_dict [dict<commit hash, dict<key name, data>>] -- key name list: author_date, commit_date, issue_id
+
+        Returns:
+        issue_idx [np.array<int64>] -- index of issue_id_list for each candidate link (sorted by issue_idx, then commit_idx)
+        commit_idx [np.array<int64>] -- index of hash_list for each candidate link
+        time_diff [np.array<float64>] -- absolute time difference (seconds) between ISSUE_DATE_KEYWORD and COMMIT_DATE_KEYWORD
+        time_diff_type [np.array<int64>] -- 0 if the issue date is not later than the commit date, otherwise 1
+        """
+        num_hash = len(hash_list)
+        before = timeline.timedelta_us(self.CANDIDATE_TIME_FILTER_BEFORE)
+        after = timeline.timedelta_us(self.CANDIDATE_TIME_FILTER_AFTER)
+
+        commit_epoch_dict = {}
+        code_list = []
+        for commit_date_key in ['author_date', 'commit_date']:
+            commit_epoch_dict[commit_date_key] = timeline.commit_epoch_array(date_repo_dict, hash_list, commit_date_key)
+            commit_timeline = timeline.Timeline(commit_epoch_dict[commit_date_key])
+            for issue_date_key in ['created', 'updated', 'resolutiondate']:
+                issue_epoch = timeline.issue_epoch_array(date_issue_dict, issue_id_list, issue_date_key)
+                query_idx, matched_commit_idx = commit_timeline.join(issue_epoch - after, issue_epoch + before)
+                code_list.append(query_idx*num_hash + matched_commit_idx)
+
+        # merge the candidates of the 6 date pairs
+        code = np.unique(np.concatenate(code_list))
+        issue_idx = code//num_hash if num_hash > 0 else code
+        commit_idx = code - issue_idx*num_hash
+
+        issue_epoch = timeline.issue_epoch_array(date_issue_dict, issue_id_list, self.ISSUE_DATE_KEYWORD)
+        if self.COMMIT_DATE_KEYWORD in commit_epoch_dict:
+            commit_epoch = commit_epoch_dict[self.COMMIT_DATE_KEYWORD]
+        else:
+            commit_epoch = timeline.commit_epoch_array(date_repo_dict, hash_list, self.COMMIT_DATE_KEYWORD)
+        diff_us = commit_epoch[commit_idx] - issue_epoch[issue_idx]
+        time_diff = np.abs(diff_us)/1000000
+        time_diff_type = (diff_us < 0).astype(np.int64)
+
+        return issue_idx, commit_idx, time_diff, time_diff_type
+
     def extract_time_features(self, hash_list, issue_id_list, log_message_info_path):
         """
         Return absolute time difference between a commit and an issue
@@ -176,55 +216,29 @@ class PULink:
         time_diff_type_dict [dict<issue id, dict<commit hash, time diff type>>] -- type diff type (if the issue is later (bigger) than the commit, let it be 0 (correct). Otherwise, it would be 1 (wrong))
         """
 
-        time_filtering_obj = time_filtering.TimeFiltering(ISSUE_DATE_KEYWORD=self.ISSUE_DATE_KEYWORD, COMMIT_DATE_KEYWORD=self.COMMIT_DATE_KEYWORD)
         # date_issue_dict [dict<issue id, dict<date keyword, date (datetime object)>>] -- extract date for each date keyword for each issue. date keywords are created, updated, and resolutiondate
         date_issue_dict = self.extract_dates(self.db_path)
 
         # repo_dict [dict<commit hash, dict<key name, data>>] -- key name list: author_date, commit_date, author, committer, issue_id
-        date_repo_dict = util.load_pickle(log_message_info_path) #
+        date_repo_dict = util.load_log_message_info(log_message_info_path) #
 
+        issue_id_list = list(dict.fromkeys(issue_id_list))
         if self.verbose > 0:
-            len_issue_id = len(issue_id_list)
+            print("time feature -- issues: {0}, commits: {1}".format(len(issue_id_list), len(hash_list)))
+        issue_idx, commit_idx, time_diff, time_diff_type = self.extract_time_feature_arrays(hash_list, issue_id_list, date_issue_dict, date_repo_dict)
 
-        time_diff_dict = {}
-        time_diff_type_dict = {}
+        time_diff_dict = {issue_id: {} for issue_id in issue_id_list}
+        time_diff_type_dict = {issue_id: {} for issue_id in issue_id_list}
         candidate_issue2hash_dict = {}
-        ISSUE_DATE_KEYWORD = time_filtering_obj.ISSUE_DATE_KEYWORD
-        COMMIT_DATE_KEYWORD = time_filtering_obj.COMMIT_DATE_KEYWORD
-        for idx_issue_id, issue_id in enumerate(issue_id_list):
+        for idx_issue_id, idx_commit_hash, diff, diff_type in zip(issue_idx.tolist(), commit_idx.tolist(), time_diff.tolist(), time_diff_type.tolist()):
+            issue_id = issue_id_list[idx_issue_id]
+            commit_hash = hash_list[idx_commit_hash]
+            if not issue_id in candidate_issue2hash_dict:
+                candidate_issue2hash_dict[issue_id] = set()
+            candidate_issue2hash_dict[issue_id].add(commit_hash)
 
-            if self.verbose > 0:
-                if (idx_issue_id%1000)==0:
-                    print("time feature -- Done {0}/{1}".format(idx_issue_id, len_issue_id))
-
-            time_diff_dict[issue_id] = {}
-            time_diff_type_dict[issue_id] = {}
-            for commit_hash in hash_list:
-
-                candidate_flag = 0
-                for issue_date_key in ['created', 'updated', 'resolutiondate']:
-                    for commit_date_key in ['author_date', 'commit_date']:
-                        if date_issue_dict[issue_id][issue_date_key] <= (date_repo_dict[commit_hash][commit_date_key] + self.CANDIDATE_TIME_FILTER_AFTER) and date_issue_dict[issue_id][issue_date_key] >= (date_repo_dict[commit_hash][commit_date_key] - self.CANDIDATE_TIME_FILTER_BEFORE):
-                            candidate_flag = 1
-
-                if candidate_flag==0:
-                    continue
-                
-                if not issue_id in candidate_issue2hash_dict:
-                    candidate_issue2hash_dict[issue_id] = set()
-                candidate_issue2hash_dict[issue_id].add(commit_hash)
-
-                if date_issue_dict[issue_id][ISSUE_DATE_KEYWORD] <= date_repo_dict[commit_hash][COMMIT_DATE_KEYWORD]:
-                    time_diff_dict[issue_id][commit_hash] = (date_repo_dict[commit_hash][COMMIT_DATE_KEYWORD] - date_issue_dict[issue_id][ISSUE_DATE_KEYWORD]).total_seconds()
-                    time_diff_type_dict[issue_id][commit_hash] = 0
-                elif date_issue_dict[issue_id][ISSUE_DATE_KEYWORD] > date_repo_dict[commit_hash][COMMIT_DATE_KEYWORD]:
-                    time_diff_dict[issue_id][commit_hash] = (date_issue_dict[issue_id][ISSUE_DATE_KEYWORD] - date_repo_dict[commit_hash][COMMIT_DATE_KEYWORD]).total_seconds()
-                    time_diff_type_dict[issue_id][commit_hash] = 1
-                else:
-                    print("ERROR")
-                    print(commit_hash)
-                    print(issue_id)
-                    sys.exit()
+            time_diff_dict[issue_id][commit_hash] = diff
+            time_diff_type_dict[issue_id][commit_hash] = diff_type
 
         return time_diff_dict, time_diff_type_dict, candidate_issue2hash_dict
 
@@ -239,20 +253,46 @@ class PULink:
         hash_list [list<commit hash>] -- studied commit hash list
         issue_id_list [list<issue id>] -- studied issue id list
         execute_flag [integer] -- if this value is not 0, we re-execute the developer filtering. if it is 0, we read the pickle file
+                                  (or the similarity store of TS if {{ output_dir }}/similarity_store exists)
 
         Returns:
         return_dict [dict<issue id, dict<commit hash, ntext similarity>>] -- cosine similarity between the commit log message in a repository
                                                                              and the description + comments in an issue
         """
 
-        if execute_flag==0:
+        if execute_flag==0 and os.path.exists(similarity_store.get_store_dir(output_dir)):
+            store = similarity_store.SimilarityStore(similarity_store.get_store_dir(output_dir))
+
+            pair_issue_id_list = []
+            pair_hash_list = []
+            for issue_id in candidate_issue2hash_dict.keys():
+                if not issue_id in store:
+                    continue
+                assert store.has_all_scores(issue_id), "The similarity store does not have all scores: {0}".format(issue_id)
+                for commit_hash in candidate_issue2hash_dict[issue_id]:
+                    pair_issue_id_list.append(issue_id)
+                    pair_hash_list.append(commit_hash)
+
+            if self.verbose > 0:
+                print("ntext feature -- similarity store: {0} pairs".format(len(pair_hash_list)))
+
+            return_dict = {}
+            for issue_id, commit_hash, cosine_sim in zip(pair_issue_id_list, pair_hash_list, store.lookup_batch(pair_issue_id_list, pair_hash_list).tolist()):
+                if not issue_id in return_dict:
+                    return_dict[issue_id] = {}
+                return_dict[issue_id][commit_hash] = cosine_sim
+
+        elif execute_flag==0:
 
             return_dict = {}
             for num_ite in range(1, self.max_iteration+1):
                 if self.verbose > 0:
                     print("ntext feature num ite: {0}/{1}".format(num_ite, self.max_iteration))
 
-                temp_dict = util.load_pickle("{0}/cosine_similarity_dict_ite{1}.pickle".format(output_dir, num_ite))
+                assert ntext_similarity.has_all_scores(output_dir, num_ite), \
+                    "{0} does not have all scores (written with the apss or lsh engine, or top_k); use the matrix engine for PU".format(
+                        ntext_similarity.get_cosine_similarity_path(output_dir, num_ite))
+                temp_dict = util.load_pickle(ntext_similarity.get_cosine_similarity_path(output_dir, num_ite))
 
                 if self.verbose > 0:
                     len_issue_id = len(temp_dict)
@@ -270,18 +310,21 @@ class PULink:
                     for commit_hash in candidate_issue2hash_dict[issue_id]:
                         return_dict[issue_id][commit_hash] = temp_dict[issue_id][commit_hash]
         else:
+            from sklearn.metrics.pairwise import cosine_similarity
+
             ntext_similarity_obj = ntext_similarity.NtextSimilarity(verbose=self.verbose)
 
             # repo_dict [dict<commit hash, log message] -- log message for each commit
             log_msg_repo_dict = util.load_pickle(log_message_without_issueid_path) #
 
-            corpus, processed_dsc_issue_dict, processed_comment_issue_dict, processed_log_msg_repo_dict = ntext_similarity_obj.make_corpus_and_input(dsc_issue_dict, comment_issue_dict, log_msg_repo_dict, hash_list, issue_id_list)
-            vectorizer = TfidfVectorizer()
-            vectorizer.fit(corpus)
+            # each distinct text is preprocessed and vectorized once (NtextSimilarity.vectorize_corpus)
+            candidate_issue_id_list = list(candidate_issue2hash_dict.keys())
+            _, _, commit_matrix, issue_matrix = ntext_similarity_obj.vectorize_corpus(dsc_issue_dict, comment_issue_dict, log_msg_repo_dict,
+                                                                                      hash_list, issue_id_list, candidate_issue_id_list)
 
             log_msg_vec_dict = {}
-            for commit_hash in hash_list:
-                log_msg_vec_dict[commit_hash] = vectorizer.transform([processed_log_msg_repo_dict[commit_hash]])
+            for idx_commit_hash, commit_hash in enumerate(hash_list):
+                log_msg_vec_dict[commit_hash] = commit_matrix[idx_commit_hash]
 
             if self.verbose > 0:
                 len_issue_id = len(candidate_issue2hash_dict)
@@ -294,7 +337,7 @@ class PULink:
                         print("ntext feature -- Done {0}/{1}".format(idx_issue_id, len_issue_id))
 
                 return_dict[issue_id] = {}
-                issue_text_vec = vectorizer.transform([processed_dsc_issue_dict[issue_id] + " " + processed_comment_issue_dict[issue_id]])
+                issue_text_vec = issue_matrix[idx_issue_id]
                 for commit_hash in candidate_issue2hash_dict[issue_id]:
                     return_dict[issue_id][commit_hash] = cosine_similarity(issue_text_vec, log_msg_vec_dict[commit_hash])[0,0]
 
@@ -315,7 +358,7 @@ class PULink:
         data_array [np.array<np.array<features>>] -- features that were converted by z-score (standarlization)
         label_list [np.array<labels>] -- labels. If it has label, it would be 1; otherwise, it would be 0. 
                                          Nobody knows label=0 means no link.
-        name_list [list<string>] -- corresponding issue id and commit hash
+        pair_table [CandidatePairs] -- corresponding issue id and commit hash for each row of data_array (see PU/candidate_pairs.py)
         """
         # extract commits' modified file features
         c_pro_modified_file_dict, c_num_modified_file_dict = self.extract_commit_modified_file_features(hash_list)
@@ -336,13 +379,14 @@ class PULink:
                 keyword_extraction_set_dict[issue_id].add(commit_hash)
 
 
+        # pair_table [CandidatePairs] -- candidate links (in the iteration order of candidate_issue2hash_dict)
+        pair_table = candidate_pairs.CandidatePairs.from_issue2hash_dict(candidate_issue2hash_dict, hash_list)
+
         data_array = []
         data_array_binary = []
         label_list = []
-        name_list = []
         for issue_id in candidate_issue2hash_dict.keys():
             for commit_hash in candidate_issue2hash_dict[issue_id]:
-                name_list.append("{0}:{1}".format(issue_id, commit_hash))
 
                 #temp = [c_pro_modified_file_dict[commit_hash], c_num_modified_file_dict[commit_hash],
                 #        ci_time_diff_dict[issue_id][commit_hash], ci_time_diff_type_dict[issue_id][commit_hash],
@@ -364,13 +408,18 @@ class PULink:
                     label_list.append(0)
 
         print("sample size: {0:,}".format(len(label_list)))
+        import scipy.stats
+
         data_array = scipy.stats.zscore(np.array(data_array))
         data_array = np.nan_to_num(data_array)
         data_array = np.concatenate([data_array, data_array_binary], 1)
 
         label_list = np.array(label_list)
 
-        return data_array, label_list, name_list, candidate_issue2hash_dict
+        pair_table.feature_array = data_array
+        pair_table.label_array = label_list
+
+        return data_array, label_list, pair_table, candidate_issue2hash_dict
 
     def run(self, hash_list, issue_id_list, log_message_info_path,
             log_message_without_issueid_path, dsc_issue_dict, comment_issue_dict,
@@ -400,24 +449,19 @@ class PULink:
             keyword_extraction_dict = generate_delete_data.main(keyword_extraction_dict, self.delete_rate)
 
 
-        data_array, label_list, name_list, candidate_issue2hash_dict = self.extract_features(hash_list, issue_id_list,
+        data_array, label_list, pair_table, candidate_issue2hash_dict = self.extract_features(hash_list, issue_id_list,
                                                                                              keyword_extraction_dict, log_message_info_path,
                                                                                              log_message_without_issueid_path,
                                                                                              dsc_issue_dict, comment_issue_dict,
                                                                                              output_dir)
 
+        from PU import PUModel # sklearn is imported here
+
         pu = PUModel.PUModel(random_state=self.random_state)
         pu.fit(data_array, label_list)
         prediction_result = pu.predict(data_array)
 
-        issue2hash_dict = {}
-        for issue_id in candidate_issue2hash_dict.keys():
-            for commit_hash in candidate_issue2hash_dict[issue_id]:
-                idx = name_list.index("{0}:{1}".format(issue_id, commit_hash))
-                if prediction_result[idx]:
-                    if not issue_id in issue2hash_dict:
-                        issue2hash_dict[issue_id] = []
-                    issue2hash_dict[issue_id].append(commit_hash)
+        issue2hash_dict = pair_table.to_issue2hash_dict(prediction_result)
 
         return issue2hash_dict
 
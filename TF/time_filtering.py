@@ -3,12 +3,15 @@ from datetime import datetime, timedelta
 import sqlite3
 import sys
 
+import numpy as np
+
 from Utils import util
 from Utils import git_reader
+from Utils import timeline
 
 
 class TimeFiltering:
-    def __init__(self, TIME_INTERVAL_BEFORE=timedelta(days=0), TIME_INTERVAL_AFTER=timedelta(minutes=10), ISSUE_DATE_KEYWORD="resolutiondate", COMMIT_DATE_KEYWORD="commit_date", verbose=0):
+    def __init__(self, TIME_INTERVAL_BEFORE=timedelta(days=0), TIME_INTERVAL_AFTER=timedelta(minutes=10), ISSUE_DATE_KEYWORD="resolutiondate", COMMIT_DATE_KEYWORD="commit_date", verbose=0, engine="sorted"):
         # how many days do we consider before or after the resolution date (days)
         self.TIME_INTERVAL_BEFORE = TIME_INTERVAL_BEFORE
         self.TIME_INTERVAL_AFTER = TIME_INTERVAL_AFTER
@@ -18,6 +21,11 @@ class TimeFiltering:
 
         self.verbose = verbose
 
+        # "sorted": binary search on the sorted commit dates (compare_date_sorted)
+        # "loop": compare every issue with every commit
+        assert engine in ("sorted", "loop"), "Illegal engine: {0}".format(engine)
+        self.engine = engine
+
     def _display_params(self):
         print(self.TIME_INTERVAL_BEFORE)
         print(self.TIME_INTERVAL_AFTER)
@@ -41,6 +49,9 @@ class TimeFiltering:
         return_dict [dict<issue id, list<commit hash>>] -- issue id to list of commit hashes. these commit hashes modified the same files with the patches in issue id
         """
 
+        if self.engine=="sorted":
+            return self.compare_date_sorted(date_issue_dict, date_repo_dict, hash_list, issue_id_list)
+
         num_issue_id = len(issue_id_list)
         return_dict = {}
         for idx_issue_id, issue_id in enumerate(issue_id_list):
@@ -56,6 +67,96 @@ class TimeFiltering:
 
         return return_dict
 
+    def compare_date_sorted(self, date_issue_dict, date_repo_dict, hash_list, issue_id_list):
+        """
+        Same as compare_date with the "loop" engine, but we sort the commit dates once
+        and find the commits in [issue date - TIME_INTERVAL_AFTER, issue date + TIME_INTERVAL_BEFORE]
+        with a binary search for each issue: O((I + C) log C + output) instead of O(I x C).
+        The result is exactly the same (the commit hashes follow the order of hash_list).
+        """
+        if self.verbose>0:
+            print("Sort commit dates: {0}".format(len(hash_list)))
+
+        commit_timeline = timeline.Timeline(timeline.commit_epoch_array(date_repo_dict, hash_list, self.COMMIT_DATE_KEYWORD))
+        issue_epoch = timeline.issue_epoch_array(date_issue_dict, issue_id_list, self.ISSUE_DATE_KEYWORD)
+        lo_array, hi_array = commit_timeline.window(issue_epoch - timeline.timedelta_us(self.TIME_INTERVAL_AFTER),
+                                                    issue_epoch + timeline.timedelta_us(self.TIME_INTERVAL_BEFORE))
+
+        return_dict = {}
+        for idx_issue_id in np.flatnonzero(hi_array > lo_array):
+            issue_id = issue_id_list[idx_issue_id]
+            if not issue_id in return_dict:
+                return_dict[issue_id] = []
+            commit_idx = np.sort(commit_timeline.order[lo_array[idx_issue_id]:hi_array[idx_issue_id]])
+            return_dict[issue_id].extend([hash_list[idx] for idx in commit_idx])
+
+        return return_dict
+
+    def compare_date_sweep(self, date_issue_dict, date_repo_dict, hash_list, issue_id_list, window_list, result_idx_list=None):
+        """
+        Run compare_date for several time windows with one sort of the commit dates.
+        The number of pairs of each window is computed from the binary search alone (the sum of hi - lo),
+        so a sweep that only counts costs about the same as one run. The result dict of a window is built
+        only if it is in result_idx_list (e.g., count all windows first, then build the result of the chosen one).
+
+        Arguments:
+        date_issue_dict [dict<issue id, dict<date keyword, date (datetime object)>>] -- extract date for each date keyword for each issue. date keywords are created, updated, and resolutiondate
+        date_repo_dict [dict<commit hash, dict<key name, data>>] -- key name list: author_date, commit_date, author, committer, issue_id
+        hash_list [list<commit hash>] -- studied commit hash list
+        issue_id_list [list<issue id>] -- studied issue id list
+        window_list [list<tuple<timedelta, timedelta>>] -- (TIME_INTERVAL_BEFORE, TIME_INTERVAL_AFTER) for each setting
+        result_idx_list [list<int>] -- indices of window_list whose results are built (None: all, []: only the counts)
+
+        Returns:
+        return_dict_list [list<dict<issue id, list<commit hash>>>] -- result of compare_date for each setting (the same order with window_list).
+                                                                      None for the settings that are not in result_idx_list
+        count_list [list<int>] -- number of the matched (issue id, commit hash) pairs for each setting
+        """
+        commit_timeline = timeline.Timeline(timeline.commit_epoch_array(date_repo_dict, hash_list, self.COMMIT_DATE_KEYWORD))
+        issue_epoch = timeline.issue_epoch_array(date_issue_dict, issue_id_list, self.ISSUE_DATE_KEYWORD)
+        result_idx_set = set(range(len(window_list))) if result_idx_list is None else set(result_idx_list)
+
+        return_dict_list = [None]*len(window_list)
+        count_list = []
+        for idx_window, (before, after) in enumerate(window_list):
+            lower_array = issue_epoch - timeline.timedelta_us(after)
+            upper_array = issue_epoch + timeline.timedelta_us(before)
+            if idx_window in result_idx_set:
+                return_dict_list[idx_window], count = self.window_result(commit_timeline, lower_array, upper_array, hash_list, issue_id_list)
+            else:
+                lo_array, hi_array = commit_timeline.window(lower_array, upper_array)
+                count = int((hi_array - lo_array).sum())
+            count_list.append(count)
+
+            if self.verbose>0:
+                print("Done -- window (before: {0}, after: {1}): {2} pairs".format(before, after, count))
+
+        return return_dict_list, count_list
+
+    @staticmethod
+    def window_result(commit_timeline, lower_array, upper_array, hash_list, issue_id_list):
+        """
+        Build the result of compare_date for one window from the interval join (the commit hashes follow the order of hash_list)
+
+        Returns:
+        return_dict [dict<issue id, list<commit hash>>] -- issue id to list of commit hashes
+        count [int] -- number of the matched (issue id, commit hash) pairs
+        """
+        query_idx, commit_idx = commit_timeline.join(lower_array, upper_array)
+        order = np.lexsort((commit_idx, query_idx))
+        matched_hash_list = [hash_list[idx] for idx in commit_idx[order].tolist()]
+        end_array = np.cumsum(np.bincount(query_idx, minlength=len(issue_id_list)))
+
+        return_dict = {}
+        start = 0
+        for issue_id, end in zip(issue_id_list, end_array.tolist()):
+            if end > start:
+                if not issue_id in return_dict:
+                    return_dict[issue_id] = []
+                return_dict[issue_id].extend(matched_hash_list[start:end])
+            start = end
+        return return_dict, len(commit_idx)
+
     def run(self, hash_list, issue_id_list, date_issue_dict, log_message_info_pickle_path):
         """
         Combine issue ids and commit hashes using shared files matching.
@@ -73,12 +174,29 @@ class TimeFiltering:
         """
         date_repo_dict [dict<commit hash, dict<key name, data>>] -- key name list: author_date, commit_date, author, committer, issue_id
         """
-        date_repo_dict = util.load_pickle(log_message_info_pickle_path) #
+        date_repo_dict = util.load_log_message_info(log_message_info_pickle_path) #
 
 
         issue2hash_dict = self.compare_date(date_issue_dict, date_repo_dict, hash_list, issue_id_list)
         return issue2hash_dict
 
+    def run_sweep(self, hash_list, issue_id_list, date_issue_dict, log_message_info_pickle_path, window_list, result_idx_list=None):
+        """
+        Same as run, but for several time windows at once (see compare_date_sweep).
+        TIME_INTERVAL_BEFORE and TIME_INTERVAL_AFTER of this object are not used.
+
+        Arguments:
+        window_list [list<tuple<timedelta, timedelta>>] -- (TIME_INTERVAL_BEFORE, TIME_INTERVAL_AFTER) for each setting
+        result_idx_list [list<int>] -- indices of window_list whose results are built (None: all, []: only the counts)
+
+        Returns:
+        issue2hash_dict_list [list<dict<issue id, list<commit hash>>>] -- result for each setting (the same order with window_list, None if not built)
+        count_list [list<int>] -- number of the matched (issue id, commit hash) pairs for each setting
+        """
+        date_repo_dict = util.load_log_message_info(log_message_info_pickle_path)
+
+        return self.compare_date_sweep(date_issue_dict, date_repo_dict, hash_list, issue_id_list, window_list, result_idx_list=result_idx_list)
+
 
 
 
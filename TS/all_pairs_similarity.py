@@ -0,0 +1,185 @@
+import numpy as np
+import scipy.sparse
+
+from sklearn.preprocessing import normalize
+
+
+class AllPairsSimilarity:
+    def __init__(self, THRESHOLD_COSINE_SIM=0.3, block_memory_mb=256, verbose=0, EPSILON=1e-9):
+        """
+        Exact all-pairs similarity search (cosine >= THRESHOLD_COSINE_SIM) between issues and commits.
+        It is based on the inverted index of AllPairs (Bayardo et al., WWW 2007):
+
+        - features of each commit vector are ordered by their document frequency (the most frequent first)
+          and the first features are not indexed while the upper bound of their contribution
+          (sum of commit weight x maximum issue weight of the feature) is below the threshold.
+          A pair that shares no indexed feature cannot reach the threshold.
+        - candidates are the pairs that share an indexed feature (sparse product with the indexed part).
+        - a candidate is pruned if its score on the indexed part plus the bound of the non-indexed part
+          is below the threshold, or if its size bound (maximum issue weight x L1 norm of the commit) is.
+        - the remaining candidates are verified: their score on the indexed part is already computed by the sparse product,
+          so only the dot product of the prefix is added (a few entries of the most frequent features for each commit).
+
+        The pairs whose similarity is 0 (no shared feature) are never found, so the result is the same as
+        the "matrix" engine only if THRESHOLD_COSINE_SIM is positive.
+
+        Arguments:
+        THRESHOLD_COSINE_SIM [float] -- cosine similarity threshold
+        block_memory_mb [int] -- memory budget (MB) for a block of issues (and for a chunk of the verified candidates)
+        EPSILON [float] -- margin of the bounds for the rounding errors (we never prune a pair whose cosine is >= THRESHOLD_COSINE_SIM)
+        """
+        self.THRESHOLD_COSINE_SIM = THRESHOLD_COSINE_SIM
+        self.block_memory_mb = block_memory_mb
+        self.verbose = verbose
+        self.EPSILON = EPSILON
+
+        self.stat_dict = {}
+
+    def build_index(self, commit_matrix, max_weight_array, normalized_commit_matrix=None):
+        """
+        Split each commit vector into the non-indexed part (prefix) and the indexed part.
+        The index depends on the issues (max_weight_array), so it is built in each process; only the indexed entries are copied
+        (the prefix is kept as the positions of its entries).
+
+        Arguments:
+        commit_matrix [scipy.sparse.csr_matrix] -- tfidf vectors of commits (one row for each commit)
+        max_weight_array [np.array<float>] -- maximum weight of each feature in the (normalized) issue vectors
+        normalized_commit_matrix [scipy.sparse.csr_matrix] -- L2-normalized commit_matrix if it is already computed
+                                                              (e.g., shared memory). it is used without copying
+        """
+        if normalized_commit_matrix is None:
+            commit_matrix = normalize(scipy.sparse.csr_matrix(commit_matrix, dtype=np.float64), copy=True)
+            commit_matrix.sort_indices()
+        else:
+            commit_matrix = normalized_commit_matrix if normalized_commit_matrix.has_sorted_indices else normalized_commit_matrix.sorted_indices()
+        num_commit, num_feature = commit_matrix.shape
+
+        # the most frequent feature first
+        doc_freq = np.bincount(commit_matrix.indices, minlength=num_feature)
+        feature_rank = np.empty(num_feature, dtype=np.int64)
+        feature_rank[np.argsort(-doc_freq, kind='stable')] = np.arange(num_feature)
+
+        row_array = np.repeat(np.arange(num_commit), np.diff(commit_matrix.indptr))
+        entry_order = np.lexsort((feature_rank[commit_matrix.indices], row_array))
+        bound_array = commit_matrix.data[entry_order]*max_weight_array[commit_matrix.indices[entry_order]]
+        cum_bound = np.cumsum(bound_array)
+        row_start = commit_matrix.indptr[:-1]
+        cum_bound -= np.repeat(np.concatenate([[0.0], cum_bound])[row_start], np.diff(commit_matrix.indptr))
+
+        prefix_mask = np.empty(len(entry_order), dtype=bool)
+        prefix_mask[entry_order] = cum_bound < (self.THRESHOLD_COSINE_SIM - self.EPSILON)
+        prefix_data = np.where(prefix_mask, commit_matrix.data, 0.0)
+        indexed_mask = ~prefix_mask & (commit_matrix.data!=0)
+        indexed_indptr = np.concatenate([[0], np.cumsum(np.bincount(row_array[indexed_mask], minlength=num_commit))])
+        indexed_matrix = scipy.sparse.csr_matrix((commit_matrix.data[indexed_mask], commit_matrix.indices[indexed_mask], indexed_indptr),
+                                                 shape=commit_matrix.shape)
+
+        self.commit_matrix = commit_matrix
+        # entries of the prefix of each commit (positions in commit_matrix.data, in the order of the rows)
+        self.prefix_position = np.flatnonzero(prefix_mask)
+        self.prefix_indptr = np.concatenate([[0], np.cumsum(np.bincount(row_array[prefix_mask], minlength=num_commit))])
+        self.indexed_matrix_t = indexed_matrix.T.tocsr()
+        # bound of the contribution of the prefix: min(sum of weight x max issue weight, L2 norm of the prefix (Cauchy-Schwarz))
+        self.prefix_bound = np.minimum(np.bincount(row_array, weights=prefix_data*max_weight_array[commit_matrix.indices], minlength=num_commit),
+                                       np.sqrt(np.bincount(row_array, weights=prefix_data**2, minlength=num_commit)))
+        self.l1_norm = np.bincount(row_array, weights=np.abs(commit_matrix.data), minlength=num_commit)
+
+        self.stat_dict = {'num_entry': int(commit_matrix.nnz), 'num_indexed_entry': int(indexed_matrix.nnz),
+                          'num_candidate': 0, 'num_pruned': 0, 'num_result': 0}
+
+    def search(self, issue_matrix, commit_matrix, normalized_commit_matrix=None):
+        """
+        Find all pairs whose cosine similarity is >= THRESHOLD_COSINE_SIM
+
+        Arguments:
+        issue_matrix [scipy.sparse.csr_matrix] -- tfidf vectors of issues (one row for each issue)
+        commit_matrix [scipy.sparse.csr_matrix] -- tfidf vectors of commits (one row for each commit)
+        normalized_commit_matrix [scipy.sparse.csr_matrix] -- L2-normalized commit_matrix (computed if None)
+
+        Returns:
+        issue_idx [np.array<int64>] -- row of issue_matrix for each pair (sorted by issue_idx, then commit_idx)
+        commit_idx [np.array<int64>] -- row of commit_matrix for each pair
+        score [np.array<float64>] -- cosine similarity for each pair
+        """
+        if issue_matrix.shape[0]==0 or commit_matrix.shape[0]==0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+        issue_matrix = normalize(scipy.sparse.csr_matrix(issue_matrix, dtype=np.float64), copy=True)
+        issue_matrix.sort_indices()
+        max_weight_array = np.asarray(issue_matrix.max(axis=0).toarray()).ravel()
+        self.build_index(commit_matrix, max_weight_array, normalized_commit_matrix=normalized_commit_matrix)
+        issue_max_weight = np.asarray(issue_matrix.max(axis=1).toarray()).ravel()
+
+        num_issue = issue_matrix.shape[0]
+        num_block_row = max(1, int(self.block_memory_mb*1024*1024)//(8*max(1, self.commit_matrix.shape[0])))
+        issue_idx_list, commit_idx_list, score_list = [], [], []
+        for start in range(0, num_issue, num_block_row):
+            if self.verbose > 0:
+                print("all pairs similarity -- Done issue id: {0}/{1}".format(start, num_issue))
+            issue_block = issue_matrix[start:start+num_block_row]
+
+            # candidates: pairs that share an indexed feature
+            candidate = scipy.sparse.coo_matrix(issue_block @ self.indexed_matrix_t)
+            row, col, partial = candidate.row.astype(np.int64), candidate.col.astype(np.int64), candidate.data
+            self.stat_dict['num_candidate'] += len(row)
+
+            keep = (partial + self.prefix_bound[col] >= self.THRESHOLD_COSINE_SIM - self.EPSILON) & \
+                   (issue_max_weight[start + row]*self.l1_norm[col] >= self.THRESHOLD_COSINE_SIM - self.EPSILON)
+            row, col = row[keep], col[keep]
+            self.stat_dict['num_pruned'] += int(len(keep) - keep.sum())
+
+            # verification: the indexed part + the prefix
+            score = partial[keep] + self.prefix_dot(issue_block, row, col)
+            hit = score >= self.THRESHOLD_COSINE_SIM
+            issue_idx_list.append(start + row[hit])
+            commit_idx_list.append(col[hit])
+            score_list.append(score[hit])
+
+        issue_idx = np.concatenate(issue_idx_list) if issue_idx_list else np.zeros(0, dtype=np.int64)
+        commit_idx = np.concatenate(commit_idx_list) if commit_idx_list else np.zeros(0, dtype=np.int64)
+        score = np.concatenate(score_list) if score_list else np.zeros(0, dtype=np.float64)
+        order = np.lexsort((commit_idx, issue_idx))
+        self.stat_dict['num_result'] = len(order)
+
+        return issue_idx[order], commit_idx[order], score[order]
+
+    def prefix_dot(self, issue_block, row, col):
+        """
+        Dot product of the prefix (non-indexed part) of each commit in col with the issue of the same position in row.
+        The rows of issue_block are made dense in groups, and the prefix entries of the pairs are looked up in them
+        without copying the commit rows. Half of block_memory_mb is for a dense group of issues,
+        and the other half for a chunk of the prefix entries of the pairs.
+
+        Arguments:
+        issue_block [scipy.sparse.csr_matrix] -- normalized tfidf vectors of a block of issues
+        row [np.array<int64>] -- row of issue_block for each pair (sorted)
+        col [np.array<int64>] -- row of the commit matrix for each pair
+
+        Returns:
+        prefix_score [np.array<float64>] -- dot product of the prefix for each pair
+        """
+        memory_byte = int(self.block_memory_mb*1024*1024)//2
+        num_dense_row = max(1, memory_byte//(8*max(1, issue_block.shape[1])))
+        # about 40 bytes for each prefix entry of a pair (pair, position, feature, and products)
+        max_chunk_entry = max(1, memory_byte//40)
+        prefix_length = np.diff(self.prefix_indptr)[col]
+        cum_length = np.cumsum(prefix_length)
+
+        prefix_score = np.zeros(len(row))
+        for dense_start in range(0, issue_block.shape[0], num_dense_row):
+            start, dense_end = np.searchsorted(row, [dense_start, dense_start+num_dense_row])
+            if start==dense_end:
+                continue
+            dense_block = issue_block[dense_start:dense_start+num_dense_row].toarray()
+            while start < dense_end:
+                done_length = cum_length[start-1] if start > 0 else 0
+                end = min(dense_end, max(start+1, int(np.searchsorted(cum_length, done_length + max_chunk_entry, side='right'))))
+                length = prefix_length[start:end]
+                num_entry = int(length.sum())
+                if num_entry > 0:
+                    pair = np.repeat(np.arange(end-start), length)
+                    position = self.prefix_position[np.repeat(self.prefix_indptr[col[start:end]] - (np.cumsum(length) - length), length) + np.arange(num_entry)]
+                    weight = dense_block[row[start:end][pair] - dense_start, self.commit_matrix.indices[position]]*self.commit_matrix.data[position]
+                    prefix_score[start:end] = np.bincount(pair, weights=weight, minlength=end-start)
+                start = end
+        return prefix_score
@@ -0,0 +1,307 @@
+import collections
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+# scipy and sklearn are imported when they are used first (see TS/ntext_similarity.py)
+
+
+def exists(model_dir):
+    return os.path.exists(os.path.join(model_dir, "meta.json"))
+
+
+def text_digest(dsc, comment):
+    """
+    Digest of the raw description and comments of an issue (to find the issues whose texts were changed)
+    """
+    return hashlib.blake2b(json.dumps([dsc, comment]).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class IncrementalTfidfModel:
+    def __init__(self, vocabulary, df, hash_list, issue_id_list, issue_digest_list, commit_count_matrix, dsc_count_matrix, comment_count_matrix,
+                 tokenizer="nltk"):
+        """
+        TF-IDF state of the corpus of NtextSimilarity (the description and comments of each issue, and the commits),
+        which is updated with new (or changed, or removed) issues and commits without preprocessing the other texts again.
+        It keeps the document frequency of each term and the term counts of each text; the idf and the tfidf vectors
+        are computed from them in the same way as TfidfVectorizer (smooth_idf), so they are the same as a full refit
+        (NtextSimilarity.vectorize_corpus) on the current issues and commits.
+
+        {{ model_dir }}/vocabulary.npy -- terms (sorted like TfidfVectorizer, the column order of the matrices)
+        {{ model_dir }}/df.npy -- document frequency of each term
+        {{ model_dir }}/hash_list.npy -- commit hashes (the row order of commit_count_matrix)
+        {{ model_dir }}/issue_id_list.npy -- issue ids (the row order of dsc_count_matrix and comment_count_matrix)
+        {{ model_dir }}/issue_digest_list.npy -- digest of the raw texts of each issue (text_digest)
+        {{ model_dir }}/{commit,dsc,comment}_count_matrix.npz -- term counts of the preprocessed texts
+        {{ model_dir }}/meta.json -- written at the end of the save (with the tokenizer of the preprocessing)
+
+        Arguments:
+        vocabulary [np.array<str>] -- terms
+        df [np.array<float>] -- document frequency of each term
+        hash_list [list<commit hash>] -- commit hashes
+        issue_id_list [list<issue id>] -- issue ids
+        issue_digest_list [list<string>] -- digest of the raw texts of each issue
+        commit_count_matrix [scipy.sparse.csr_matrix] -- term counts of the log messages
+        dsc_count_matrix [scipy.sparse.csr_matrix] -- term counts of the descriptions
+        comment_count_matrix [scipy.sparse.csr_matrix] -- term counts of the comments
+        tokenizer [string] -- tokenizer of NtextSimilarity that preprocessed the texts ("nltk" or "regex")
+        """
+        self.vocabulary = vocabulary
+        self.df = df
+        self.hash_list = hash_list
+        self.issue_id_list = issue_id_list
+        self.issue_digest_list = issue_digest_list
+        self.commit_count_matrix = commit_count_matrix
+        self.dsc_count_matrix = dsc_count_matrix
+        self.comment_count_matrix = comment_count_matrix
+        self.tokenizer = tokenizer
+
+    @classmethod
+    def empty(cls, tokenizer="nltk"):
+        import scipy.sparse
+
+        return cls(np.array([], dtype=str), np.zeros(0), [], [], [], *[scipy.sparse.csr_matrix((0, 0)) for _ in range(3)], tokenizer=tokenizer)
+
+    @property
+    def n_docs(self):
+        # the corpus of make_corpus_and_input: the description and comments of each issue, and the commits
+        return 2*len(self.issue_id_list) + len(self.hash_list)
+
+    def save(self, model_dir):
+        """
+        Write the model in a temporary directory and replace the previous model with it
+        """
+        import scipy.sparse
+
+        parent_dir = os.path.dirname(os.path.abspath(model_dir))
+        os.makedirs(parent_dir, exist_ok=True)
+        temp_dir = "{0}.{1}.tmp".format(os.path.abspath(model_dir), os.getpid())
+        os.makedirs(temp_dir, exist_ok=True)
+
+        np.save(os.path.join(temp_dir, "vocabulary.npy"), np.asarray(self.vocabulary, dtype=str))
+        np.save(os.path.join(temp_dir, "df.npy"), self.df)
+        np.save(os.path.join(temp_dir, "hash_list.npy"), np.array(self.hash_list, dtype=str))
+        np.save(os.path.join(temp_dir, "issue_id_list.npy"), np.array(self.issue_id_list, dtype=str))
+        np.save(os.path.join(temp_dir, "issue_digest_list.npy"), np.array(self.issue_digest_list, dtype=str))
+        for name in ("commit_count_matrix", "dsc_count_matrix", "comment_count_matrix"):
+            scipy.sparse.save_npz(os.path.join(temp_dir, "{0}.npz".format(name)), getattr(self, name))
+        with open(os.path.join(temp_dir, "meta.json"), "w") as f:
+            json.dump({'num_commit': len(self.hash_list), 'num_issue': len(self.issue_id_list),
+                       'num_term': len(self.vocabulary), 'tokenizer': self.tokenizer}, f)
+
+        if os.path.exists(model_dir):
+            old_dir = "{0}.{1}.old".format(os.path.abspath(model_dir), os.getpid())
+            os.rename(model_dir, old_dir)
+            os.rename(temp_dir, model_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        else:
+            os.rename(temp_dir, model_dir)
+
+    @classmethod
+    def load(cls, model_dir):
+        import scipy.sparse
+
+        assert exists(model_dir), "No incremental TF-IDF model: {0}".format(model_dir)
+
+        def _load(name):
+            return np.load(os.path.join(model_dir, "{0}.npy".format(name)))
+
+        with open(os.path.join(model_dir, "meta.json")) as f:
+            tokenizer = json.load(f)['tokenizer']
+        return cls(_load("vocabulary"), _load("df"), _load("hash_list").tolist(), _load("issue_id_list").tolist(),
+                   _load("issue_digest_list").tolist(),
+                   *[scipy.sparse.load_npz(os.path.join(model_dir, "{0}.npz".format(name))).tocsr()
+                     for name in ("commit_count_matrix", "dsc_count_matrix", "comment_count_matrix")],
+                   tokenizer=tokenizer)
+
+    @classmethod
+    def load_or_empty(cls, model_dir, tokenizer="nltk"):
+        if not exists(model_dir):
+            return cls.empty(tokenizer)
+
+        model = cls.load(model_dir)
+        assert model.tokenizer==tokenizer, "The incremental TF-IDF model {0} was built with the {1} tokenizer, not {2}".format(
+            model_dir, model.tokenizer, tokenizer)
+        return model
+
+    def idf(self):
+        """
+        Returns:
+        idf [np.array<float>] -- idf of each term (the same as TfidfTransformer.fit with smooth_idf=True)
+        """
+        idf = np.full_like(self.df, fill_value=self.n_docs+1, dtype=np.float64)
+        idf /= self.df + 1.0
+        np.log(idf, out=idf)
+        idf += 1.0
+        return idf
+
+    def _remap_terms(self, vocabulary, term_idx_array, df):
+        """
+        Move the columns of the count matrices to term_idx_array (the index of each current term in vocabulary).
+        Both vocabularies are sorted, so the terms in each row stay sorted.
+        """
+        import scipy.sparse
+
+        self.df = df
+        for name in ("commit_count_matrix", "dsc_count_matrix", "comment_count_matrix"):
+            matrix = getattr(self, name)
+            setattr(self, name, scipy.sparse.csr_matrix((matrix.data, term_idx_array[matrix.indices].astype(matrix.indices.dtype), matrix.indptr),
+                                                         shape=(matrix.shape[0], len(vocabulary))))
+        self.vocabulary = vocabulary
+
+    def count_terms(self, processed_text_list):
+        """
+        Count the terms of preprocessed texts in the same way as CountVectorizer (each distinct text once).
+        The new terms are added to the vocabulary.
+
+        Arguments:
+        processed_text_list [list<string>] -- preprocessed texts
+
+        Returns:
+        count_matrix [scipy.sparse.csr_matrix] -- term counts of each text (the columns of the extended vocabulary)
+        """
+        import scipy.sparse
+        from sklearn.feature_extraction.text import CountVectorizer
+
+        from TS import ntext_similarity
+
+        unique_text_list, index_array = ntext_similarity.dedup_texts(processed_text_list)
+        analyzer = CountVectorizer().build_analyzer()
+        counter_list = [collections.Counter(analyzer(text)) for text in unique_text_list]
+
+        new_term_set = set().union(*counter_list).difference(self.vocabulary.tolist())
+        if len(new_term_set) > 0:
+            vocabulary = np.array(sorted(new_term_set.union(self.vocabulary.tolist())), dtype=str)
+            term_idx_array = np.searchsorted(vocabulary, self.vocabulary)
+            df = np.zeros(len(vocabulary))
+            df[term_idx_array] = self.df
+            self._remap_terms(vocabulary, term_idx_array, df)
+        term_idx_dict = {term: idx for idx, term in enumerate(self.vocabulary.tolist())}
+
+        data, indices, indptr = [], [], [0]
+        for counter in counter_list:
+            for term_idx, count in sorted((term_idx_dict[term], count) for term, count in counter.items()):
+                indices.append(term_idx)
+                data.append(count)
+            indptr.append(len(indices))
+        count_matrix = scipy.sparse.csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int32), np.array(indptr)),
+                                               shape=(len(unique_text_list), len(self.vocabulary)))
+        return count_matrix[index_array]
+
+    def _document_frequency(self, count_matrix):
+        return np.bincount(count_matrix.indices, minlength=len(self.vocabulary)).astype(np.float64)
+
+    def update(self, ntext_similarity_obj, dsc_issue_dict, comment_issue_dict, log_msg_repo_dict, hash_list, issue_id_list):
+        """
+        Update the model to the corpus of hash_list and issue_id_list.
+        Only the new commits and the new (or changed) issues are preprocessed; the document frequencies of the terms
+        are updated with them (and with the removed issues and commits).
+
+        Arguments:
+        ntext_similarity_obj [NtextSimilarity] -- used for the preprocessing
+        dsc_issue_dict [dict<issue id, description] -- description for each issue
+        comment_issue_dict [dict<issue id, comments (a string)] -- a string of comments for each issue id
+        log_msg_repo_dict [dict<commit hash, log message] -- log message for each commit
+        hash_list [list<commit hash>] -- all studied commits (unique)
+        issue_id_list [list<issue id>] -- all studied issues (unique)
+
+        Returns:
+        new_hash_list [list<commit hash>] -- commits that were not in the model
+        updated_issue_id_list [list<issue id>] -- issues that were not in the model, or whose texts were changed
+        """
+        import scipy.sparse
+
+        from TS import ntext_similarity
+
+        assert len(set(hash_list))==len(hash_list) and len(set(issue_id_list))==len(issue_id_list), "hash_list and issue_id_list must be unique"
+
+        old_hash_idx_dict = {commit_hash: idx for idx, commit_hash in enumerate(self.hash_list)}
+        old_issue_idx_dict = {issue_id: idx for idx, issue_id in enumerate(self.issue_id_list)}
+        digest_list = [text_digest(dsc_issue_dict.get(issue_id), comment_issue_dict.get(issue_id)) for issue_id in issue_id_list]
+
+        kept_issue_idx_dict = {issue_id: old_issue_idx_dict[issue_id] for issue_id, digest in zip(issue_id_list, digest_list)
+                               if issue_id in old_issue_idx_dict and self.issue_digest_list[old_issue_idx_dict[issue_id]]==digest}
+        updated_issue_id_list = [issue_id for issue_id in issue_id_list if not issue_id in kept_issue_idx_dict]
+        hash_set = set(hash_list)
+        kept_hash_idx_dict = {commit_hash: idx for commit_hash, idx in old_hash_idx_dict.items() if commit_hash in hash_set}
+        new_hash_list = [commit_hash for commit_hash in hash_list if not commit_hash in kept_hash_idx_dict]
+
+        # remove the document frequencies of the removed (or changed) texts
+        kept_issue_idx_set = set(kept_issue_idx_dict.values())
+        removed_issue_idx_list = [idx for idx in range(len(self.issue_id_list)) if not idx in kept_issue_idx_set]
+        removed_hash_idx_list = [idx for commit_hash, idx in old_hash_idx_dict.items() if not commit_hash in kept_hash_idx_dict]
+        self.df = self.df - self._document_frequency(self.dsc_count_matrix[removed_issue_idx_list]) \
+                          - self._document_frequency(self.comment_count_matrix[removed_issue_idx_list]) \
+                          - self._document_frequency(self.commit_count_matrix[removed_hash_idx_list])
+
+        # preprocess and count the new texts (the same as make_corpus_and_input)
+        raw_text_list = [dsc_issue_dict.get(issue_id) for issue_id in updated_issue_id_list] \
+                        + [comment_issue_dict.get(issue_id) for issue_id in updated_issue_id_list] \
+                        + [log_msg_repo_dict[commit_hash] for commit_hash in new_hash_list]
+        unique_text_list, index_array = ntext_similarity.dedup_texts([text for text in raw_text_list if not text is None])
+        processed_unique_text_list = ntext_similarity_obj.preprocess_text_list(unique_text_list)
+        processed_text_iter = (processed_unique_text_list[idx] for idx in index_array)
+        processed_text_list = ["" if text is None else next(processed_text_iter) for text in raw_text_list]
+        count_matrix = self.count_terms(processed_text_list)
+        self.df = self.df + self._document_frequency(count_matrix)
+
+        num_updated = len(updated_issue_id_list)
+        new_dsc_count_matrix = count_matrix[:num_updated]
+        new_comment_count_matrix = count_matrix[num_updated:2*num_updated]
+        new_commit_count_matrix = count_matrix[2*num_updated:]
+
+        # rows in the order of hash_list and issue_id_list
+        def _merge(old_matrix, new_matrix, row_list):
+            return scipy.sparse.csr_matrix(scipy.sparse.vstack([old_matrix, new_matrix], format="csr")[row_list])
+
+        new_hash_idx_dict = {commit_hash: len(self.hash_list)+idx for idx, commit_hash in enumerate(new_hash_list)}
+        commit_row_list = [kept_hash_idx_dict[commit_hash] if commit_hash in kept_hash_idx_dict else new_hash_idx_dict[commit_hash]
+                           for commit_hash in hash_list]
+        updated_issue_idx_dict = {issue_id: len(self.issue_id_list)+idx for idx, issue_id in enumerate(updated_issue_id_list)}
+        issue_row_list = [kept_issue_idx_dict[issue_id] if issue_id in kept_issue_idx_dict else updated_issue_idx_dict[issue_id]
+                          for issue_id in issue_id_list]
+        self.commit_count_matrix = _merge(self.commit_count_matrix, new_commit_count_matrix, commit_row_list)
+        self.dsc_count_matrix = _merge(self.dsc_count_matrix, new_dsc_count_matrix, issue_row_list)
+        self.comment_count_matrix = _merge(self.comment_count_matrix, new_comment_count_matrix, issue_row_list)
+        self.hash_list = list(hash_list)
+        self.issue_id_list = list(issue_id_list)
+        self.issue_digest_list = digest_list
+
+        # remove the terms that are not in the corpus anymore (TfidfVectorizer does not have them)
+        keep_mask = self.df > 0
+        if not np.all(keep_mask):
+            self._remap_terms(self.vocabulary[keep_mask], np.cumsum(keep_mask) - 1, self.df[keep_mask])
+
+        return new_hash_list, updated_issue_id_list
+
+    def tfidf_transformer(self):
+        from sklearn.feature_extraction.text import TfidfTransformer
+
+        tfidf_transformer = TfidfTransformer()
+        tfidf_transformer.idf_ = self.idf()
+        return tfidf_transformer
+
+    def get_commit_matrix(self, hash_list):
+        """
+        Return the tfidf vectors of commits with the current idf (rows in the order of hash_list)
+        """
+        import scipy.sparse
+
+        hash_idx_dict = {commit_hash: idx for idx, commit_hash in enumerate(self.hash_list)}
+        count_matrix = self.commit_count_matrix[[hash_idx_dict[commit_hash] for commit_hash in hash_list]]
+        return scipy.sparse.csr_matrix(self.tfidf_transformer().transform(count_matrix))
+
+    def get_issue_matrix(self, issue_id_list):
+        """
+        Return the tfidf vectors of issues (description + " " + comments) with the current idf (rows in the order of issue_id_list)
+        """
+        import scipy.sparse
+
+        issue_idx_dict = {issue_id: idx for idx, issue_id in enumerate(self.issue_id_list)}
+        row_list = [issue_idx_dict[issue_id] for issue_id in issue_id_list]
+        count_matrix = scipy.sparse.csr_matrix(self.dsc_count_matrix[row_list] + self.comment_count_matrix[row_list])
+        count_matrix.sort_indices()
+        return scipy.sparse.csr_matrix(self.tfidf_transformer().transform(count_matrix))
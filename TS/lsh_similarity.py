@@ -0,0 +1,312 @@
+import math
+
+import numpy as np
+import scipy.sparse
+
+from sklearn.preprocessing import normalize
+
+# multiplier to combine the minhash values of a band into one key
+_BAND_KEY_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _expand_ranges(start_array, count_array):
+    """
+    Return the concatenation of range(start, start+count) for each start and count
+    """
+    total = int(count_array.sum())
+    if total==0:
+        return np.zeros(0, dtype=np.int64)
+    offset_array = np.repeat(start_array - (np.cumsum(count_array) - count_array), count_array)
+    return offset_array + np.arange(total)
+
+
+def simhash_candidate_probability(cosine, num_bands, band_size):
+    """
+    Probability that a pair with the cosine similarity is a candidate of simhash (the same band in any of num_bands bands)
+    """
+    p = 1 - math.acos(max(-1.0, min(1.0, cosine)))/math.pi
+    return 1 - (1 - p**band_size)**num_bands
+
+
+def choose_simhash_bands(THRESHOLD_COSINE_SIM, target_recall=0.95, max_num_bits=256):
+    """
+    Choose the bands of simhash: for each band size, the fewest bands whose expected recall at THRESHOLD_COSINE_SIM is
+    >= target_recall, and of them, the one with the fewest candidates of the unrelated pairs (cosine 0) within max_num_bits bits.
+    If no band size reaches target_recall within max_num_bits, the one with the highest expected recall.
+
+    Returns:
+    num_bands [int] -- number of bands
+    band_size [int] -- number of bits in a band
+    """
+    best_key, best_bands = None, None
+    for band_size in range(1, min(64, max_num_bits)+1):
+        p = (1 - math.acos(min(1.0, THRESHOLD_COSINE_SIM))/math.pi)**band_size
+        num_bands = math.ceil(math.log1p(-target_recall)/math.log1p(-p)) if p < 1 else 1
+        num_bands = max(1, min(num_bands, max_num_bits//band_size))
+        recall = simhash_candidate_probability(THRESHOLD_COSINE_SIM, num_bands, band_size)
+        # reaching target_recall first, then the fewest candidates (and the fewest bits)
+        key = (recall < target_recall, -recall if recall < target_recall else 0.0,
+               simhash_candidate_probability(0.0, num_bands, band_size), num_bands*band_size)
+        if best_key is None or key < best_key:
+            best_key, best_bands = key, (num_bands, band_size)
+    return best_bands
+
+
+class LshSimilarity:
+    def __init__(self, THRESHOLD_COSINE_SIM=0.3, family="simhash", num_bands=None, band_size=None, target_recall=0.95, max_num_bits=256,
+                 seed=0, num_recall_sample=200, block_memory_mb=256, verbose=0):
+        """
+        Approximate search of the pairs (cosine >= THRESHOLD_COSINE_SIM) between issues and commits with locality-sensitive hashing.
+        The signature of each vector is split into num_bands bands of band_size values, and the pairs that have the same band
+        (in any band) are the candidates. Only the candidates are verified with the exact cosine similarity, so the found
+        pairs have the exact similarities, but some pairs >= THRESHOLD_COSINE_SIM can be missed.
+
+        - "simhash": random hyperplanes (sign of the projection of the tfidf vector). two vectors have the same bit with
+          the probability 1 - angle/pi, so a band is the same with (1 - arccos(cosine)/pi)^band_size
+        - "minhash": min-wise hashing of the terms of each text (token set). a band is the same with jaccard^band_size
+
+        The candidates of a pair are 1 - (1 - p^band_size)^num_bands for the probability p of one value. More bands find more pairs
+        (and more candidates); a larger band_size makes fewer candidates. The recall is measured on a sample of issues (search).
+        The bands of simhash are chosen from THRESHOLD_COSINE_SIM and target_recall (choose_simhash_bands) unless they are given.
+        At the thresholds of TS (0.2-0.4), the chosen bands also make most unrelated pairs (cosine 0) candidates
+        (expected_candidate_ratio), so they save little over the exact engines.
+        minhash collides on the jaccard similarity of the token sets, not on the cosine similarity of the tfidf vectors, and a pair
+        above THRESHOLD_COSINE_SIM can have any small jaccard similarity, so its bands cannot be chosen from the threshold.
+        It is not usable at the thresholds of TS (e.g., the recall was 0.48 at 0.2 with 32 x 2 bands): it needs num_bands and
+        band_size, and its recall is only known from the measurement.
+
+        Arguments:
+        THRESHOLD_COSINE_SIM [float] -- cosine similarity threshold (> 0)
+        family [string] -- "simhash" or "minhash"
+        num_bands [int] -- number of bands (None: chosen for simhash)
+        band_size [int] -- number of bits (simhash) or minhash values in a band (None: chosen for simhash)
+        target_recall [float] -- expected recall at THRESHOLD_COSINE_SIM of the chosen simhash bands
+        max_num_bits [int] -- maximum number of bits (num_bands x band_size) of the chosen simhash bands
+        seed [int] -- seed of the random hyperplanes and hash functions
+        num_recall_sample [int] -- number of issues whose recall is measured with all commits (0: no measurement)
+        block_memory_mb [int] -- memory budget (MB) for a block of issues
+        """
+        assert family in ("simhash", "minhash"), "Illegal LSH family: {0}".format(family)
+        assert THRESHOLD_COSINE_SIM > 0, "LSH needs a positive threshold"
+        assert 0 < target_recall < 1, "Illegal target recall: {0}".format(target_recall)
+        assert family=="simhash" or not (num_bands is None or band_size is None), \
+            "The bands of minhash cannot be chosen from the cosine threshold (give num_bands and band_size, or use simhash)"
+        if num_bands is None or band_size is None:
+            chosen_num_bands, chosen_band_size = choose_simhash_bands(THRESHOLD_COSINE_SIM, target_recall, max_num_bits)
+            num_bands = chosen_num_bands if num_bands is None else num_bands
+            band_size = chosen_band_size if band_size is None else band_size
+        assert 0 < band_size <= 64, "Illegal band size: {0}".format(band_size)
+        self.THRESHOLD_COSINE_SIM = THRESHOLD_COSINE_SIM
+        self.family = family
+        self.num_bands = num_bands
+        self.band_size = band_size
+        self.target_recall = target_recall
+        self.seed = seed
+        self.num_recall_sample = num_recall_sample
+        self.block_memory_mb = block_memory_mb
+        self.verbose = verbose
+
+        self.stat_dict = {}
+
+    def expected_recall(self):
+        """
+        Probability that a pair with cosine == THRESHOLD_COSINE_SIM is a candidate (simhash; a pair with a higher similarity is
+        found with a higher probability). None for minhash, which depends on the jaccard similarity of the terms
+        """
+        if self.family!="simhash":
+            return None
+        return simhash_candidate_probability(self.THRESHOLD_COSINE_SIM, self.num_bands, self.band_size)
+
+    def expected_candidate_ratio(self):
+        """
+        Probability that an unrelated pair (cosine 0) is a candidate (simhash). If it is close to 1, almost all pairs are scored,
+        and the search is slower than the exact engines. None for minhash
+        """
+        if self.family!="simhash":
+            return None
+        return simhash_candidate_probability(0.0, self.num_bands, self.band_size)
+
+    def simhash_band_keys(self, matrix_list):
+        """
+        Arguments:
+        matrix_list [list<scipy.sparse.csr_matrix>] -- vectors (the same features)
+
+        Returns:
+        band_key_list [list<np.array<np.array<uint64>>>] -- key of each band (rows x num_bands) for each matrix
+        """
+        rng = np.random.default_rng(self.seed)
+        num_bit = self.num_bands*self.band_size
+        # hyperplanes only for the features that appear
+        feature_array = np.unique(np.concatenate([matrix.indices for matrix in matrix_list]))
+        projection = rng.standard_normal((len(feature_array), num_bit)).astype(np.float32)
+        bit_weight = (np.uint64(1) << np.arange(self.band_size, dtype=np.uint64))
+
+        band_key_list = []
+        for matrix in matrix_list:
+            compact_matrix = scipy.sparse.csr_matrix((matrix.data.astype(np.float32), np.searchsorted(feature_array, matrix.indices), matrix.indptr),
+                                                     shape=(matrix.shape[0], len(feature_array)))
+            band_key = np.empty((matrix.shape[0], self.num_bands), dtype=np.uint64)
+            num_block_row = max(1, int(self.block_memory_mb*1024*1024)//(4*num_bit))
+            for start in range(0, matrix.shape[0], num_block_row):
+                bit = (compact_matrix[start:start+num_block_row] @ projection) > 0
+                band_key[start:start+num_block_row] = (bit.reshape(-1, self.num_bands, self.band_size)*bit_weight).sum(axis=2, dtype=np.uint64)
+            band_key_list.append(band_key)
+        return band_key_list
+
+    def minhash_band_keys(self, matrix_list):
+        """
+        Same as simhash_band_keys with minhash (multiply-shift hash functions of the feature indices)
+        """
+        rng = np.random.default_rng(self.seed)
+        num_hash = self.num_bands*self.band_size
+        a_array = rng.integers(0, 2**63, size=num_hash, dtype=np.uint64)*np.uint64(2) + np.uint64(1) # odd multipliers
+        b_array = rng.integers(0, 2**63, size=num_hash, dtype=np.uint64)
+
+        band_key_list = []
+        for matrix in matrix_list:
+            feature_array = matrix.indices.astype(np.uint64)
+            nonempty_row = np.flatnonzero(np.diff(matrix.indptr) > 0)
+            band_key = np.zeros((matrix.shape[0], self.num_bands), dtype=np.uint64)
+            for idx_band in range(self.num_bands):
+                key = np.zeros(len(nonempty_row), dtype=np.uint64)
+                for idx_hash in range(idx_band*self.band_size, (idx_band+1)*self.band_size):
+                    hash_array = (a_array[idx_hash]*feature_array + b_array[idx_hash]) >> np.uint64(32)
+                    min_hash = np.minimum.reduceat(hash_array, matrix.indptr[nonempty_row]) if len(nonempty_row) > 0 else key
+                    key = key*_BAND_KEY_MULTIPLIER + min_hash
+                band_key[nonempty_row, idx_band] = key
+            band_key_list.append(band_key)
+        return band_key_list
+
+    def search(self, issue_matrix, commit_matrix, normalized_commit_matrix=None):
+        """
+        Arguments:
+        issue_matrix [scipy.sparse.csr_matrix] -- tfidf vectors of issues (one row for each issue)
+        commit_matrix [scipy.sparse.csr_matrix] -- tfidf vectors of commits (one row for each commit)
+        normalized_commit_matrix [scipy.sparse.csr_matrix] -- L2-normalized commit_matrix if it is already computed
+                                                              (e.g., shared memory). it is used without copying
+
+        Returns:
+        issue_idx [np.array<int>] -- row index of the issue of each found pair
+        commit_idx [np.array<int>] -- row index of the commit of each found pair
+        score [np.array<float>] -- cosine similarity of each pair (>= THRESHOLD_COSINE_SIM), sorted by issue_idx and commit_idx
+        """
+        # same normalization with sklearn's cosine_similarity
+        issue_matrix = normalize(scipy.sparse.csr_matrix(issue_matrix, dtype=np.float64), copy=True)
+        issue_matrix.sort_indices()
+        if normalized_commit_matrix is None:
+            commit_matrix = normalize(scipy.sparse.csr_matrix(commit_matrix, dtype=np.float64), copy=True)
+            commit_matrix.sort_indices()
+        else:
+            commit_matrix = normalized_commit_matrix if normalized_commit_matrix.has_sorted_indices else normalized_commit_matrix.sorted_indices()
+        num_issue, num_commit = issue_matrix.shape[0], commit_matrix.shape[0]
+
+        band_keys = self.simhash_band_keys if self.family=="simhash" else self.minhash_band_keys
+        issue_band_key, commit_band_key = band_keys([issue_matrix, commit_matrix])
+
+        # an empty vector has no similar text (cosine 0)
+        nonempty_commit = np.flatnonzero(np.diff(commit_matrix.indptr) > 0)
+        issue_nonempty_mask = np.diff(issue_matrix.indptr) > 0
+        commit_order_list = []
+        sorted_key_list = []
+        for idx_band in range(self.num_bands):
+            commit_order = nonempty_commit[np.argsort(commit_band_key[nonempty_commit, idx_band], kind='stable')]
+            commit_order_list.append(commit_order)
+            sorted_key_list.append(commit_band_key[commit_order, idx_band])
+
+        issue_idx_list, commit_idx_list, score_list = [], [], []
+        num_candidate = 0
+        # a block has at most (issues x commits) candidates in each band
+        num_block_row = max(1, int(self.block_memory_mb*1024*1024)//(8*max(1, num_commit)*self.num_bands))
+        for start in range(0, num_issue, num_block_row):
+            if self.verbose > 0:
+                print("lsh -- Done issue id: {0}/{1}".format(start, num_issue))
+            end = min(num_issue, start+num_block_row)
+            pair_code_list = []
+            for idx_band in range(self.num_bands):
+                key = issue_band_key[start:end, idx_band]
+                left = np.searchsorted(sorted_key_list[idx_band], key, side='left')
+                count = np.searchsorted(sorted_key_list[idx_band], key, side='right') - left
+                count[~issue_nonempty_mask[start:end]] = 0
+                pair_issue = np.repeat(np.arange(start, end, dtype=np.int64), count)
+                pair_commit = commit_order_list[idx_band][_expand_ranges(left, count)]
+                pair_code_list.append(pair_issue*num_commit + pair_commit)
+            pair_code = np.unique(np.concatenate(pair_code_list))
+            num_candidate += len(pair_code)
+            if len(pair_code)==0:
+                continue
+
+            # exact cosine similarity of the candidates
+            pair_issue, pair_commit = np.divmod(pair_code, num_commit)
+            score = self.score_candidates(issue_matrix, commit_matrix, start, end, pair_issue, pair_commit)
+            similar_mask = score >= self.THRESHOLD_COSINE_SIM
+            issue_idx_list.append(pair_issue[similar_mask])
+            commit_idx_list.append(pair_commit[similar_mask])
+            score_list.append(score[similar_mask])
+
+        issue_idx = np.concatenate(issue_idx_list) if issue_idx_list else np.zeros(0, dtype=np.int64)
+        commit_idx = np.concatenate(commit_idx_list) if commit_idx_list else np.zeros(0, dtype=np.int64)
+        score = np.concatenate(score_list) if score_list else np.zeros(0)
+
+        self.stat_dict = {'family': self.family, 'num_bands': self.num_bands, 'band_size': self.band_size,
+                          'threshold': self.THRESHOLD_COSINE_SIM, 'num_pair': num_issue*num_commit, 'num_candidate': num_candidate,
+                          'candidate_ratio': num_candidate/max(1, num_issue*num_commit), 'num_found': len(score),
+                          'target_recall': self.target_recall if self.family=="simhash" else None, 'expected_recall': self.expected_recall(),
+                          'expected_candidate_ratio': self.expected_candidate_ratio()}
+        self.stat_dict.update(self.measure_recall(issue_matrix, commit_matrix, issue_idx, commit_idx))
+        return issue_idx, commit_idx, score
+
+    @staticmethod
+    def score_candidates(issue_matrix, commit_matrix, start, end, pair_issue, pair_commit):
+        """
+        Cosine similarity of the candidates of the issues [start, end): the similarity block of these issues is computed
+        as the sparse matrix product of the "matrix" engine (commits x issues) only with the candidate commits, and it is
+        masked to the candidate pairs, so the similarities are the same as the other engines.
+        The dense block has (end - start) x (candidate commits) values, which is smaller than the candidate arrays of a block.
+
+        Arguments:
+        issue_matrix, commit_matrix [scipy.sparse.csr_matrix] -- normalized tfidf vectors of issues and commits
+        start, end [int] -- row indices of the issues of the block
+        pair_issue, pair_commit [np.array<int>] -- candidate pairs of the block
+
+        Returns:
+        score [np.array<float>] -- cosine similarity of each candidate pair
+        """
+        candidate_commit, position = np.unique(pair_commit, return_inverse=True)
+        # the commit rows are not copied if most of them are candidates
+        if 2*len(candidate_commit) > commit_matrix.shape[0]:
+            candidate_commit_matrix, position = commit_matrix, pair_commit
+        else:
+            candidate_commit_matrix = commit_matrix[candidate_commit]
+        block = (candidate_commit_matrix @ issue_matrix[start:end].T).T.toarray()
+        return block[pair_issue - start, position]
+
+    def measure_recall(self, issue_matrix, commit_matrix, issue_idx, commit_idx):
+        """
+        Recall at THRESHOLD_COSINE_SIM on a sample of issues: the found pairs / the pairs >= THRESHOLD_COSINE_SIM
+        (the sampled issues are compared with all commits)
+
+        Arguments:
+        issue_matrix [scipy.sparse.csr_matrix] -- normalized tfidf vectors of issues
+        commit_matrix [scipy.sparse.csr_matrix] -- normalized tfidf vectors of commits
+        issue_idx, commit_idx [np.array<int>] -- found pairs
+
+        Returns:
+        recall_dict [dict<string, value>] -- number of sampled issues, number of their pairs >= THRESHOLD_COSINE_SIM,
+                                            number of them that were found, and the recall (None if there is no such pair)
+        """
+        num_issue, num_commit = issue_matrix.shape[0], commit_matrix.shape[0]
+        sample_issue = np.sort(np.random.default_rng(self.seed).choice(num_issue, size=min(num_issue, self.num_recall_sample), replace=False))
+
+        found_code_set = set((issue_idx*num_commit + commit_idx)[np.isin(issue_idx, sample_issue)].tolist())
+        num_true, num_true_found = 0, 0
+        num_block_row = max(1, int(self.block_memory_mb*1024*1024)//(8*max(1, num_commit)))
+        for start in range(0, len(sample_issue), num_block_row):
+            block_issue = sample_issue[start:start+num_block_row]
+            block = (commit_matrix @ issue_matrix[block_issue].T).T.toarray()
+            row, col = np.nonzero(block >= self.THRESHOLD_COSINE_SIM)
+            true_code_array = block_issue[row].astype(np.int64)*num_commit + col
+            num_true += len(true_code_array)
+            num_true_found += sum(1 for code in true_code_array.tolist() if code in found_code_set)
+
+        return {'num_recall_sample': len(sample_issue), 'num_true_sample': num_true, 'num_found_sample': num_true_found,
+                'recall': num_true_found/num_true if num_true > 0 else None}
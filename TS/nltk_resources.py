@@ -0,0 +1,71 @@
+import importlib.util
+
+# resource name -> path for nltk.find
+RESOURCE_DICT = {
+    'stopwords': 'corpora/stopwords',
+    'wordnet': 'corpora/wordnet',
+    'punkt': 'tokenizers/punkt',
+    'punkt_tab': 'tokenizers/punkt_tab/english/',
+}
+
+# tokenizers whose resources were found in this process
+_checked_tokenizer_set = set()
+
+
+def required_resource_list(tokenizer="nltk"):
+    """
+    Return the NLTK resources used by TS/token_normalizer.py and NtextSimilarity.preprocess_text
+    (word_tokenize needs punkt_tab from NLTK 3.8.2, and punkt before. the "regex" tokenizer does not need them)
+    """
+    if tokenizer=="regex":
+        return ['stopwords', 'wordnet']
+
+    import nltk.tokenize.punkt
+
+    tokenizer_resource = 'punkt_tab' if hasattr(nltk.tokenize.punkt, "PunktTokenizer") else 'punkt'
+    return ['stopwords', 'wordnet', tokenizer_resource]
+
+
+def find_missing_resources(tokenizer="nltk"):
+    """
+    Returns:
+    missing_resource_list [list<string>] -- required resources that are not installed (no network access)
+    """
+    import nltk
+
+    missing_resource_list = []
+    for resource in required_resource_list(tokenizer):
+        try:
+            nltk.find(RESOURCE_DICT[resource])
+        except LookupError:
+            missing_resource_list.append(resource)
+    return missing_resource_list
+
+
+def check_resources(tokenizer="nltk"):
+    """
+    Fail fast if the NLTK resources are not installed. It never downloads them,
+    so it does not block on the network in an offline environment (see download_resources).
+    The check runs once for each process (and tokenizer).
+    """
+    if tokenizer in _checked_tokenizer_set:
+        return
+
+    if importlib.util.find_spec("nltk") is None:
+        raise ImportError("NLTK is not installed: pip install nltk")
+    missing_resource_list = find_missing_resources(tokenizer)
+    if len(missing_resource_list) > 0:
+        raise LookupError("NLTK resources are not installed: {0}. Run `python -m nltk.downloader {1}` "
+                          "(or set NLTK_DATA to the directory of the resources)".format(
+                              ", ".join(missing_resource_list), " ".join(missing_resource_list)))
+    _checked_tokenizer_set.add(tokenizer)
+
+
+def download_resources(tokenizer="nltk"):
+    """
+    Download the missing NLTK resources (this needs the network)
+    """
+    import nltk
+
+    for resource in find_missing_resources(tokenizer):
+        nltk.download(resource)
@@ -1,36 +1,172 @@
+import contextlib
+import itertools
+import json
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from string import punctuation
 
-import nltk
-try:
-    nltk.find('tokenizers/stopwords')
-except LookupError:
-    nltk.download('stopwords')
-try:
-    nltk.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
-try:
-    nltk.find('tokenizers/wordnet')
-except LookupError:
-    nltk.download('wordnet')
-
-from nltk.corpus import stopwords
-from nltk.corpus import wordnet
-from nltk.tokenize import word_tokenize
-from nltk.stem import PorterStemmer
-
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
 
 from Utils import util
 
+# NLTK, sklearn, and scipy are imported when they are used first (TS/nltk_resources.py checks the NLTK resources),
+# so that importing this module (and GS, MT, and PU) is fast and never needs the network
+from TS import incremental_tfidf
+from TS import similarity_store
+from TS import tfidf_artifact
+from TS import token_normalizer
+
+
+# NtextSimilarity object for the preprocessing in a worker process (see preprocess_text_list)
+_worker_ntext_similarity_obj = None
+
+def _init_preprocess_worker(token_cache_size, lexicon_path, tokenizer):
+    global _worker_ntext_similarity_obj
+    _worker_ntext_similarity_obj = NtextSimilarity(token_cache_size=token_cache_size, lexicon_path=lexicon_path, tokenizer=tokenizer)
+    _worker_ntext_similarity_obj.get_token_normalizer() # load the NLTK resources once for each worker
+
+def _preprocess_chunk(text_list):
+    processed_text_list = [_worker_ntext_similarity_obj.preprocess_text(text) for text in text_list]
+    _worker_ntext_similarity_obj.get_token_normalizer().flush()
+    return processed_text_list
+
+
+def dedup_texts(text_list):
+    """
+    Map identical texts to one entry (by the hash and the content of each text)
+
+    Arguments:
+    text_list [list<string>] -- texts
+
+    Returns:
+    unique_text_list [list<string>] -- distinct texts in the order of their first appearance
+    index_array [np.array<int>] -- index in unique_text_list of each text in text_list
+    """
+    index_dict = {}
+    index_array = np.fromiter((index_dict.setdefault(text, len(index_dict)) for text in text_list), dtype=np.intp, count=len(text_list))
+    return list(index_dict), index_array
+
+
+def get_cosine_similarity_path(output_dir, parallel_iteration):
+    return "{0}/cosine_similarity_dict_ite{1}.pickle".format(output_dir, parallel_iteration)
+
+
+def get_cosine_similarity_meta_path(output_dir, parallel_iteration):
+    return "{0}/cosine_similarity_dict_ite{1}.meta.json".format(output_dir, parallel_iteration)
+
+
+def has_all_scores(output_dir, parallel_iteration):
+    """
+    Return True if the cosine similarity pickle file of parallel_iteration has the similarities of all pairs
+    (neither min_score nor top_k was used, see NtextSimilarity.dump_cosine_similarity_pickle).
+    The pickle files without the meta file were written by the engines that keep all pairs.
+    """
+    meta_path = get_cosine_similarity_meta_path(output_dir, parallel_iteration)
+    if not os.path.exists(meta_path):
+        return True
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return meta['min_score']==0 and meta['top_k'] is None
+
 
 class NtextSimilarity:
-    def __init__(self, THRESHOLD_COSINE_SIM=0.3, verbose=0, parallel_iteration=0):
+    def __init__(self, THRESHOLD_COSINE_SIM=0.3, verbose=0, parallel_iteration=0, engine="matrix", block_memory_mb=256, similarity_store=0,
+                 token_cache_size=100000, lexicon_path=None, n_jobs=1, preprocess_chunk_size=1000, tfidf_artifact_dir=None, top_k=None,
+                 vectorizer="tfidf", n_hash_features=2**20, tokenizer="nltk", incremental_model_dir=None, incremental_keep_scores=0,
+                 lsh_family="simhash", lsh_num_bands=None, lsh_band_size=None, lsh_target_recall=0.95, lsh_seed=0, lsh_recall_sample=200,
+                 lsh_min_recall=0.9, lsh_max_candidate_ratio=0.5, lsh_low_recall="fail"):
+        """
+        THRESHOLD_COSINE_SIM [float] -- cosine similarity threshold
+        engine [string] -- "matrix": compute the similarities of all pairs as sparse matrix products (compare_ntext_matrix)
+                           "apss": compute only the pairs whose similarity is >= THRESHOLD_COSINE_SIM (compare_ntext_apss)
+                           "pairwise": call cosine_similarity for each pair of an issue and a commit
+                           "lsh": compute only the pairs that collide in the LSH buckets (compare_ntext_lsh, approximate)
+        block_memory_mb [int] -- memory budget (MB) for a block of the similarity matrix in the "matrix" engine
+        similarity_store [int] -- if it is not zero, the similarities are written in {{ output_dir }}/similarity_store
+                                  (shard {{ parallel_iteration }} of TS/similarity_store.py) instead of the pickle file
+        token_cache_size [int] -- size of the LRU cache of the normalized tokens in preprocess_text
+        lexicon_path [string] -- path to the on-disk lexicon of the normalized tokens (sqlite3), which can be shared by runs.
+                                 if None, we do not use the lexicon
+        n_jobs [int] -- number of processes for the preprocessing in make_corpus_and_input (0: number of CPUs)
+        preprocess_chunk_size [int] -- number of texts sent to a process at once
+        tfidf_artifact_dir [string] -- path to the TF-IDF artifact (TS/tfidf_artifact.py). if it is given, compare_ntext loads
+                                       the artifact (or fits and saves it if it does not exist) instead of fitting TfidfVectorizer
+        top_k [int] -- if it is given, only the top_k commits (with the highest similarities >= THRESHOLD_COSINE_SIM) are kept
+                       for each issue (compare_ntext_top_k). the "matrix" and "apss" engines support it
+        vectorizer [string] -- "tfidf": fit TfidfVectorizer on the whole corpus
+                               "hashing": stream the texts in two passes with HashingVectorizer (compare_ntext_streaming), which does not keep the corpus.
+                                          it needs similarity_store or top_k
+        n_hash_features [int] -- number of features of HashingVectorizer (the "hashing" vectorizer)
+        tokenizer [string] -- "nltk": nltk.word_tokenize
+                              "regex": one compiled regex pass that also drops punctuation (TS/regex_tokenizer.py). it is faster,
+                                       but some tokens differ from nltk.word_tokenize (see regex_tokenizer.equivalence_report)
+        incremental_model_dir [string] -- path to the incremental TF-IDF models (TS/incremental_tfidf.py). if it is given, compare_ntext
+                                          updates the model with the new issues and commits instead of refitting it, and scores the target
+                                          issues with the updated model (compare_ntext_incremental, the same as a full refit)
+        incremental_keep_scores [int] -- if it is not zero, the incremental mode only scores the pairs with the new issues and commits,
+                                         and keeps the similarities of the other pairs from the previous output. they were computed
+                                         with the previous idf, so the output is NOT the same as a full refit
+        lsh_family [string] -- LSH family of the "lsh" engine: "simhash" (random hyperplanes) or "minhash" (token sets) (TS/lsh_similarity.py)
+        lsh_num_bands [int] -- number of bands of the "lsh" engine (None: chosen from THRESHOLD_COSINE_SIM and lsh_target_recall for simhash; minhash needs it)
+        lsh_band_size [int] -- number of hash values in a band of the "lsh" engine (None: chosen in the same way)
+        lsh_target_recall [float] -- expected recall at THRESHOLD_COSINE_SIM of the chosen simhash bands
+        lsh_seed [int] -- seed of the "lsh" engine
+        lsh_recall_sample [int] -- number of issues whose recall is measured in the "lsh" engine
+        lsh_min_recall [float] -- floor of the measured recall of the "lsh" engine (None: no check)
+        lsh_max_candidate_ratio [float] -- ceiling of the candidates / all pairs of the "lsh" engine (expected for simhash before the search,
+                                           measured after it). above it, the "lsh" engine is slower than the exact engines (None: no check)
+        lsh_low_recall [string] -- "fail": stop with an error if the measured recall is below lsh_min_recall (after the report is written),
+                                           or if the candidate ratio is above lsh_max_candidate_ratio
+                                   "warn": print a warning
+        """
         self.THRESHOLD_COSINE_SIM = THRESHOLD_COSINE_SIM # NEED TO OPTIMIZE
         self.verbose = verbose
         self.parallel_iteration = parallel_iteration
 
+        assert engine in ("matrix", "apss", "pairwise", "lsh"), "Illegal engine: {0}".format(engine)
+        self.engine = engine
+        assert top_k is None or (top_k > 0 and engine in ("matrix", "apss")), "Illegal top_k: {0} (engine: {1})".format(top_k, engine)
+        self.top_k = top_k
+        # a pair that shares no term has the similarity 0, which the "matrix" and "pairwise" engines link at the threshold 0
+        assert THRESHOLD_COSINE_SIM > 0 or not engine in ("apss", "lsh") or not top_k is None, \
+            "The {0} engine needs a positive THRESHOLD_COSINE_SIM (use the matrix engine)".format(engine)
+
+        assert vectorizer in ("tfidf", "hashing"), "Illegal vectorizer: {0}".format(vectorizer)
+        assert vectorizer=="tfidf" or (engine=="matrix" and tfidf_artifact_dir is None), "The hashing vectorizer only supports the matrix engine without the TF-IDF artifact"
+        # the cosine similarity pickle file has the similarities of all pairs in memory
+        assert vectorizer=="tfidf" or similarity_store!=0 or not top_k is None, "The hashing vectorizer needs similarity_store or top_k"
+        self.vectorizer = vectorizer
+        self.n_hash_features = n_hash_features
+        self.block_memory_mb = block_memory_mb
+        self.similarity_store = similarity_store
+
+        self.token_cache_size = token_cache_size
+        self.lexicon_path = lexicon_path
+        self.token_normalizer = None
+        assert tokenizer in ("nltk", "regex"), "Illegal tokenizer: {0}".format(tokenizer)
+        self.tokenizer = tokenizer
+
+        self.n_jobs = n_jobs
+        self.preprocess_chunk_size = preprocess_chunk_size
+        self.tfidf_artifact_dir = tfidf_artifact_dir
+
+        assert incremental_model_dir is None or (engine=="matrix" and vectorizer=="tfidf" and tfidf_artifact_dir is None and top_k is None and similarity_store==0), \
+            "The incremental model only supports the matrix engine with the tfidf vectorizer (without the TF-IDF artifact, top_k, and the similarity store)"
+        self.incremental_model_dir = incremental_model_dir
+        self.incremental_keep_scores = incremental_keep_scores
+
+        self.lsh_family = lsh_family
+        self.lsh_num_bands = lsh_num_bands
+        self.lsh_band_size = lsh_band_size
+        self.lsh_seed = lsh_seed
+        self.lsh_recall_sample = lsh_recall_sample
+        self.lsh_target_recall = lsh_target_recall
+        self.lsh_min_recall = lsh_min_recall
+        self.lsh_max_candidate_ratio = lsh_max_candidate_ratio
+        assert lsh_low_recall in ("fail", "warn"), "Illegal lsh_low_recall: {0}".format(lsh_low_recall)
+        self.lsh_low_recall = lsh_low_recall
 
     def remove_punctuation(self, word_tokens):
         return [word for word in word_tokens if not word in punctuation]
@@ -51,33 +187,20 @@ class NtextSimilarity:
         Returns:
         return token text [a string] -- proprocessed input text into one string separated by " "
         """
-        stop_words = set(stopwords.words("english"))
-        ps = PorterStemmer()
-
+        token_normalizer_obj = self.get_token_normalizer()
         text = text.lower()
-        word_tokens = word_tokenize(text) # tokenization
-        word_tokens = self.remove_punctuation(word_tokens) # remove punctuation
-        filtered_word_tokens = [word for word in word_tokens if not word in stop_words] # filtering out stop words
-        synonym_word_tokens = []
-        for word in filtered_word_tokens:
-            syns = wordnet.synsets(word)
-            if len(syns)==0:
-                synonym_word_tokens.append(word) # if no synonymous, not replace
-            else:
-                synonym_word_tokens.append(syns[0].lemmas()[0].name()) # if there exist synonymous, use the first one
-        assert len(synonym_word_tokens)==len(filtered_word_tokens), "Invalid synonym processing"
-        stemmed_word_tokens = [ps.stem(word) for word in synonym_word_tokens]
-
-        #print("=== org ===")
-        #print(word_tokens)
-        #print("=== filtering out stop words ===")
-        #print(filtered_word_tokens)
-        #print("=== replace sysnonym ===")
-        #print(synonym_word_tokens)
-        #print("=== stemming ===")
-        #print(stemmed_word_tokens)
+        word_tokens = token_normalizer_obj.word_tokenize(text) # tokenization
+        # remove punctuation, filter out stop words, replace synonyms, and stem (see TS/token_normalizer.py)
+        stemmed_word_tokens = token_normalizer_obj.normalize_tokens(word_tokens)
+
         return " ".join(stemmed_word_tokens)
 
+    def get_token_normalizer(self):
+        if self.token_normalizer is None:
+            self.token_normalizer = token_normalizer.TokenNormalizer(max_cache_size=self.token_cache_size, lexicon_path=self.lexicon_path,
+                                                                       tokenizer=self.tokenizer)
+        return self.token_normalizer
+
     def make_corpus_and_input(self, dsc_issue_dict, comment_issue_dict, log_msg_repo_dict, hash_list, issue_id_list):
         """
         dsc_issue_dict [dict<issue id, description] -- description for each issue
@@ -92,36 +215,142 @@ class NtextSimilarity:
         processed_comment_issue_dict [dict<issue id, comments (a string)] -- a string of preprocessed comments for each issue id
         processed_log_msg_repo_dict [dict<commit hash, log message] -- preprocessed log message for each commit
         """
-        corpus = []
+        # raw texts in the order of corpus (None: empty text)
+        raw_text_list = []
+        for issue_id in issue_id_list:
+            raw_text_list.append(dsc_issue_dict.get(issue_id))
+            raw_text_list.append(comment_issue_dict.get(issue_id))
+        for commit_hash in hash_list:
+            raw_text_list.append(log_msg_repo_dict[commit_hash])
+
+        # each distinct text is preprocessed once (e.g., "Merge branch" commits and the same comments)
+        unique_text_list, index_array = dedup_texts([text for text in raw_text_list if not text is None])
+        if self.verbose > 0:
+            print("{0} -- preprocess {1} distinct texts of {2}".format(self.parallel_iteration, len(unique_text_list), len(index_array)))
+        processed_text_list = self.preprocess_text_list(unique_text_list)
+        processed_text_iter = (processed_text_list[idx] for idx in index_array)
+        corpus = ["" if text is None else next(processed_text_iter) for text in raw_text_list]
+
         processed_dsc_issue_dict = {}
         processed_comment_issue_dict = {}
         processed_log_msg_repo_dict = {}
-        for issue_id in issue_id_list:
-            if not issue_id in dsc_issue_dict:
-                processed_dsc_issue_dict[issue_id] = ""
-            elif dsc_issue_dict[issue_id] is None:
-                processed_dsc_issue_dict[issue_id] = ""
-            else:
-                processed_dsc_issue_dict[issue_id] = self.preprocess_text(dsc_issue_dict[issue_id])
+        for idx_issue_id, issue_id in enumerate(issue_id_list):
+            processed_dsc_issue_dict[issue_id] = corpus[2*idx_issue_id]
+            processed_comment_issue_dict[issue_id] = corpus[2*idx_issue_id+1]
+        offset = 2*len(issue_id_list)
+        for idx_commit_hash, commit_hash in enumerate(hash_list):
+            processed_log_msg_repo_dict[commit_hash] = corpus[offset+idx_commit_hash]
 
-            if not issue_id in comment_issue_dict:
-                processed_comment_issue_dict[issue_id] = ""
-            elif comment_issue_dict[issue_id] is None:
-                processed_comment_issue_dict[issue_id] = ""
-            else:
-                processed_comment_issue_dict[issue_id] = self.preprocess_text(comment_issue_dict[issue_id])
+        return corpus, processed_dsc_issue_dict, processed_comment_issue_dict, processed_log_msg_repo_dict
 
-            corpus.append(processed_dsc_issue_dict[issue_id])
-            corpus.append(processed_comment_issue_dict[issue_id])
-        for commit_hash in hash_list:
-            if log_msg_repo_dict[commit_hash] is None:
-                processed_log_msg_repo_dict[commit_hash] = ""
-            else:
-                processed_log_msg_repo_dict[commit_hash] = self.preprocess_text(log_msg_repo_dict[commit_hash])
+    def vectorize_corpus(self, dsc_issue_dict, comment_issue_dict, log_msg_repo_dict, hash_list, issue_id_list, target_issue_id_list):
+        """
+        Fit TfidfVectorizer on the corpus of make_corpus_and_input, and transform the commits and the target issues
+        (description + " " + comments). The result is the same as fitting TfidfVectorizer on the corpus and transforming
+        the texts, but each distinct preprocessed text is counted once:
+        - the document frequency of a term is the sum of the multiplicities of the distinct texts with the term,
+          and the idf is computed in the same way as sklearn (smooth_idf) with the number of all texts
+        - the tfidf vector of a commit is the vector of its distinct text
+        - the term counts of an issue are the sum of the counts of its description and comments
+          (the tokens of TfidfVectorizer never include the space between them)
 
-            corpus.append(processed_log_msg_repo_dict[commit_hash])
+        Arguments:
+        dsc_issue_dict [dict<issue id, description] -- description for each issue
+        comment_issue_dict [dict<issue id, comments (a string)] -- a string of comments for each issue id
+        log_msg_repo_dict [dict<commit hash, log message] -- log message for each commit
+        hash_list [list<commit hash>] -- studied commit hash list
+        issue_id_list [list<issue id>] -- studied issue id list
+        target_issue_id_list [list<issue id>] -- issue ids of the rows of issue_matrix (they must be in issue_id_list)
 
-        return corpus, processed_dsc_issue_dict, processed_comment_issue_dict, processed_log_msg_repo_dict
+        Returns:
+        vocabulary [np.array<str>] -- terms (the column order of the matrices)
+        idf [np.array<float>] -- idf of each term
+        commit_matrix [scipy.sparse.csr_matrix] -- tfidf vectors of the commits (in the order of hash_list)
+        issue_matrix [scipy.sparse.csr_matrix] -- tfidf vectors of the target issues (in the order of target_issue_id_list)
+        """
+        import scipy.sparse
+        from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
+
+        corpus, _, _, _ = self.make_corpus_and_input(dsc_issue_dict, comment_issue_dict, log_msg_repo_dict, hash_list, issue_id_list)
+        unique_corpus, corpus_index_array = dedup_texts(corpus)
+        if self.verbose > 0:
+            print("{0} -- vectorize {1} distinct texts of {2}".format(self.parallel_iteration, len(unique_corpus), len(corpus)))
+
+        count_vectorizer = CountVectorizer(dtype=np.float64)
+        count_matrix = scipy.sparse.csr_matrix(count_vectorizer.fit_transform(unique_corpus))
+        count_matrix.sort_indices() # the same order of terms as TfidfVectorizer.transform (the norms are summed in this order)
+
+        multiplicity_array = np.bincount(corpus_index_array, minlength=len(unique_corpus))
+        df = np.bincount(count_matrix.indices, weights=np.repeat(multiplicity_array, np.diff(count_matrix.indptr)).astype(np.float64),
+                         minlength=count_matrix.shape[1])
+        # same as TfidfTransformer.fit (smooth_idf=True)
+        idf = np.full_like(df, fill_value=len(corpus)+1, dtype=np.float64)
+        idf /= df + 1.0
+        np.log(idf, out=idf)
+        idf += 1.0
+
+        tfidf_transformer = TfidfTransformer()
+        tfidf_transformer.idf_ = idf
+
+        # corpus: the description and comments of each issue in issue_id_list, and the commits
+        commit_matrix = scipy.sparse.csr_matrix(tfidf_transformer.transform(count_matrix))[corpus_index_array[2*len(issue_id_list):]]
+
+        issue_idx_dict = {issue_id: idx for idx, issue_id in enumerate(issue_id_list)}
+        row_list, col_list = [], []
+        for row, issue_id in enumerate(target_issue_id_list):
+            row_list.extend((row, row))
+            col_list.extend(corpus_index_array[2*issue_idx_dict[issue_id]:2*issue_idx_dict[issue_id]+2])
+        # sum of the rows of the description and comments (the duplicates of coo_matrix are summed)
+        issue_selector = scipy.sparse.coo_matrix((np.ones(len(row_list)), (row_list, col_list)),
+                                                 shape=(len(target_issue_id_list), len(unique_corpus))).tocsr()
+        issue_count_matrix = scipy.sparse.csr_matrix(issue_selector @ count_matrix)
+        issue_count_matrix.sort_indices()
+        issue_matrix = scipy.sparse.csr_matrix(tfidf_transformer.transform(issue_count_matrix))
+
+        return count_vectorizer.get_feature_names_out(), idf, commit_matrix, issue_matrix
+
+    def make_preprocess_executor(self):
+        """
+        Return a process pool for preprocess_text_list (None if n_jobs is 1).
+        Each process loads the NLTK resources once (_init_preprocess_worker), so a pool can be used for many calls.
+        """
+        n_jobs = self.n_jobs if self.n_jobs > 0 else os.cpu_count()
+        if n_jobs==1:
+            return None
+        return ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_preprocess_worker,
+                                   initargs=(self.token_cache_size, self.lexicon_path, self.tokenizer))
+
+    def preprocess_text_list(self, text_list, executor=None):
+        """
+        Preprocess texts (preprocess_text) serially, or in a process pool if n_jobs is not 1.
+        The texts are split into chunks of preprocess_chunk_size texts, and the results keep the order of text_list.
+
+        Arguments:
+        text_list [list<string>] -- texts that we want to preprocess
+        executor [ProcessPoolExecutor] -- process pool of make_preprocess_executor (if None, a pool is made for this call)
+
+        Returns:
+        processed_text_list [list<string>] -- preprocessed texts (the same order with text_list)
+        """
+        n_jobs = self.n_jobs if self.n_jobs > 0 else os.cpu_count()
+        if n_jobs==1 or len(text_list) <= self.preprocess_chunk_size:
+            processed_text_list = [self.preprocess_text(text) for text in text_list]
+            if not self.token_normalizer is None:
+                self.token_normalizer.flush()
+            return processed_text_list
+
+        if executor is None:
+            with self.make_preprocess_executor() as executor:
+                return self.preprocess_text_list(text_list, executor=executor)
+
+        chunk_list = [text_list[start:start+self.preprocess_chunk_size] for start in range(0, len(text_list), self.preprocess_chunk_size)]
+        if self.verbose > 0:
+            print("{0} -- preprocess {1} texts ({2} chunks, {3} processes)".format(self.parallel_iteration, len(text_list), len(chunk_list), n_jobs))
+
+        processed_text_list = []
+        for processed_chunk in executor.map(_preprocess_chunk, chunk_list):
+            processed_text_list.extend(processed_chunk)
+        return processed_text_list
 
     def compare_ntext(self, dsc_issue_dict, comment_issue_dict, log_msg_repo_dict, hash_list, issue_id_list, target_issue_id_list, output_dir):
         """
@@ -132,6 +361,8 @@ class NtextSimilarity:
         dsc_issue_dict [dict<issue id, description] -- description for each issue
         comment_issue_dict [dict<issue id, comments (a string)] -- a string of comments for each issue id
         log_msg_repo_dict [dict<commit hash, log message] -- log message for each commit (already replaced: issue ids to ISSUE_ID)
+                                                            (with the "hashing" vectorizer, it can also be a function that returns
+                                                            an iterator of the log messages in the order of hash_list)
         hash_list [list<commit hash>] -- studied commit hash list
         issue_id_list [list<issue id>] -- studied issue id list
         target_issue_id_list [list<issue id>] -- studied issue id list for parallel execution
@@ -143,14 +374,40 @@ class NtextSimilarity:
 
         #print(preprocess_text(dsc_issue_dict['HADOOP-12']))
         #sys.exit()
-        corpus, processed_dsc_issue_dict, processed_comment_issue_dict, processed_log_msg_repo_dict = self.make_corpus_and_input(dsc_issue_dict, comment_issue_dict, log_msg_repo_dict, hash_list, issue_id_list)
-
-        vectorizer = TfidfVectorizer()
-        vectorizer.fit(corpus)
+        if not self.incremental_model_dir is None:
+            return self.compare_ntext_incremental(dsc_issue_dict, comment_issue_dict, log_msg_repo_dict, hash_list, issue_id_list, target_issue_id_list, output_dir)
+        if self.vectorizer=="hashing":
+            return self.compare_ntext_streaming(dsc_issue_dict, comment_issue_dict, log_msg_repo_dict, hash_list, issue_id_list, target_issue_id_list, output_dir)
+
+        if self.tfidf_artifact_dir is None:
+            _, _, commit_matrix, issue_matrix = self.vectorize_corpus(dsc_issue_dict, comment_issue_dict, log_msg_repo_dict,
+                                                                      hash_list, issue_id_list, target_issue_id_list)
+        else:
+            artifact = tfidf_artifact.TfidfArtifact.load_or_fit(self.tfidf_artifact_dir, self, dsc_issue_dict, comment_issue_dict,
+                                                                log_msg_repo_dict, hash_list, issue_id_list)
+            commit_matrix = artifact.get_commit_matrix(hash_list)
+            issue_matrix = artifact.get_issue_matrix(target_issue_id_list)
+
+        # the artifact keeps the normalized commit matrix (in shared memory with ShardRunner(shared_memory=1))
+        normalized_commit_matrix = None if self.tfidf_artifact_dir is None or self.engine=="pairwise" else artifact.get_normalized_commit_matrix(hash_list)
+        if not self.top_k is None:
+            return self.compare_ntext_top_k(issue_matrix, commit_matrix, hash_list, target_issue_id_list, output_dir,
+                                            normalized_commit_matrix=normalized_commit_matrix)
+        elif self.engine=="apss":
+            return self.compare_ntext_apss(issue_matrix, commit_matrix, hash_list, target_issue_id_list, output_dir,
+                                           normalized_commit_matrix=normalized_commit_matrix)
+        elif self.engine=="lsh":
+            return self.compare_ntext_lsh(issue_matrix, commit_matrix, hash_list, target_issue_id_list, output_dir,
+                                          normalized_commit_matrix=normalized_commit_matrix)
+        elif self.engine=="matrix":
+            return self.compare_ntext_matrix(issue_matrix, commit_matrix, hash_list, target_issue_id_list, output_dir,
+                                             normalized_commit_matrix=normalized_commit_matrix)
+
+        from sklearn.metrics.pairwise import cosine_similarity
 
         log_msg_vec_dict = {}
-        for commit_hash in hash_list:
-            log_msg_vec_dict[commit_hash] = vectorizer.transform([processed_log_msg_repo_dict[commit_hash]])
+        for idx_commit_hash, commit_hash in enumerate(hash_list):
+            log_msg_vec_dict[commit_hash] = commit_matrix[idx_commit_hash]
 
         num_issue_id_list = len(target_issue_id_list)
         return_dict = {}
@@ -160,7 +417,7 @@ class NtextSimilarity:
             if self.verbose > 0:
                 if idx_issue_id%80==0:
                     print("{0} -- Done issue id: {1}/{2}".format(self.parallel_iteration, idx_issue_id, num_issue_id_list))
-            issue_text_vec = vectorizer.transform([processed_dsc_issue_dict[issue_id] + " " + processed_comment_issue_dict[issue_id]])
+            issue_text_vec = issue_matrix[idx_issue_id]
             for commit_hash in hash_list:
                 cosine_sim = cosine_similarity(issue_text_vec, log_msg_vec_dict[commit_hash])[0,0]
                 cosine_similarity_dict[issue_id][commit_hash] = cosine_sim
@@ -169,10 +426,549 @@ class NtextSimilarity:
                         return_dict[issue_id] = []
                     return_dict[issue_id].append(commit_hash)
 
-        util.dump_pickle("{0}/cosine_similarity_dict_ite{1}.pickle".format(output_dir, self.parallel_iteration), cosine_similarity_dict)
+        self.dump_cosine_similarity_dict(output_dir, cosine_similarity_dict, hash_list)
 
         return return_dict
 
+    def dump_cosine_similarity_pickle(self, output_dir, cosine_similarity_dict, min_score=0.0, top_k=None):
+        """
+        Store cosine_similarity_dict [dict<issue id, dict<commit hash, cosine similarity>>] as a pickle file
+        with a meta file (cosine_similarity_dict_ite{{ parallel_iteration }}.meta.json, the same as the meta.json of a store shard):
+        min_score -- the pairs whose similarity is below min_score are not stored (0 if all pairs are stored)
+        top_k -- only the top_k pairs are stored for each issue (None if all pairs are stored)
+        The meta file of a partial pickle file is written before it, and that of a complete one after it,
+        so that an interrupted run never leaves a partial pickle file with the meta file of a complete one.
+        """
+        def _dump_meta():
+            with open(get_cosine_similarity_meta_path(output_dir, self.parallel_iteration), "w") as f:
+                json.dump({'min_score': float(min_score), 'top_k': top_k}, f)
+
+        is_partial = min_score!=0 or not top_k is None
+        if is_partial:
+            _dump_meta()
+        util.dump_pickle(get_cosine_similarity_path(output_dir, self.parallel_iteration), cosine_similarity_dict)
+        if not is_partial:
+            _dump_meta()
+
+    def dump_cosine_similarity_dict(self, output_dir, cosine_similarity_dict, hash_list):
+        """
+        Store cosine_similarity_dict [dict<issue id, dict<commit hash, cosine similarity>>]
+        as a pickle file or in the similarity store
+        """
+        if self.similarity_store==0:
+            self.dump_cosine_similarity_pickle(output_dir, cosine_similarity_dict)
+            return
+
+        issue_id_list = list(cosine_similarity_dict.keys())
+        commit_index_dict = {commit_hash: idx for idx, commit_hash in enumerate(hash_list)}
+        issue_idx, commit_idx, score = [], [], []
+        for idx_issue_id, issue_id in enumerate(issue_id_list):
+            for commit_hash, cosine_sim in cosine_similarity_dict[issue_id].items():
+                issue_idx.append(idx_issue_id)
+                commit_idx.append(commit_index_dict[commit_hash])
+                score.append(cosine_sim)
+        similarity_store.SimilarityStore.write_shard(similarity_store.get_store_dir(output_dir), self.parallel_iteration,
+                                                     issue_id_list, hash_list, issue_idx, commit_idx, score)
+
+    def iter_similarity_blocks(self, issue_matrix, commit_matrix, normalized_commit_matrix=None):
+        """
+        Compute the cosine similarity matrix (issues x commits) block by block.
+        The number of issue rows in a block is decided so that a dense block fits in block_memory_mb.
+
+        Arguments:
+        issue_matrix [scipy.sparse.csr_matrix] -- tfidf vectors of issues (one row for each issue)
+        commit_matrix [scipy.sparse.csr_matrix] -- tfidf vectors of commits (one row for each commit)
+        normalized_commit_matrix [scipy.sparse.csr_matrix] -- L2-normalized commit_matrix if it is already computed (e.g., shared memory)
+
+        Returns:
+        (yield) start [int] -- row index of the first issue in this block
+        (yield) block [np.array<np.array<float>>] -- cosine similarity between the issues in this block and all commits
+        """
+        from sklearn.preprocessing import normalize
+
+        # same normalization with sklearn's cosine_similarity
+        issue_matrix = normalize(issue_matrix, copy=True)
+        if normalized_commit_matrix is None:
+            normalized_commit_matrix = normalize(commit_matrix, copy=True)
+
+        num_issue = issue_matrix.shape[0]
+        num_block_row = max(1, int(self.block_memory_mb*1024*1024)//(8*max(1, commit_matrix.shape[0])))
+        for start in range(0, num_issue, num_block_row):
+            if self.verbose > 0:
+                print("{0} -- Done issue id: {1}/{2}".format(self.parallel_iteration, start, num_issue))
+            # commits x issues: the commit matrix is not converted (copied) for each block
+            yield start, (normalized_commit_matrix @ issue_matrix[start:start+num_block_row].T).T.toarray()
+
+    def compare_ntext_matrix(self, issue_matrix, commit_matrix, hash_list, target_issue_id_list, output_dir, normalized_commit_matrix=None):
+        """
+        Same as compare_ntext with the "pairwise" engine, but the similarities of all pairs are
+        computed as sparse matrix products in row blocks.
+        Only the pairs >= THRESHOLD_COSINE_SIM are returned, but the cosine similarity pickle file keeps the similarities
+        of all pairs (and the similarity store all non-zero ones), because PU looks up the similarities of its candidate pairs
+        (use the "apss" engine or top_k to keep only the pairs >= THRESHOLD_COSINE_SIM).
+
+        Arguments:
+        issue_matrix [scipy.sparse.csr_matrix] -- tfidf vectors of the target issues (description + " " + comments)
+        commit_matrix [scipy.sparse.csr_matrix] -- tfidf vectors of the commits
+        hash_list [list<commit hash>] -- studied commit hash list
+        target_issue_id_list [list<issue id>] -- studied issue id list for parallel execution
+        output_dir [string] -- path to a directory to store the text similarity values as pickle files
+        normalized_commit_matrix [scipy.sparse.csr_matrix] -- L2-normalized commit_matrix (computed if None)
+
+        Returns:
+        return_dict [dict<issue id, list<commit hash>>] -- issue id to list of commit hashes. these commit hashes are the similar text
+        """
+        return_dict = {}
+        cosine_similarity_dict = {}
+        issue_idx_list, commit_idx_list, score_list = [], [], []
+        for start, block in self.iter_similarity_blocks(issue_matrix, commit_matrix, normalized_commit_matrix=normalized_commit_matrix):
+            if self.similarity_store!=0:
+                row, col = np.nonzero(block)
+                issue_idx_list.append(start + row)
+                commit_idx_list.append(col)
+                score_list.append(block[row, col])
+            for issue_id, row in zip(target_issue_id_list[start:start+block.shape[0]], block):
+                if self.similarity_store==0:
+                    cosine_similarity_dict[issue_id] = dict(zip(hash_list, row.tolist()))
+                similar_idx = np.flatnonzero(row >= self.THRESHOLD_COSINE_SIM)
+                if len(similar_idx)==0:
+                    continue
+                if not issue_id in return_dict:
+                    return_dict[issue_id] = []
+                return_dict[issue_id].extend([hash_list[idx] for idx in similar_idx])
+
+        if self.similarity_store==0:
+            self.dump_cosine_similarity_pickle(output_dir, cosine_similarity_dict)
+        else:
+            similarity_store.SimilarityStore.write_shard(similarity_store.get_store_dir(output_dir), self.parallel_iteration,
+                                                         target_issue_id_list, hash_list,
+                                                         np.concatenate(issue_idx_list) if issue_idx_list else [],
+                                                         np.concatenate(commit_idx_list) if commit_idx_list else [],
+                                                         np.concatenate(score_list) if score_list else [])
+
+        return return_dict
+
+    def compare_ntext_incremental(self, dsc_issue_dict, comment_issue_dict, log_msg_repo_dict, hash_list, issue_id_list, target_issue_id_list, output_dir):
+        """
+        Same as compare_ntext with the "matrix" engine, but the TF-IDF model ({{ incremental_model_dir }}/ite{{ parallel_iteration }},
+        TS/incremental_tfidf.py) is updated with the new (or changed) issues and commits instead of being refitted.
+        Only the new texts are preprocessed, and all pairs of the target issues are scored from the term counts of the model,
+        so the output is the same as a full refit (the idf of every term changes with the number of texts).
+
+        With incremental_keep_scores, only these pairs are scored:
+        - the new (or changed) target issues, and the target issues that are not in the previous output, x all commits
+        - the other target issues (e.g., the open issues) x the new commits
+        The similarities of the other pairs are kept from the previous output ({{ output_dir }}/cosine_similarity_dict_ite{{ parallel_iteration }}.pickle).
+        They were computed with the previous idf, so they drift from a full refit as the corpus grows.
+
+        Arguments:
+        (the same as compare_ntext) hash_list and issue_id_list are all studied commits and issues, and they must be unique
+
+        Returns:
+        return_dict [dict<issue id, list<commit hash>>] -- issue id to list of commit hashes (all pairs of the target issues)
+        """
+        model_dir = os.path.join(self.incremental_model_dir, "ite{0}".format(self.parallel_iteration))
+        cosine_similarity_path = get_cosine_similarity_path(output_dir, self.parallel_iteration)
+        model = incremental_tfidf.IncrementalTfidfModel.load_or_empty(model_dir, self.tokenizer)
+        previous_cosine_similarity_dict = {}
+        if self.incremental_keep_scores!=0 and len(model.hash_list) > 0 and os.path.exists(cosine_similarity_path):
+            previous_cosine_similarity_dict = util.load_pickle(cosine_similarity_path)
+
+        new_hash_list, updated_issue_id_list = model.update(self, dsc_issue_dict, comment_issue_dict, log_msg_repo_dict, hash_list, issue_id_list)
+        new_hash_set = set(new_hash_list)
+        updated_issue_id_set = set(updated_issue_id_list)
+
+        # an issue is scored with all commits if its previous similarities are not exactly for the kept commits
+        num_kept_commit = len(hash_list) - len(new_hash_list)
+        target_issue_id_list = list(dict.fromkeys(target_issue_id_list))
+        full_issue_id_list = [issue_id for issue_id in target_issue_id_list
+                              if self.incremental_keep_scores==0 or issue_id in updated_issue_id_set
+                              or len(previous_cosine_similarity_dict.get(issue_id, ()))!=num_kept_commit]
+        full_issue_id_set = set(full_issue_id_list)
+        partial_issue_id_list = [issue_id for issue_id in target_issue_id_list if not issue_id in full_issue_id_set]
+        if self.verbose > 0:
+            print("{0} -- incremental: {1} new commits, {2} issues x all commits, {3} issues x new commits".format(
+                self.parallel_iteration, len(new_hash_list), len(full_issue_id_list), len(partial_issue_id_list)))
+
+        cosine_similarity_dict = {}
+        if len(full_issue_id_list) > 0:
+            for start, block in self.iter_similarity_blocks(model.get_issue_matrix(full_issue_id_list), model.get_commit_matrix(hash_list)):
+                for issue_id, row in zip(full_issue_id_list[start:start+block.shape[0]], block):
+                    cosine_similarity_dict[issue_id] = dict(zip(hash_list, row.tolist()))
+
+        new_cosine_similarity_dict = {}
+        if len(partial_issue_id_list) > 0 and len(new_hash_list) > 0:
+            for start, block in self.iter_similarity_blocks(model.get_issue_matrix(partial_issue_id_list), model.get_commit_matrix(new_hash_list)):
+                for issue_id, row in zip(partial_issue_id_list[start:start+block.shape[0]], block):
+                    new_cosine_similarity_dict[issue_id] = dict(zip(new_hash_list, row.tolist()))
+        for issue_id in partial_issue_id_list:
+            score_dict = new_cosine_similarity_dict.get(issue_id, {})
+            previous_score_dict = previous_cosine_similarity_dict[issue_id]
+            cosine_similarity_dict[issue_id] = {commit_hash: score_dict[commit_hash] if commit_hash in new_hash_set else previous_score_dict[commit_hash]
+                                                for commit_hash in hash_list}
+
+        cosine_similarity_dict = {issue_id: cosine_similarity_dict[issue_id] for issue_id in target_issue_id_list}
+        return_dict = {}
+        for issue_id, score_dict in cosine_similarity_dict.items():
+            similar_hash_list = [commit_hash for commit_hash, cosine_sim in score_dict.items() if cosine_sim >= self.THRESHOLD_COSINE_SIM]
+            if len(similar_hash_list) > 0:
+                return_dict[issue_id] = similar_hash_list
+
+        # the output is written before the model, so that the model never has commits that the output does not have
+        self.dump_cosine_similarity_pickle(output_dir, cosine_similarity_dict)
+        model.save(model_dir)
+
+        return return_dict
+
+    def compare_ntext_apss(self, issue_matrix, commit_matrix, hash_list, target_issue_id_list, output_dir, normalized_commit_matrix=None):
+        """
+        Same as compare_ntext_matrix, but the pairs are found by the all-pairs similarity search
+        (TS/all_pairs_similarity.py), which skips the pairs that cannot reach THRESHOLD_COSINE_SIM.
+        Note that the cosine similarity pickle file (or the similarity store) only has the pairs whose similarity is >= THRESHOLD_COSINE_SIM
+        (PU needs the similarities of all pairs; use the "matrix" engine for PU).
+
+        Returns:
+        return_dict [dict<issue id, list<commit hash>>] -- issue id to list of commit hashes. these commit hashes are the similar text
+        """
+        from TS import all_pairs_similarity
+
+        all_pairs_similarity_obj = all_pairs_similarity.AllPairsSimilarity(THRESHOLD_COSINE_SIM=self.THRESHOLD_COSINE_SIM,
+                                                                           block_memory_mb=self.block_memory_mb, verbose=self.verbose)
+        issue_idx, commit_idx, score = all_pairs_similarity_obj.search(issue_matrix, commit_matrix, normalized_commit_matrix=normalized_commit_matrix)
+        if self.verbose > 0:
+            print("{0} -- all pairs similarity: {1}".format(self.parallel_iteration, all_pairs_similarity_obj.stat_dict))
+
+        return self.dump_found_pairs(issue_idx, commit_idx, score, hash_list, target_issue_id_list, output_dir)
+
+    def compare_ntext_lsh(self, issue_matrix, commit_matrix, hash_list, target_issue_id_list, output_dir, normalized_commit_matrix=None):
+        """
+        Same as compare_ntext_apss, but the candidate pairs are generated with locality-sensitive hashing (TS/lsh_similarity.py),
+        and only the candidates are verified with the exact cosine similarity. It is approximate: a pair >= THRESHOLD_COSINE_SIM
+        is missed if it does not collide in any band. The recall on a sample of the target issues is written in
+        {{ output_dir }}/lsh_report_ite{{ parallel_iteration }}.json (use the other engines for the exact result).
+
+        Returns:
+        return_dict [dict<issue id, list<commit hash>>] -- issue id to list of commit hashes. these commit hashes are the similar text
+        """
+        from TS import lsh_similarity
+
+        lsh_similarity_obj = lsh_similarity.LshSimilarity(THRESHOLD_COSINE_SIM=self.THRESHOLD_COSINE_SIM, family=self.lsh_family,
+                                                          num_bands=self.lsh_num_bands, band_size=self.lsh_band_size,
+                                                          target_recall=self.lsh_target_recall, seed=self.lsh_seed,
+                                                          num_recall_sample=self.lsh_recall_sample, block_memory_mb=self.block_memory_mb,
+                                                          verbose=self.verbose)
+        # simhash: most unrelated pairs are candidates at low thresholds, which is known before the search
+        candidate_ratio = lsh_similarity_obj.expected_candidate_ratio()
+        if not (self.lsh_max_candidate_ratio is None or candidate_ratio is None or candidate_ratio <= self.lsh_max_candidate_ratio):
+            self.report_lsh_problem("The {0} x {1} bands of the lsh engine make {2:.0%} of the unrelated pairs candidates (> lsh_max_candidate_ratio {3}), so it is slower than the exact engines: use the matrix or apss engine".format(
+                lsh_similarity_obj.num_bands, lsh_similarity_obj.band_size, candidate_ratio, self.lsh_max_candidate_ratio))
+
+        issue_idx, commit_idx, score = lsh_similarity_obj.search(issue_matrix, commit_matrix, normalized_commit_matrix=normalized_commit_matrix)
+        if self.verbose > 0:
+            print("{0} -- lsh: {1}".format(self.parallel_iteration, lsh_similarity_obj.stat_dict))
+        os.makedirs(output_dir, exist_ok=True)
+        with open("{0}/lsh_report_ite{1}.json".format(output_dir, self.parallel_iteration), "w") as f:
+            json.dump(lsh_similarity_obj.stat_dict, f, indent=1)
+
+        recall = lsh_similarity_obj.stat_dict['recall']
+        if not (self.lsh_min_recall is None or recall is None or recall >= self.lsh_min_recall):
+            self.report_lsh_problem("The recall of the lsh engine is {0:.3f} (< lsh_min_recall {1}) on {2} sampled issues: use more bands or the exact engines (lsh_report_ite{3}.json)".format(
+                recall, self.lsh_min_recall, lsh_similarity_obj.stat_dict['num_recall_sample'], self.parallel_iteration))
+        candidate_ratio = lsh_similarity_obj.stat_dict['candidate_ratio']
+        if not (self.lsh_max_candidate_ratio is None or lsh_similarity_obj.family=="simhash" or candidate_ratio <= self.lsh_max_candidate_ratio):
+            self.report_lsh_problem("The lsh engine scored {0:.0%} of the pairs (> lsh_max_candidate_ratio {1}): use the matrix or apss engine (lsh_report_ite{2}.json)".format(
+                candidate_ratio, self.lsh_max_candidate_ratio, self.parallel_iteration))
+
+        return self.dump_found_pairs(issue_idx, commit_idx, score, hash_list, target_issue_id_list, output_dir)
+
+    def report_lsh_problem(self, message):
+        """
+        Stop with an error (lsh_low_recall="fail") or print a warning (lsh_low_recall="warn")
+        """
+        assert self.lsh_low_recall=="warn", message
+        print("{0} -- WARNING: {1}".format(self.parallel_iteration, message))
+
+    def dump_found_pairs(self, issue_idx, commit_idx, score, hash_list, target_issue_id_list, output_dir):
+        """
+        Store the pairs found by the "apss" or "lsh" engine (cosine similarity >= THRESHOLD_COSINE_SIM)
+        as a pickle file or in the similarity store
+
+        Returns:
+        return_dict [dict<issue id, list<commit hash>>] -- issue id to list of commit hashes. these commit hashes are the similar text
+        """
+        return_dict = {}
+        cosine_similarity_dict = {issue_id: {} for issue_id in target_issue_id_list}
+        for idx_issue_id, idx_commit_hash, cosine_sim in zip(issue_idx.tolist(), commit_idx.tolist(), score.tolist()):
+            issue_id = target_issue_id_list[idx_issue_id]
+            commit_hash = hash_list[idx_commit_hash]
+            if self.similarity_store==0:
+                cosine_similarity_dict[issue_id][commit_hash] = cosine_sim
+            if not issue_id in return_dict:
+                return_dict[issue_id] = []
+            return_dict[issue_id].append(commit_hash)
+
+        if self.similarity_store==0:
+            self.dump_cosine_similarity_pickle(output_dir, cosine_similarity_dict, min_score=self.THRESHOLD_COSINE_SIM)
+        else:
+            similarity_store.SimilarityStore.write_shard(similarity_store.get_store_dir(output_dir), self.parallel_iteration,
+                                                         target_issue_id_list, hash_list, issue_idx, commit_idx, score,
+                                                         min_score=self.THRESHOLD_COSINE_SIM)
+
+        return return_dict
+
+    def top_k_similarity(self, issue_matrix, commit_matrix, normalized_commit_matrix=None):
+        """
+        Find the top_k commits for each issue. The similarity matrix is computed in tiles (a block of issues x a block of commits)
+        that fit in block_memory_mb, and the best commits so far are merged with each tile by argpartition,
+        so we keep only issues x top_k scores.
+
+        Arguments:
+        issue_matrix [scipy.sparse.csr_matrix] -- tfidf vectors of issues (one row for each issue)
+        commit_matrix [scipy.sparse.csr_matrix] -- tfidf vectors of commits (one row for each commit)
+        normalized_commit_matrix [scipy.sparse.csr_matrix] -- L2-normalized commit_matrix (computed if None)
+
+        Returns:
+        best_idx [np.array<np.array<int64>>] -- top_k commit indices for each issue (sorted by the similarity, then the index. -1 if no more commits)
+        best_score [np.array<np.array<float64>>] -- similarity of best_idx (-inf if no more commits)
+        """
+        from sklearn.preprocessing import normalize
+
+        issue_matrix = normalize(issue_matrix, copy=True)
+        if normalized_commit_matrix is None:
+            normalized_commit_matrix = normalize(commit_matrix, copy=True)
+
+        num_issue, num_commit = issue_matrix.shape[0], normalized_commit_matrix.shape[0]
+        best_score = np.full((num_issue, self.top_k), -np.inf)
+        best_idx = np.full((num_issue, self.top_k), -1, dtype=np.int64)
+
+        num_entry = max(1, int(self.block_memory_mb*1024*1024)//8)
+        num_block_col = max(1, min(num_commit, max(self.top_k, int(np.sqrt(num_entry)))))
+        num_block_row = max(1, num_entry//num_block_col)
+        for col_start in range(0, num_commit, num_block_col):
+            if self.verbose > 0:
+                print("{0} -- Done commit: {1}/{2}".format(self.parallel_iteration, col_start, num_commit))
+            commit_block = normalized_commit_matrix[col_start:col_start+num_block_col]
+            for start in range(0, num_issue, num_block_row):
+                block = (commit_block @ issue_matrix[start:start+num_block_row].T).T.toarray()
+                end = start + block.shape[0]
+                self.merge_top_k(best_idx[start:end], best_score[start:end], block, col_start)
+
+        return self.sort_top_k(best_idx, best_score, num_commit)
+
+    def merge_top_k(self, best_idx, best_score, block, col_start):
+        """
+        Merge a block of similarities into the best commits so far (best_idx and best_score are updated in place)
+
+        Arguments:
+        best_idx [np.array<np.array<int64>>] -- top_k commit indices so far for each issue (in the order of the commit index)
+        best_score [np.array<np.array<float64>>] -- similarity of best_idx
+        block [np.array<np.array<float64>>] -- similarities between the issues and the commits [col_start, col_start + block.shape[1])
+        col_start [int] -- commit index of the first column of block (greater than the indices in best_idx)
+        """
+        block[(block < self.THRESHOLD_COSINE_SIM) | (block <= 0)] = -np.inf
+
+        # the best commits so far are kept in the order of the commit index, so the columns of score are sorted by the index
+        score = np.concatenate([best_score, block], axis=1)
+        idx = np.concatenate([best_idx, np.broadcast_to(np.arange(col_start, col_start+block.shape[1]), block.shape)], axis=1)
+        # keep the scores above the k-th score, and the first (smallest index) ones of the ties
+        kth_score = -np.partition(-score, self.top_k-1, axis=1)[:, self.top_k-1:self.top_k]
+        above = score > kth_score
+        tie = score==kth_score
+        keep = above | (tie & (np.cumsum(tie, axis=1) <= self.top_k - above.sum(axis=1, keepdims=True)))
+        best_score[:] = score[keep].reshape(-1, self.top_k)
+        best_idx[:] = idx[keep].reshape(-1, self.top_k)
+
+    def sort_top_k(self, best_idx, best_score, num_commit):
+        """
+        Sort the best commits of each issue by the similarity, then the commit index (-1 and -inf for no more commits)
+        """
+        best_idx[best_score==-np.inf] = -1
+        order = np.lexsort((np.where(best_idx < 0, num_commit, best_idx), -best_score), axis=-1)
+        return np.take_along_axis(best_idx, order, axis=1), np.take_along_axis(best_score, order, axis=1)
+
+    def compare_ntext_top_k(self, issue_matrix, commit_matrix, hash_list, target_issue_id_list, output_dir, normalized_commit_matrix=None):
+        """
+        Same as compare_ntext_matrix (or compare_ntext_apss), but only the top_k commits are kept for each issue.
+        The cosine similarity pickle file (or the similarity store) only has these pairs, so PU cannot use it.
+
+        Returns:
+        return_dict [dict<issue id, list<commit hash>>] -- issue id to list of commit hashes (the most similar first)
+        """
+        if self.engine=="apss":
+            from TS import all_pairs_similarity
+
+            all_pairs_similarity_obj = all_pairs_similarity.AllPairsSimilarity(THRESHOLD_COSINE_SIM=self.THRESHOLD_COSINE_SIM,
+                                                                               block_memory_mb=self.block_memory_mb, verbose=self.verbose)
+            issue_idx, commit_idx, score = all_pairs_similarity_obj.search(issue_matrix, commit_matrix, normalized_commit_matrix=normalized_commit_matrix)
+            order = np.lexsort((commit_idx, -score, issue_idx))
+            issue_idx, commit_idx, score = issue_idx[order], commit_idx[order], score[order]
+            rank = np.arange(len(issue_idx)) - np.searchsorted(issue_idx, issue_idx)
+            keep = (rank < self.top_k) & (score > 0)
+            issue_idx, commit_idx, score = issue_idx[keep], commit_idx[keep], score[keep]
+        else:
+            best_idx, best_score = self.top_k_similarity(issue_matrix, commit_matrix, normalized_commit_matrix=normalized_commit_matrix)
+            issue_idx, rank = np.nonzero(best_idx >= 0)
+            commit_idx, score = best_idx[issue_idx, rank], best_score[issue_idx, rank]
+
+        return self.dump_top_k_result(issue_idx, commit_idx, score, hash_list, target_issue_id_list, output_dir)
+
+    def dump_top_k_result(self, issue_idx, commit_idx, score, hash_list, target_issue_id_list, output_dir):
+        """
+        Store the top_k pairs (sorted by the issue, then the rank) and return them as return_dict
+        """
+        return_dict = {}
+        cosine_similarity_dict = {issue_id: {} for issue_id in target_issue_id_list}
+        for idx_issue_id, idx_commit_hash, cosine_sim in zip(issue_idx.tolist(), commit_idx.tolist(), score.tolist()):
+            issue_id = target_issue_id_list[idx_issue_id]
+            commit_hash = hash_list[idx_commit_hash]
+            if self.similarity_store==0:
+                cosine_similarity_dict[issue_id][commit_hash] = cosine_sim
+            if not issue_id in return_dict:
+                return_dict[issue_id] = []
+            return_dict[issue_id].append(commit_hash)
+
+        if self.similarity_store==0:
+            self.dump_cosine_similarity_pickle(output_dir, cosine_similarity_dict, min_score=self.THRESHOLD_COSINE_SIM, top_k=self.top_k)
+        else:
+            similarity_store.SimilarityStore.write_shard(similarity_store.get_store_dir(output_dir), self.parallel_iteration,
+                                                         target_issue_id_list, hash_list, issue_idx, commit_idx, score,
+                                                         min_score=self.THRESHOLD_COSINE_SIM, top_k=self.top_k)
+
+        return return_dict
+
+    def iter_commit_text(self, log_msg_repo_dict, hash_list):
+        """
+        Return an iterator of the commit texts in the order of hash_list
+        (log_msg_repo_dict is a dict or a function that returns the iterator)
+        """
+        if callable(log_msg_repo_dict):
+            return iter(log_msg_repo_dict())
+        return (log_msg_repo_dict[commit_hash] for commit_hash in hash_list)
+
+    def hashing_transform(self, hashing_vectorizer, text_list, executor=None):
+        """
+        Preprocess texts (None: empty text) and transform them into term counts of the hashing feature space
+        """
+        processed_text_iter = iter(self.preprocess_text_list([text for text in text_list if not text is None], executor=executor))
+        processed_text_list = ["" if text is None else next(processed_text_iter) for text in text_list]
+        return processed_text_list, self.hashing_counts(hashing_vectorizer, processed_text_list)
+
+    def hashing_counts(self, hashing_vectorizer, processed_text_list):
+        """
+        Transform preprocessed texts into term counts of the hashing feature space
+        """
+        matrix = hashing_vectorizer.transform(processed_text_list).tocsr()
+        matrix.sum_duplicates()
+        return matrix
+
+    def compare_ntext_streaming(self, dsc_issue_dict, comment_issue_dict, log_msg_repo_dict, hash_list, issue_id_list, target_issue_id_list, output_dir):
+        """
+        Same as compare_ntext_matrix (or compare_ntext_top_k), but the tfidf vectors are in a fixed-width hashing feature space
+        (HashingVectorizer with n_hash_features) and the texts are streamed in two passes:
+        1. document frequency of each feature over the same corpus as make_corpus_and_input (description and comments of each issue, and commits).
+           the preprocessed commit texts are spilled to a temporary file in output_dir (removed at the end)
+        2. tfidf vectors of the commits in blocks (read from the temporary file), and their similarities with the target issues
+
+        Each text is read and preprocessed once (in one process pool for the whole run if n_jobs is not 1).
+        The corpus, the vocabulary, and the commit matrix are never kept, and the similarities of each block are written
+        in the similarity store (similarity_store.ShardWriter) or merged into the top_k commits, so the memory is bounded by
+        n_hash_features, the target issues (their vectors and top_k commits), a block of commits (block_memory_mb),
+        and the returned links. The disk needs room for the preprocessed commit texts and the similarity store.
+        The idf is the same as TfidfVectorizer (smooth_idf). The similarities are the same as the "tfidf" vectorizer
+        unless two terms have the same hash.
+
+        Returns:
+        return_dict [dict<issue id, list<commit hash>>] -- issue id to list of commit hashes. these commit hashes are the similar text
+        """
+        from sklearn.feature_extraction.text import HashingVectorizer
+        from sklearn.preprocessing import normalize
+
+        hashing_vectorizer = HashingVectorizer(n_features=self.n_hash_features, alternate_sign=False, norm=None)
+        chunk_size = self.preprocess_chunk_size*max(1, self.n_jobs if self.n_jobs > 0 else os.cpu_count())
+        target_issue_set = set(target_issue_id_list)
+        os.makedirs(output_dir, exist_ok=True)
+
+        with tempfile.TemporaryFile(dir=output_dir) as processed_commit_file:
+            # first pass: document frequency
+            doc_freq = np.zeros(self.n_hash_features, dtype=np.int64)
+            num_doc = 0
+            processed_target_issue_dict = {}
+            with (self.make_preprocess_executor() or contextlib.nullcontext()) as executor:
+                num_issue_chunk = max(1, chunk_size//2)
+                for start in range(0, len(issue_id_list), num_issue_chunk):
+                    chunk_issue_id_list = issue_id_list[start:start+num_issue_chunk]
+                    text_list = []
+                    for issue_id in chunk_issue_id_list:
+                        text_list.append(dsc_issue_dict.get(issue_id))
+                        text_list.append(comment_issue_dict.get(issue_id))
+                    processed_text_list, matrix = self.hashing_transform(hashing_vectorizer, text_list, executor=executor)
+                    doc_freq += np.bincount(matrix.indices, minlength=self.n_hash_features)
+                    num_doc += matrix.shape[0]
+                    for idx_issue_id, issue_id in enumerate(chunk_issue_id_list):
+                        if issue_id in target_issue_set:
+                            processed_target_issue_dict[issue_id] = processed_text_list[2*idx_issue_id] + " " + processed_text_list[2*idx_issue_id+1]
+
+                commit_text_iter = self.iter_commit_text(log_msg_repo_dict, hash_list)
+                for start in range(0, len(hash_list), chunk_size):
+                    processed_text_list, matrix = self.hashing_transform(hashing_vectorizer, list(itertools.islice(commit_text_iter, chunk_size)),
+                                                                         executor=executor)
+                    pickle.dump(processed_text_list, processed_commit_file)
+                    doc_freq += np.bincount(matrix.indices, minlength=self.n_hash_features)
+                    num_doc += matrix.shape[0]
+            idf = np.log((1 + num_doc)/(1 + doc_freq)) + 1
+
+            issue_matrix = hashing_vectorizer.transform([processed_target_issue_dict[issue_id] for issue_id in target_issue_id_list]).tocsr()
+            issue_matrix.sum_duplicates()
+            issue_matrix.data *= idf[issue_matrix.indices]
+            issue_matrix_t = normalize(issue_matrix, copy=False).T.tocsr()
+
+            def _iter_processed_commit_text():
+                processed_commit_file.seek(0)
+                for _ in range(0, len(hash_list), chunk_size):
+                    yield from pickle.load(processed_commit_file)
+
+            # second pass: similarities for each block of commits
+            num_issue, num_commit = len(target_issue_id_list), len(hash_list)
+            num_block_col = max(1, int(self.block_memory_mb*1024*1024)//(8*max(1, num_issue)))
+            if not self.top_k is None:
+                best_score = np.full((num_issue, self.top_k), -np.inf)
+                best_idx = np.full((num_issue, self.top_k), -1, dtype=np.int64)
+                shard_writer = contextlib.nullcontext()
+            else:
+                shard_writer = similarity_store.ShardWriter(similarity_store.get_store_dir(output_dir), self.parallel_iteration,
+                                                            target_issue_id_list, hash_list)
+            return_dict = {}
+
+            processed_commit_text_iter = _iter_processed_commit_text()
+            with shard_writer:
+                for col_start in range(0, num_commit, num_block_col):
+                    if self.verbose > 0:
+                        print("{0} -- Done commit: {1}/{2}".format(self.parallel_iteration, col_start, num_commit))
+                    commit_block = self.hashing_counts(hashing_vectorizer, list(itertools.islice(processed_commit_text_iter, num_block_col)))
+                    commit_block.data *= idf[commit_block.indices]
+                    block = (normalize(commit_block, copy=False) @ issue_matrix_t).T.toarray() # issues x commits
+                    block_hash_list = hash_list[col_start:col_start+block.shape[1]]
+
+                    if not self.top_k is None:
+                        self.merge_top_k(best_idx, best_score, block, col_start)
+                        continue
+                    row, col = np.nonzero(block)
+                    shard_writer.add(row, col_start + col, block[row, col])
+                    for issue_id, row in zip(target_issue_id_list, block):
+                        similar_idx = np.flatnonzero(row >= self.THRESHOLD_COSINE_SIM)
+                        if len(similar_idx)==0:
+                            continue
+                        if not issue_id in return_dict:
+                            return_dict[issue_id] = []
+                        return_dict[issue_id].extend([block_hash_list[idx] for idx in similar_idx])
+
+        if not self.top_k is None:
+            best_idx, best_score = self.sort_top_k(best_idx, best_score, num_commit)
+            issue_idx, rank = np.nonzero(best_idx >= 0)
+            return self.dump_top_k_result(issue_idx, best_idx[issue_idx, rank], best_score[issue_idx, rank], hash_list, target_issue_id_list, output_dir)
+
+        return {issue_id: return_dict[issue_id] for issue_id in target_issue_id_list if issue_id in return_dict}
+
     def run(self, hash_list, issue_id_list, target_issue_id_list, dsc_issue_dict,
             comment_issue_dict, log_message_without_issueid_path, output_dir):
         """
@@ -0,0 +1,99 @@
+import collections
+import re
+import time
+from string import punctuation
+
+# One pass over a (lower-cased) text that returns the tokens of nltk.word_tokenize without the punctuation tokens.
+# It follows the rules of the Treebank tokenizer of NLTK that change the terms of TfidfVectorizer:
+# - "n't" is split from its word (don't -> do n't, can't -> ca n't), and cannot -> can not
+# - the clitics 's 'm 'd 'll 're 've are split from their word (we'll -> we 'll)
+# - ".", "-", "/", "'" and ("," or ":" before a digit) inside a word do not split it (x.y, foo-bar, a/b, o'neil, 1,000, 10:30)
+# - the other characters that are not \w (punctuation, quotes, brackets, and spaces) are separators, so they are dropped
+PATTERN = re.compile(r"""
+    \w+(?=n't\b)                                 # do|n't
+    | n't\b
+    | can(?=not\b)                               # can|not
+    | '(?:s|m|d|ll|re|ve)\b                      # clitics
+    | \w+(?:(?:[./-]|'(?!(?:s|m|d|ll|re|ve)\b)|[,:](?=\d))\w+)*
+    """, re.VERBOSE)
+
+
+def tokenize(text):
+    """
+    Arguments:
+    text [string] -- a lower-cased text
+
+    Returns:
+    word_tokens [list<string>] -- tokens (without punctuation)
+    """
+    return PATTERN.findall(text)
+
+
+def equivalence_report(text_list, max_example=20):
+    """
+    Compare the regex tokenizer with nltk.word_tokenize (the NLTK resources are needed) on a sample corpus:
+    - token level: the tokens of word_tokenize without punctuation (what TokenNormalizer gets) vs. the tokens of tokenize
+    - term level: the terms that TfidfVectorizer extracts from NtextSimilarity.preprocess_text with each tokenizer,
+                  which decide the similarities (e.g., both tokenizers drop "..." and "``" in the end)
+
+    Arguments:
+    text_list [list<string>] -- sample texts (e.g., issue descriptions and log messages)
+    max_example [int] -- number of the most frequent differences reported
+
+    Returns:
+    report [dict<string, value>] -- the number of texts with the same tokens (terms), the number of tokens (terms) that differ,
+                                    the most frequent tokens (terms) only in each tokenizer, and the time of each tokenizer
+    """
+    from nltk.tokenize import word_tokenize
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    from TS import ntext_similarity
+
+    text_list = [text.lower() for text in text_list if not text is None]
+    report = {'num_text': len(text_list)}
+
+    start = time.perf_counter()
+    nltk_token_list = [[word for word in word_tokenize(text) if not word in punctuation] for text in text_list]
+    report['nltk_time'] = time.perf_counter() - start
+    start = time.perf_counter()
+    regex_token_list = [tokenize(text) for text in text_list]
+    report['regex_time'] = time.perf_counter() - start
+
+    analyzer = TfidfVectorizer().build_analyzer()
+    term_list_dict = {}
+    for tokenizer in ("nltk", "regex"):
+        ntext_similarity_obj = ntext_similarity.NtextSimilarity(tokenizer=tokenizer)
+        term_list_dict[tokenizer] = [analyzer(ntext_similarity_obj.preprocess_text(text)) for text in text_list]
+
+    for level, (nltk_list, regex_list) in (("token", (nltk_token_list, regex_token_list)),
+                                           ("term", (term_list_dict["nltk"], term_list_dict["regex"]))):
+        only_nltk_counter = collections.Counter()
+        only_regex_counter = collections.Counter()
+        num_same_text = 0
+        for nltk_words, regex_words in zip(nltk_list, regex_list):
+            nltk_counter = collections.Counter(nltk_words)
+            regex_counter = collections.Counter(regex_words)
+            if nltk_counter==regex_counter:
+                num_same_text += 1
+            only_nltk_counter.update(nltk_counter - regex_counter)
+            only_regex_counter.update(regex_counter - nltk_counter)
+
+        report[level] = {'num_same_text': num_same_text,
+                         'num_nltk': sum(len(words) for words in nltk_list),
+                         'num_regex': sum(len(words) for words in regex_list),
+                         'num_only_nltk': sum(only_nltk_counter.values()),
+                         'num_only_regex': sum(only_regex_counter.values()),
+                         'only_nltk': only_nltk_counter.most_common(max_example),
+                         'only_regex': only_regex_counter.most_common(max_example)}
+    return report
+
+
+def print_report(report):
+    print("texts: {0}, nltk.word_tokenize: {1:.3f} s, regex: {2:.3f} s".format(report['num_text'], report['nltk_time'], report['regex_time']))
+    for level in ("token", "term"):
+        level_report = report[level]
+        print("{0}s -- same {0}s: {1}/{2} texts, nltk: {3} {0}s ({4} not in regex), regex: {5} {0}s ({6} not in nltk)".format(
+            level, level_report['num_same_text'], report['num_text'], level_report['num_nltk'], level_report['num_only_nltk'],
+            level_report['num_regex'], level_report['num_only_regex']))
+        print("  only nltk: {0}".format(level_report['only_nltk']))
+        print("  only regex: {0}".format(level_report['only_regex']))
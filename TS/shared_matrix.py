@@ -0,0 +1,111 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+import scipy.sparse
+
+
+class SharedCsrMatrix:
+    def __init__(self, matrix, shm_list, owner):
+        """
+        CSR matrix whose arrays (data, indices, indptr) are in shared memory segments.
+        The owner process creates the segments (create) and passes handle() to the worker processes,
+        which attach to them without copying the arrays (attach).
+
+        The owner must call unlink() when the workers finish (also on failure). If the owner is killed,
+        the resource tracker of multiprocessing removes the segments when the owner exits.
+        The workers only close() their view; a segment is released when all processes close it.
+
+        Arguments:
+        matrix [scipy.sparse.csr_matrix] -- matrix on the shared arrays
+        shm_list [list<SharedMemory>] -- segments of data, indices, and indptr
+        owner [bool] -- True if this process created the segments
+        """
+        self.matrix = matrix
+        self.shm_list = shm_list
+        self.owner = owner
+
+    @classmethod
+    def create(cls, matrix):
+        """
+        Copy the arrays of a CSR matrix into new shared memory segments
+        """
+        matrix = scipy.sparse.csr_matrix(matrix)
+        # the same dtype for indices and indptr, otherwise scipy converts (copies) them
+        index_dtype = np.promote_types(matrix.indices.dtype, matrix.indptr.dtype)
+
+        shm_list = []
+        array_list = []
+        try:
+            for array in (matrix.data, matrix.indices.astype(index_dtype, copy=False), matrix.indptr.astype(index_dtype, copy=False)):
+                shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+                shm_list.append(shm)
+                shared_array = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+                shared_array[:] = array
+                array_list.append(shared_array)
+        except Exception:
+            for shm in shm_list:
+                shm.close()
+                shm.unlink()
+            raise
+
+        return cls(cls._make_matrix(array_list, matrix.shape), shm_list, True)
+
+    @staticmethod
+    def _make_matrix(array_list, shape):
+        data, indices, indptr = array_list
+        return scipy.sparse.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+
+    def handle(self):
+        """
+        Returns:
+        handle [dict] -- picklable description of the segments (passed to the worker processes)
+        """
+        return {'shape': self.matrix.shape,
+                'array_list': [(shm.name, array.dtype.str, array.shape)
+                               for shm, array in zip(self.shm_list, (self.matrix.data, self.matrix.indices, self.matrix.indptr))]}
+
+    @classmethod
+    def attach(cls, handle):
+        """
+        Attach to the segments of handle (zero-copy)
+        """
+        shm_list = []
+        array_list = []
+        try:
+            for name, dtype, shape in handle['array_list']:
+                shm = shared_memory.SharedMemory(name=name)
+                shm_list.append(shm)
+                array_list.append(np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf))
+        except Exception:
+            for shm in shm_list:
+                shm.close()
+            raise
+
+        return cls(cls._make_matrix(array_list, tuple(handle['shape'])), shm_list, False)
+
+    def close(self):
+        self.matrix = None
+        for shm in self.shm_list:
+            try:
+                shm.close()
+            except BufferError:
+                pass # the arrays are still referenced; the segment is closed when they are released
+
+    def unlink(self):
+        self.close()
+        if self.owner:
+            for shm in self.shm_list:
+                try:
+                    shm.unlink()
+                except FileNotFoundError:
+                    pass
+            self.owner = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.owner:
+            self.unlink()
+        else:
+            self.close()
@@ -0,0 +1,338 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+
+def get_store_dir(output_dir):
+    """
+    Return the path to the similarity store in the output directory of TS (GS and MT)
+    """
+    return os.path.join(output_dir, "similarity_store")
+
+
+def write_commit_vocab(store_dir, hash_list):
+    """
+    Write the commit vocabulary of the store (or check that it is the same as hash_list)
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    commit_vocab = np.array(hash_list, dtype=str)
+    commit_vocab_path = os.path.join(store_dir, "commit_vocab.npy")
+    if os.path.exists(commit_vocab_path):
+        assert np.array_equal(np.load(commit_vocab_path), commit_vocab), "All shards must have the same hash_list: {0}".format(store_dir)
+    else:
+        temp_path = "{0}.{1}.tmp.npy".format(commit_vocab_path[:-len(".npy")], os.getpid())
+        np.save(temp_path, commit_vocab)
+        os.replace(temp_path, commit_vocab_path)
+
+
+def get_issue_rows(issue_id_list):
+    """
+    Returns:
+    issue_vocab [list<issue id>] -- distinct issue ids (the rows of a shard)
+    issue_row [np.array<int64>] -- row of issue_vocab for each issue id in issue_id_list
+    first_idx [np.array<bool>] -- True for the first one of each issue id (the pairs of the duplicates are not stored)
+    """
+    issue_vocab = list(dict.fromkeys(issue_id_list))
+    issue_row_dict = {issue_id: row for row, issue_id in enumerate(issue_vocab)}
+    issue_row = np.array([issue_row_dict[issue_id] for issue_id in issue_id_list], dtype=np.int64)
+    first_idx = np.zeros(len(issue_id_list), dtype=bool)
+    first_idx[np.unique(issue_row, return_index=True)[1]] = True
+    return issue_vocab, issue_row, first_idx
+
+
+def select_pairs(issue_row, first_idx, issue_idx, commit_idx, score):
+    """
+    Keep the non-zero scores of the first issue ids, and sort them by the row, then the commit index
+
+    Returns:
+    issue_row_array [np.array<int64>] -- row of each pair
+    commit_idx [np.array<int64>] -- commit index of each pair
+    score [np.array<float64>] -- score of each pair
+    """
+    issue_idx = np.asarray(issue_idx, dtype=np.int64)
+    commit_idx = np.asarray(commit_idx, dtype=np.int64)
+    score = np.asarray(score, dtype=np.float64)
+    keep = (score!=0) & first_idx[issue_idx] if len(issue_idx) > 0 else np.zeros(0, dtype=bool)
+    issue_row_array, commit_idx, score = issue_row[issue_idx[keep]], commit_idx[keep], score[keep]
+    order = np.lexsort((commit_idx, issue_row_array))
+    return issue_row_array[order], commit_idx[order], score[order]
+
+
+def make_shard_dir(store_dir, shard_id):
+    """
+    Make the directory of a shard, and remove its meta.json before any file of the shard is (re)written,
+    so that an interrupted rewrite never leaves a shard that mixes the old and new arrays
+    """
+    shard_dir = os.path.join(store_dir, "shard_{0}".format(shard_id))
+    os.makedirs(shard_dir, exist_ok=True)
+    meta_path = os.path.join(shard_dir, "meta.json")
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    return shard_dir
+
+
+def write_shard_meta(shard_dir, min_score, top_k, num_pair):
+    # meta.json is written at the end: a shard without meta.json is ignored
+    with open(os.path.join(shard_dir, "meta.json"), "w") as f:
+        json.dump({'min_score': float(min_score), 'top_k': top_k, 'num_pair': int(num_pair)}, f)
+
+
+class ShardWriter:
+    def __init__(self, store_dir, shard_id, issue_id_list, hash_list, min_score=0.0, top_k=None):
+        """
+        Write the similarities of a parallel iteration block by block (e.g., the commit blocks of
+        NtextSimilarity.compare_ntext_streaming), so that the pairs of the shard are never in memory at once.
+        Each block is spilled in {{ shard_dir }}/spill, and close() builds the same files as SimilarityStore.write_shard
+        with memory mapping. The blocks must be added in the order of the commit index (a block has larger commit indices
+        than the blocks before it).
+
+        Use it in a with statement: the shard is built when the statement ends, and the spilled blocks are removed also on failure.
+
+        Arguments:
+        the same as SimilarityStore.write_shard
+        """
+        write_commit_vocab(store_dir, hash_list)
+        self.issue_vocab, self.issue_row, self.first_idx = get_issue_rows(issue_id_list)
+        self.min_score = min_score
+        self.top_k = top_k
+
+        self.shard_dir = make_shard_dir(store_dir, shard_id)
+        self.spill_dir = os.path.join(self.shard_dir, "spill")
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+        os.makedirs(self.spill_dir)
+        self.num_block = 0
+        self.issue_count = np.zeros(len(self.issue_vocab), dtype=np.int64)
+
+    def add(self, issue_idx, commit_idx, score):
+        """
+        Arguments:
+        issue_idx [np.array<int>] -- index of issue_id_list for each pair
+        commit_idx [np.array<int>] -- index of hash_list for each pair
+        score [np.array<float>] -- cosine similarity for each pair
+        """
+        issue_row_array, commit_idx, score = select_pairs(self.issue_row, self.first_idx, issue_idx, commit_idx, score)
+        np.save(os.path.join(self.spill_dir, "issue_row_{0}.npy".format(self.num_block)), issue_row_array)
+        np.save(os.path.join(self.spill_dir, "commit_idx_{0}.npy".format(self.num_block)), commit_idx.astype(np.int32))
+        np.save(os.path.join(self.spill_dir, "score_{0}.npy".format(self.num_block)), score.astype(np.float32))
+        self.issue_count += np.bincount(issue_row_array, minlength=len(self.issue_vocab))
+        self.num_block += 1
+
+    def close(self):
+        """
+        Merge the spilled blocks into the shard: the pairs of each row are sorted by the commit index, since the blocks are in that order
+        """
+        issue_indptr = np.concatenate([[0], np.cumsum(self.issue_count)]).astype(np.int64)
+        num_pair = int(issue_indptr[-1])
+        np.save(os.path.join(self.shard_dir, "issue_vocab.npy"), np.array(self.issue_vocab, dtype=str))
+        np.save(os.path.join(self.shard_dir, "issue_indptr.npy"), issue_indptr)
+        commit_idx_array = np.lib.format.open_memmap(os.path.join(self.shard_dir, "commit_idx.npy"), mode="w+", dtype=np.int32, shape=(num_pair,))
+        score_array = np.lib.format.open_memmap(os.path.join(self.shard_dir, "score.npy"), mode="w+", dtype=np.float32, shape=(num_pair,))
+
+        # next position of each row
+        position = issue_indptr[:-1].copy()
+        for idx_block in range(self.num_block):
+            def _load(name):
+                return np.load(os.path.join(self.spill_dir, "{0}_{1}.npy".format(name, idx_block)))
+
+            issue_row_array = _load("issue_row")
+            # the pairs of a block are sorted by the row: rank of each pair in its row
+            rank = np.arange(len(issue_row_array)) - np.searchsorted(issue_row_array, issue_row_array, side='left')
+            pair_position = position[issue_row_array] + rank
+            commit_idx_array[pair_position] = _load("commit_idx")
+            score_array[pair_position] = _load("score")
+            position += np.bincount(issue_row_array, minlength=len(self.issue_vocab))
+        commit_idx_array.flush()
+        score_array.flush()
+        del commit_idx_array, score_array
+
+        write_shard_meta(self.shard_dir, self.min_score, self.top_k, num_pair)
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+
+class SimilarityStore:
+    def __init__(self, store_dir, mmap_mode='r'):
+        """
+        On-disk store of the cosine similarities between issues and commits (the results of compare_ntext).
+        A store has a commit vocabulary shared by all shards and one shard for each parallel iteration:
+
+        {{ store_dir }}/commit_vocab.npy -- commit hashes (hash_list)
+        {{ store_dir }}/shard_{{ N }}/issue_vocab.npy -- issue ids of this shard
+        {{ store_dir }}/shard_{{ N }}/issue_indptr.npy -- the pairs of issue_vocab[i] are [issue_indptr[i], issue_indptr[i+1])
+        {{ store_dir }}/shard_{{ N }}/commit_idx.npy -- index of commit_vocab for each pair (int32, sorted for each issue)
+        {{ store_dir }}/shard_{{ N }}/score.npy -- cosine similarity for each pair (float32)
+        {{ store_dir }}/shard_{{ N }}/meta.json -- min_score: the pairs whose score is below min_score are not stored
+                                                  top_k: only the top_k pairs are stored for each issue (null: all pairs)
+
+        Only non-zero scores are stored. The arrays are opened with memory mapping.
+
+        Arguments:
+        store_dir [string] -- path to the store directory
+        mmap_mode [string] -- mmap_mode of np.load (None reads the arrays into memory)
+        """
+        self.store_dir = store_dir
+        self.mmap_mode = mmap_mode
+
+        self.commit_vocab = np.load(os.path.join(store_dir, "commit_vocab.npy"))
+        self._commit_order = np.argsort(self.commit_vocab, kind='stable')
+        self._sorted_commit_vocab = self.commit_vocab[self._commit_order]
+
+        # issue id -> (shard, row in the shard)
+        self.shard_list = []
+        self.issue_index_dict = {}
+        for shard_name in sorted(os.listdir(store_dir)):
+            shard_dir = os.path.join(store_dir, shard_name)
+            if not (shard_name.startswith("shard_") and os.path.exists(os.path.join(shard_dir, "meta.json"))):
+                continue
+            shard = self.load_shard(shard_dir)
+            for row, issue_id in enumerate(shard['issue_vocab'].tolist()):
+                self.issue_index_dict[issue_id] = (len(self.shard_list), row)
+            self.shard_list.append(shard)
+
+    def load_shard(self, shard_dir):
+        def _load(name):
+            return np.load(os.path.join(shard_dir, "{0}.npy".format(name)), mmap_mode=self.mmap_mode)
+
+        with open(os.path.join(shard_dir, "meta.json")) as f:
+            meta = json.load(f)
+        return {'issue_vocab': np.load(os.path.join(shard_dir, "issue_vocab.npy")),
+                'issue_indptr': _load('issue_indptr'), 'commit_idx': _load('commit_idx'),
+                'score': _load('score'), 'min_score': meta['min_score'], 'top_k': meta.get('top_k')}
+
+    @staticmethod
+    def write_shard(store_dir, shard_id, issue_id_list, hash_list, issue_idx, commit_idx, score, min_score=0.0, top_k=None):
+        """
+        Write the similarities of a parallel iteration
+
+        Arguments:
+        store_dir [string] -- path to the store directory
+        shard_id [int] -- shard id (parallel iteration)
+        issue_id_list [list<issue id>] -- target issue ids of this shard
+        hash_list [list<commit hash>] -- studied commit hash list (the same for all shards)
+        issue_idx [np.array<int>] -- index of issue_id_list for each pair
+        commit_idx [np.array<int>] -- index of hash_list for each pair
+        score [np.array<float>] -- cosine similarity for each pair
+        min_score [float] -- the pairs whose score is below min_score are not given (0 if all non-zero scores are given)
+        top_k [int] -- only the top_k pairs are given for each issue (None if all pairs are given)
+        """
+        write_commit_vocab(store_dir, hash_list)
+        issue_vocab, issue_row, first_idx = get_issue_rows(issue_id_list)
+        issue_row_array, commit_idx, score = select_pairs(issue_row, first_idx, issue_idx, commit_idx, score)
+
+        shard_dir = make_shard_dir(store_dir, shard_id)
+        np.save(os.path.join(shard_dir, "issue_vocab.npy"), np.array(issue_vocab, dtype=str))
+        np.save(os.path.join(shard_dir, "issue_indptr.npy"),
+                np.concatenate([[0], np.cumsum(np.bincount(issue_row_array, minlength=len(issue_vocab)))]).astype(np.int64))
+        np.save(os.path.join(shard_dir, "commit_idx.npy"), commit_idx.astype(np.int32))
+        np.save(os.path.join(shard_dir, "score.npy"), score.astype(np.float32))
+        write_shard_meta(shard_dir, min_score, top_k, len(score))
+
+    def commit_index(self, hash_list):
+        """
+        Return the index of commit_vocab for each commit hash (-1 if not in the store)
+        """
+        key_array = np.array(hash_list, dtype=self.commit_vocab.dtype)
+        pos = np.searchsorted(self._sorted_commit_vocab, key_array)
+        pos = np.minimum(pos, len(self._sorted_commit_vocab) - 1)
+        found = self._sorted_commit_vocab[pos]==key_array if len(self._sorted_commit_vocab) > 0 else np.zeros(len(key_array), dtype=bool)
+        return np.where(found, self._commit_order[pos], -1)
+
+    def __contains__(self, issue_id):
+        return issue_id in self.issue_index_dict
+
+    def issue_id_list(self):
+        return list(self.issue_index_dict.keys())
+
+    def issue_scores(self, issue_id):
+        """
+        Returns:
+        commit_idx [np.array<int32>] -- index of commit_vocab (sorted)
+        score [np.array<float32>] -- cosine similarity for each commit
+        min_score [float] -- the pairs whose score is below min_score are not stored
+        """
+        idx_shard, row = self.issue_index_dict[issue_id]
+        shard = self.shard_list[idx_shard]
+        start, end = shard['issue_indptr'][row], shard['issue_indptr'][row+1]
+        return shard['commit_idx'][start:end], shard['score'][start:end], shard['min_score']
+
+    def has_all_scores(self, issue_id):
+        """
+        Return True if all non-zero scores of issue_id are stored (neither min_score nor top_k was used)
+        """
+        shard = self.shard_list[self.issue_index_dict[issue_id][0]]
+        return shard['min_score']==0 and shard['top_k'] is None
+
+    def lookup(self, issue_id, commit_hash, default=0.0):
+        return float(self.lookup_batch([issue_id], [commit_hash], default=default)[0])
+
+    def lookup_batch(self, issue_id_list, hash_list, default=0.0):
+        """
+        Look up the cosine similarities of pairs
+
+        Arguments:
+        issue_id_list [list<issue id>] -- issue id for each pair
+        hash_list [list<commit hash>] -- commit hash for each pair
+        default [float] -- value for the pairs that are not stored (the score is 0 or below min_score of the shard)
+
+        Returns:
+        score_array [np.array<float64>] -- cosine similarity for each pair
+        """
+        assert len(issue_id_list)==len(hash_list), "issue_id_list and hash_list must have the same length"
+        score_array = np.full(len(hash_list), default, dtype=np.float64)
+        commit_idx_array = self.commit_index(hash_list)
+
+        pair_idx_dict = {}
+        for pair_idx, issue_id in enumerate(issue_id_list):
+            if not issue_id in pair_idx_dict:
+                pair_idx_dict[issue_id] = []
+            pair_idx_dict[issue_id].append(pair_idx)
+
+        for issue_id, pair_idx_list in pair_idx_dict.items():
+            if not issue_id in self.issue_index_dict:
+                continue
+            stored_commit_idx, stored_score, min_score = self.issue_scores(issue_id)
+            if len(stored_commit_idx)==0:
+                continue
+            pair_idx = np.array(pair_idx_list, dtype=np.int64)
+            query = commit_idx_array[pair_idx]
+            pos = np.minimum(np.searchsorted(stored_commit_idx, query), len(stored_commit_idx) - 1)
+            found = (stored_commit_idx[pos]==query) & (query >= 0)
+            score_array[pair_idx[found]] = stored_score[pos[found]]
+
+        return score_array
+
+    def min_score_links(self, min_score):
+        """
+        Return the pairs whose (float32) cosine similarity is >= min_score
+
+        Arguments:
+        min_score [float] -- threshold (it must be >= min_score of all shards)
+
+        Returns:
+        return_dict [dict<issue id, list<commit hash>>] -- issue id to list of commit hashes (in the order of commit_vocab)
+        """
+        return_dict = {}
+        for shard in self.shard_list:
+            assert min_score >= shard['min_score'], "This store does not have the scores below {0}".format(shard['min_score'])
+            hit = np.flatnonzero(np.asarray(shard['score']) >= np.float32(min_score))
+            if len(hit)==0:
+                continue
+            issue_row = np.searchsorted(shard['issue_indptr'], hit, side='right') - 1
+            commit_idx = np.asarray(shard['commit_idx'])[hit]
+            row_array, start_array = np.unique(issue_row, return_index=True)
+            for row, commit_group in zip(row_array.tolist(), np.split(commit_idx, start_array[1:])):
+                issue_id = shard['issue_vocab'][row]
+                if not issue_id in return_dict:
+                    return_dict[issue_id] = []
+                return_dict[issue_id].extend(self.commit_vocab[commit_group].tolist())
+        return return_dict
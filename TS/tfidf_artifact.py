@@ -0,0 +1,256 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+# scipy and sklearn are imported when they are used first (see TS/ntext_similarity.py)
+
+# artifact directory -> handle of SharedTfidfArtifact (set in the worker processes)
+_shared_handle_dict = {}
+# artifact directory -> TfidfArtifact attached to the shared memory (one for each worker process)
+_attached_artifact_dict = {}
+
+
+def exists(artifact_dir):
+    return os.path.exists(os.path.join(artifact_dir, "meta.json"))
+
+
+def attach_shared(handle):
+    """
+    Register the shared matrices of an artifact in this (worker) process.
+    After that, TfidfArtifact.load(artifact_dir) attaches to them instead of reading the files.
+    It can be the initializer of a process pool.
+
+    Arguments:
+    handle [dict] -- SharedTfidfArtifact.handle()
+    """
+    _shared_handle_dict[handle['artifact_dir']] = handle
+
+
+class TfidfArtifact:
+    def __init__(self, vocabulary, idf, hash_list, issue_id_list, commit_matrix, issue_matrix, tokenizer="nltk"):
+        """
+        TF-IDF vectors fitted once on the whole corpus (all issues and all commits) of NtextSimilarity.
+        The parallel iterations of TS, GS, and MT load the artifact and only compute the similarities
+        of their target issues, instead of preprocessing the corpus and fitting TfidfVectorizer again.
+
+        {{ artifact_dir }}/vocabulary.npy -- terms (the column order of the matrices)
+        {{ artifact_dir }}/idf.npy -- idf of each term
+        {{ artifact_dir }}/hash_list.npy -- commit hashes (the row order of commit_matrix)
+        {{ artifact_dir }}/issue_id_list.npy -- issue ids (the row order of issue_matrix)
+        {{ artifact_dir }}/commit_matrix.npz -- tfidf vectors of the commit texts
+        {{ artifact_dir }}/issue_matrix.npz -- tfidf vectors of the issue texts (description + " " + comments)
+        {{ artifact_dir }}/meta.json -- written at the end of the build (with the tokenizer of the preprocessing)
+
+        Arguments:
+        vocabulary [np.array<str>] -- terms
+        idf [np.array<float>] -- idf of each term
+        hash_list [list<commit hash>] -- commit hashes
+        issue_id_list [list<issue id>] -- issue ids
+        commit_matrix [scipy.sparse.csr_matrix] -- tfidf vectors of the commit texts
+        issue_matrix [scipy.sparse.csr_matrix] -- tfidf vectors of the issue texts
+        tokenizer [string] -- tokenizer of NtextSimilarity that preprocessed the texts ("nltk" or "regex")
+        """
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.hash_list = hash_list
+        self.issue_id_list = issue_id_list
+        self.commit_matrix = commit_matrix
+        self.issue_matrix = issue_matrix
+        self.tokenizer = tokenizer
+
+        self.normalized_commit_matrix = None
+
+        self._issue_row_dict = {issue_id: row for row, issue_id in enumerate(issue_id_list)}
+
+    @classmethod
+    def fit(cls, ntext_similarity_obj, dsc_issue_dict, comment_issue_dict, log_msg_repo_dict, hash_list, issue_id_list):
+        """
+        Preprocess the corpus and fit TfidfVectorizer in the same way as NtextSimilarity.compare_ntext
+
+        Arguments:
+        ntext_similarity_obj [NtextSimilarity] -- used for the preprocessing
+        """
+        unique_issue_id_list = list(dict.fromkeys(issue_id_list))
+        vocabulary, idf, commit_matrix, issue_matrix = ntext_similarity_obj.vectorize_corpus(dsc_issue_dict, comment_issue_dict, log_msg_repo_dict,
+                                                                                             hash_list, issue_id_list, unique_issue_id_list)
+
+        return cls(vocabulary, idf, list(hash_list), unique_issue_id_list,
+                   commit_matrix.tocsr(), issue_matrix.tocsr(), ntext_similarity_obj.tokenizer)
+
+    def save(self, artifact_dir):
+        """
+        Write the artifact in a temporary directory and rename it, so that
+        a parallel iteration never reads a partial artifact.
+        """
+        parent_dir = os.path.dirname(os.path.abspath(artifact_dir))
+        os.makedirs(parent_dir, exist_ok=True)
+        temp_dir = "{0}.{1}.tmp".format(os.path.abspath(artifact_dir), os.getpid())
+        os.makedirs(temp_dir, exist_ok=True)
+
+        import scipy.sparse
+
+        np.save(os.path.join(temp_dir, "vocabulary.npy"), np.asarray(self.vocabulary, dtype=str))
+        np.save(os.path.join(temp_dir, "idf.npy"), self.idf)
+        np.save(os.path.join(temp_dir, "hash_list.npy"), np.array(self.hash_list, dtype=str))
+        np.save(os.path.join(temp_dir, "issue_id_list.npy"), np.array(self.issue_id_list, dtype=str))
+        scipy.sparse.save_npz(os.path.join(temp_dir, "commit_matrix.npz"), self.commit_matrix)
+        scipy.sparse.save_npz(os.path.join(temp_dir, "issue_matrix.npz"), self.issue_matrix)
+        with open(os.path.join(temp_dir, "meta.json"), "w") as f:
+            json.dump({'num_commit': len(self.hash_list), 'num_issue': len(self.issue_id_list),
+                       'num_term': len(self.vocabulary), 'tokenizer': self.tokenizer}, f)
+
+        try:
+            os.rename(temp_dir, artifact_dir)
+        except OSError:
+            # another process has already saved the artifact
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            assert exists(artifact_dir), "Cannot save the artifact: {0}".format(artifact_dir)
+
+    @classmethod
+    def load(cls, artifact_dir, load_matrix=True):
+        """
+        Load the artifact. If its matrices are shared with this process (attach_shared),
+        the artifact uses the shared matrices without copying them.
+
+        Arguments:
+        load_matrix [bool] -- if False, the matrices are not loaded (None)
+        """
+        assert exists(artifact_dir), "No TF-IDF artifact: {0}".format(artifact_dir)
+
+        if load_matrix and os.path.abspath(artifact_dir) in _shared_handle_dict:
+            return cls.attach(_shared_handle_dict[os.path.abspath(artifact_dir)])
+
+        def _load(name):
+            return np.load(os.path.join(artifact_dir, "{0}.npy".format(name)))
+
+        with open(os.path.join(artifact_dir, "meta.json")) as f:
+            tokenizer = json.load(f).get('tokenizer', "nltk") # the artifacts before the regex tokenizer used nltk
+
+        if not load_matrix:
+            return cls(_load("vocabulary"), _load("idf"), _load("hash_list").tolist(), _load("issue_id_list").tolist(), None, None, tokenizer)
+        import scipy.sparse
+
+        return cls(_load("vocabulary"), _load("idf"), _load("hash_list").tolist(), _load("issue_id_list").tolist(),
+                   scipy.sparse.load_npz(os.path.join(artifact_dir, "commit_matrix.npz")).tocsr(),
+                   scipy.sparse.load_npz(os.path.join(artifact_dir, "issue_matrix.npz")).tocsr(), tokenizer)
+
+    @classmethod
+    def attach(cls, handle):
+        """
+        Return the artifact on the shared matrices of handle (SharedTfidfArtifact.handle()).
+        The artifact is attached once in each process.
+        """
+        from TS import shared_matrix
+
+        artifact_dir = handle['artifact_dir']
+        if not artifact_dir in _attached_artifact_dict:
+            artifact = cls.load(artifact_dir, load_matrix=False)
+            shared_matrix_dict = {name: shared_matrix.SharedCsrMatrix.attach(matrix_handle)
+                                  for name, matrix_handle in handle['matrix_handle_dict'].items()}
+            artifact.commit_matrix = shared_matrix_dict['commit_matrix'].matrix
+            artifact.issue_matrix = shared_matrix_dict['issue_matrix'].matrix
+            artifact.normalized_commit_matrix = shared_matrix_dict['normalized_commit_matrix'].matrix
+            artifact.shared_matrix_dict = shared_matrix_dict # keep the segments open
+            _attached_artifact_dict[artifact_dir] = artifact
+        return _attached_artifact_dict[artifact_dir]
+
+    @classmethod
+    def load_or_fit(cls, artifact_dir, ntext_similarity_obj, dsc_issue_dict, comment_issue_dict, log_msg_repo_dict, hash_list, issue_id_list):
+        """
+        Load the artifact if it exists. Otherwise, fit and save it.
+        """
+        if exists(artifact_dir):
+            artifact = cls.load(artifact_dir)
+            assert artifact.tokenizer==ntext_similarity_obj.tokenizer, "The TF-IDF artifact {0} was built with the {1} tokenizer, not {2}".format(
+                artifact_dir, artifact.tokenizer, ntext_similarity_obj.tokenizer)
+            return artifact
+
+        artifact = cls.fit(ntext_similarity_obj, dsc_issue_dict, comment_issue_dict, log_msg_repo_dict, hash_list, issue_id_list)
+        artifact.save(artifact_dir)
+        return artifact
+
+    def vectorizer(self):
+        """
+        Return a TfidfVectorizer with the fitted vocabulary and idf (to transform other preprocessed texts)
+        """
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        vectorizer = TfidfVectorizer(vocabulary={term: idx for idx, term in enumerate(self.vocabulary.tolist())})
+        vectorizer.fit([""])
+        vectorizer.idf_ = self.idf
+        return vectorizer
+
+    def get_commit_matrix(self, hash_list):
+        """
+        Return the tfidf vectors of commits (hash_list must be the same with the hash list of the artifact)
+        """
+        assert len(hash_list)==len(self.hash_list) and list(hash_list)==self.hash_list, "hash_list is different from the TF-IDF artifact"
+        return self.commit_matrix
+
+    def get_normalized_commit_matrix(self, hash_list):
+        """
+        Return the L2-normalized tfidf vectors of commits (computed once)
+        """
+        commit_matrix = self.get_commit_matrix(hash_list)
+        if self.normalized_commit_matrix is None:
+            from sklearn.preprocessing import normalize
+
+            self.normalized_commit_matrix = normalize(commit_matrix, copy=True)
+        return self.normalized_commit_matrix
+
+    def get_issue_matrix(self, issue_id_list):
+        """
+        Return the tfidf vectors of issues (rows in the order of issue_id_list)
+        """
+        return self.issue_matrix[[self._issue_row_dict[issue_id] for issue_id in issue_id_list]]
+
+
+class SharedTfidfArtifact:
+    def __init__(self, artifact_dir, shared_matrix_dict):
+        """
+        Matrices of a TF-IDF artifact in shared memory: the commit matrix, the L2-normalized commit matrix
+        (used by the matrix engine), and the issue matrix.
+        The worker processes (e.g., of Utils/shard_runner.py) call attach_shared(handle()) once and
+        use the matrices without copying them, so the memory of a worker does not grow with the number of workers.
+
+        Use it in a with statement (or call unlink()) so that the segments are removed also on failure.
+
+        Arguments:
+        artifact_dir [string] -- path to the artifact
+        shared_matrix_dict [dict<string, SharedCsrMatrix>] -- shared matrices
+        """
+        self.artifact_dir = os.path.abspath(artifact_dir)
+        self.shared_matrix_dict = shared_matrix_dict
+
+    @classmethod
+    def create(cls, artifact_dir):
+        from TS import shared_matrix
+
+        artifact = TfidfArtifact.load(artifact_dir)
+        shared_matrix_dict = {}
+        try:
+            for name, matrix in (("commit_matrix", artifact.commit_matrix),
+                                 ("normalized_commit_matrix", artifact.get_normalized_commit_matrix(artifact.hash_list)),
+                                 ("issue_matrix", artifact.issue_matrix)):
+                shared_matrix_dict[name] = shared_matrix.SharedCsrMatrix.create(matrix)
+        except Exception:
+            for shared in shared_matrix_dict.values():
+                shared.unlink()
+            raise
+        return cls(artifact_dir, shared_matrix_dict)
+
+    def handle(self):
+        return {'artifact_dir': self.artifact_dir,
+                'matrix_handle_dict': {name: shared.handle() for name, shared in self.shared_matrix_dict.items()}}
+
+    def unlink(self):
+        for shared in self.shared_matrix_dict.values():
+            shared.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.unlink()
@@ -0,0 +1,143 @@
+import functools
+import hashlib
+import os
+import sqlite3
+from string import punctuation
+
+from TS import nltk_resources
+from TS import regex_tokenizer
+
+
+class TokenNormalizer:
+    def __init__(self, max_cache_size=100000, lexicon_path=None, flush_size=10000, tokenizer="nltk"):
+        """
+        Map a (lower-cased) token to its normalized form in NtextSimilarity.preprocess_text:
+        - punctuation and stop words are removed (None)
+        - a word is replaced with the first lemma of its first synset in WordNet (if any)
+        - the word is stemmed with the Porter stemmer
+
+        The mapping of a token does not depend on the other tokens, so we compute it once for each token.
+        The results are kept in a bounded LRU cache, and optionally in an on-disk lexicon (sqlite3),
+        which can be shared by runs and by parallel iterations. The lexicon records the versions of NLTK, WordNet,
+        and the stop words (lexicon_version) and cannot be used with other versions.
+        NLTK is imported (and its resources are checked, TS/nltk_resources.py) when the first TokenNormalizer is made.
+
+        Arguments:
+        max_cache_size [int] -- maximum number of tokens in the LRU cache (None: unbounded)
+        lexicon_path [string] -- path to the lexicon database. if None, we do not use the lexicon
+        flush_size [int] -- number of new tokens kept in memory before writing them in the lexicon
+        tokenizer [string] -- "nltk": nltk.word_tokenize for word_tokenize
+                              "regex": TS/regex_tokenizer.py (one regex pass without punctuation, no punkt resource)
+        """
+        self.max_cache_size = max_cache_size
+        self.lexicon_path = lexicon_path
+        self.flush_size = flush_size
+
+        assert tokenizer in ("nltk", "regex"), "Illegal tokenizer: {0}".format(tokenizer)
+        nltk_resources.check_resources(tokenizer)
+        from nltk.corpus import stopwords
+        from nltk.corpus import wordnet
+        from nltk.stem import PorterStemmer
+
+        self.stop_words = set(stopwords.words("english"))
+        self.wordnet = wordnet
+        self.ps = PorterStemmer()
+        if tokenizer=="nltk":
+            from nltk.tokenize import word_tokenize
+            self.word_tokenize = word_tokenize
+        else:
+            self.word_tokenize = regex_tokenizer.tokenize
+
+        self._conn = None
+        self._new_token_list = []
+        self.normalize_token = functools.lru_cache(maxsize=max_cache_size)(self._normalize_token)
+
+    def compute(self, word):
+        """
+        Normalize a token with NLTK (the same processing as the original preprocess_text)
+
+        Returns:
+        normalized_word [string] -- normalized word. None if the word is removed
+        """
+        if word in punctuation: # remove punctuation (note: substrings of the punctuation string are removed)
+            return None
+        if word in self.stop_words: # filtering out stop words
+            return None
+        syns = self.wordnet.synsets(word)
+        if len(syns)!=0:
+            word = syns[0].lemmas()[0].name() # if there exist synonymous, use the first one
+        return self.ps.stem(word)
+
+    def lexicon_version(self):
+        """
+        Return the versions of NLTK (the Porter stemmer), WordNet, and the stop words, which the normalized tokens depend on
+        """
+        import nltk
+
+        stop_word_digest = hashlib.blake2b("\n".join(sorted(self.stop_words)).encode("utf-8"), digest_size=8).hexdigest()
+        return "nltk {0}, wordnet {1}, stopwords {2}".format(nltk.__version__, self.wordnet.get_version(), stop_word_digest)
+
+    def _connect(self):
+        if self._conn is None:
+            lexicon_dir = os.path.dirname(self.lexicon_path)
+            if lexicon_dir:
+                os.makedirs(lexicon_dir, exist_ok=True)
+            conn = sqlite3.connect(self.lexicon_path, timeout=60)
+            conn.execute('CREATE TABLE IF NOT EXISTS lexicon (token TEXT PRIMARY KEY, normalized TEXT);')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);')
+            conn.commit()
+
+            # the version is written by the first run (a lexicon with tokens but no version was made before the version was recorded)
+            version = self.lexicon_version()
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) SELECT 'version', ? WHERE NOT EXISTS (SELECT 1 FROM lexicon);", (version,))
+            conn.commit()
+            row = conn.execute("SELECT value FROM meta WHERE key='version';").fetchone()
+            lexicon_version = "unknown versions" if row is None else row[0]
+            if lexicon_version!=version:
+                conn.close()
+            assert lexicon_version==version, "The lexicon {0} was built with {1}, not {2}. Delete it or use another lexicon_path".format(
+                self.lexicon_path, lexicon_version, version)
+            self._conn = conn
+        return self._conn
+
+    def _normalize_token(self, word):
+        if self.lexicon_path is None:
+            return self.compute(word)
+
+        row = self._connect().execute('SELECT normalized FROM lexicon WHERE token=?;', (word,)).fetchone()
+        if not row is None:
+            return row[0]
+
+        normalized_word = self.compute(word)
+        self._new_token_list.append((word, normalized_word))
+        if len(self._new_token_list) >= self.flush_size:
+            self.flush()
+        return normalized_word
+
+    def normalize_tokens(self, word_tokens):
+        """
+        Arguments:
+        word_tokens [list<string>] -- tokens of a lower-cased text
+
+        Returns:
+        normalized_tokens [list<string>] -- normalized tokens (removed tokens are skipped)
+        """
+        normalize_token = self.normalize_token
+        return [normalized_word for normalized_word in map(normalize_token, word_tokens) if not normalized_word is None]
+
+    def flush(self):
+        """
+        Write the new tokens in the lexicon
+        """
+        if len(self._new_token_list)==0:
+            return
+        conn = self._connect()
+        conn.executemany('INSERT OR IGNORE INTO lexicon (token, normalized) VALUES (?, ?);', self._new_token_list)
+        conn.commit()
+        self._new_token_list = []
+
+    def close(self):
+        self.flush()
+        if not self._conn is None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,268 @@
+import atexit
+import os
+import queue
+import subprocess
+import threading
+from contextlib import contextmanager
+
+
+class GitObjectMissing(subprocess.CalledProcessError):
+    """
+    Raised when git cat-file cannot resolve an object name.
+    This is a CalledProcessError so that code written for the old
+    `git show` based accessors (which catch CalledProcessError for
+    newly added files) keeps working.
+    """
+    def __init__(self, repodir, obj_name, reason):
+        super().__init__(128, ['git', '-C', repodir, 'cat-file', '--batch'],
+                         output="{0} {1}".format(obj_name, reason))
+        self.obj_name = obj_name
+        self.reason = reason
+
+    def __str__(self):
+        return "git cat-file: {0} is {1}".format(self.obj_name, self.reason)
+
+
+class CatFileReader:
+    def __init__(self, repodir):
+        """
+        Keep `git cat-file --batch` and `git cat-file --batch-check` processes
+        open for a repository and serve object lookups over their pipes.
+        Objects are named as in `git rev-parse`, e.g., "{commit hash}^:{file path}".
+
+        The processes are started lazily (at the first lookup) and stopped by close().
+        A reader is not shared between threads; use CatFileReaderPool for threaded callers.
+
+        Arguments:
+        repodir [string] -- path to the repository
+        """
+        self.repodir = repodir
+        self._batch = None
+        self._batch_check = None
+
+    def _start(self, option):
+        return subprocess.Popen(['git', '-C', '{}'.format(self.repodir), 'cat-file', option],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def _request(self, proc, obj_name):
+        """
+        Send an object name to a cat-file process and return its header fields
+        [oid, type, size]. Raise GitObjectMissing if git cannot resolve the name.
+        """
+        if "\n" in obj_name:
+            raise ValueError("object name must not contain a newline: {0!r}".format(obj_name))
+
+        proc.stdin.write(obj_name.encode('utf-8') + b"\n")
+        proc.stdin.flush()
+        header = proc.stdout.readline()
+        if not header:
+            raise RuntimeError("git cat-file exited unexpectedly in {0}".format(self.repodir))
+
+        fields = header.decode('utf-8', 'replace').rstrip("\n").rsplit(" ", 2)
+        if len(fields) != 3 or not fields[2].isdigit():
+            # "<object> missing" or "<object> ambiguous"
+            raise GitObjectMissing(self.repodir, obj_name, fields[-1])
+        return fields
+
+    def object_info(self, obj_name):
+        """
+        Look up the object id, type and size without reading the content (--batch-check).
+
+        Arguments:
+        obj_name [string] -- object name, e.g., "{commit hash}:{file path}"
+
+        Returns:
+        oid [string] -- object id
+        obj_type [string] -- blob, tree, commit or tag
+        size [int] -- object size in bytes
+        """
+        if self._batch_check is None:
+            self._batch_check = self._start('--batch-check')
+        oid, obj_type, size = self._request(self._batch_check, obj_name)
+        return oid, obj_type, int(size)
+
+    def exists(self, obj_name):
+        try:
+            self.object_info(obj_name)
+        except GitObjectMissing:
+            return False
+        return True
+
+    def read_object(self, obj_name):
+        """
+        Read an object (--batch).
+
+        Arguments:
+        obj_name [string] -- object name, e.g., "{commit hash}:{file path}"
+
+        Returns:
+        obj_type [string] -- blob, tree, commit or tag
+        content [bytes] -- raw object content
+        """
+        oid, obj_type, content = self._read(obj_name)
+        return obj_type, content
+
+    def _read(self, obj_name):
+        if self._batch is None:
+            self._batch = self._start('--batch')
+        oid, obj_type, size = self._request(self._batch, obj_name)
+        content = self._batch.stdout.read(int(size))
+        self._batch.stdout.read(1) # trailing LF
+        return oid, obj_type, content
+
+    def read_blob(self, obj_name):
+        obj_type, content = self.read_object(obj_name)
+        if obj_type != "blob":
+            raise ValueError("{0} is a {1}, not a blob".format(obj_name, obj_type))
+        return content
+
+    def read_tree(self, obj_name):
+        """
+        Read a tree object and parse its entries.
+
+        Arguments:
+        obj_name [string] -- object name, e.g., "{commit hash}:{directory path}"
+
+        Returns:
+        entry_list [list<tuple<mode, type, oid, name>>] -- entries of the tree (the same order with git ls-tree)
+        """
+        oid, obj_type, content = self._read(obj_name)
+        if obj_type != "tree":
+            raise ValueError("{0} is a {1}, not a tree".format(obj_name, obj_type))
+
+        oid_len = len(oid)//2
+        entry_list = []
+        pos = 0
+        while pos < len(content):
+            sep = content.index(b" ", pos)
+            mode = content[pos:sep].decode('ascii')
+            end = content.index(b"\0", sep)
+            name = content[sep+1:end].decode('utf-8', 'surrogateescape')
+            oid = content[end+1:end+1+oid_len].hex()
+            pos = end + 1 + oid_len
+
+            if mode == "40000":
+                entry_type = "tree"
+            elif mode == "160000":
+                entry_type = "commit"
+            else:
+                entry_type = "blob"
+            entry_list.append((mode.zfill(6), entry_type, oid, name))
+        return entry_list
+
+    def close(self):
+        for proc in (self._batch, self._batch_check):
+            if proc is None:
+                continue
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+            proc.wait()
+            proc.stdout.close()
+        self._batch = None
+        self._batch_check = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CatFileReaderPool:
+    def __init__(self, repodir, max_readers=4):
+        """
+        A bounded pool of CatFileReader for threaded callers.
+        Readers are created on demand up to max_readers; a thread that asks for
+        a reader while all of them are in use waits until one is released.
+
+        Arguments:
+        repodir [string] -- path to the repository
+        max_readers [int] -- maximum number of reader (pairs of cat-file processes)
+        """
+        self.repodir = repodir
+        self.max_readers = max_readers
+        self._idle = queue.LifoQueue()
+        self._num_readers = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def reader(self):
+        try:
+            reader = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create_flag = self._num_readers < self.max_readers
+                if create_flag:
+                    self._num_readers += 1
+            reader = CatFileReader(self.repodir) if create_flag else self._idle.get()
+
+        try:
+            yield reader
+        except (GitObjectMissing, ValueError):
+            raise
+        except BaseException:
+            # the pipes may be out of sync; restart the processes at the next lookup
+            reader.close()
+            raise
+        finally:
+            self._idle.put(reader)
+
+    def read_object(self, obj_name):
+        with self.reader() as reader:
+            return reader.read_object(obj_name)
+
+    def read_blob(self, obj_name):
+        with self.reader() as reader:
+            return reader.read_blob(obj_name)
+
+    def read_tree(self, obj_name):
+        with self.reader() as reader:
+            return reader.read_tree(obj_name)
+
+    def object_info(self, obj_name):
+        with self.reader() as reader:
+            return reader.object_info(obj_name)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._num_readers = 0
+
+
+_pool_dict = {}
+_pool_dict_lock = threading.Lock()
+
+def get_reader_pool(repodir, max_readers=4):
+    """
+    Return the shared CatFileReaderPool of a repository (created at the first call).
+    """
+    with _pool_dict_lock:
+        if not repodir in _pool_dict:
+            _pool_dict[repodir] = CatFileReaderPool(repodir, max_readers=max_readers)
+        return _pool_dict[repodir]
+
+def _forget_pools_in_child():
+    """
+    A forked child (e.g., a worker of ProcessPoolExecutor) inherits the pipes of the parent's cat-file processes.
+    It must not use them (the parent and the children would read each other's objects), so the child forgets
+    the pools without closing the processes, and starts its own processes at its first lookup.
+    """
+    global _pool_dict, _pool_dict_lock
+    _pool_dict = {}
+    _pool_dict_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_pools_in_child)
+
+@atexit.register
+def close_all_pools():
+    with _pool_dict_lock:
+        for pool in _pool_dict.values():
+            pool.close()
+        _pool_dict.clear()
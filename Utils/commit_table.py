@@ -0,0 +1,195 @@
+import os
+from collections.abc import Mapping
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from Utils import util
+
+
+DATE_KEY_LIST = ['author_date', 'commit_date']
+NO_DATE = np.iinfo(np.int64).min
+
+
+class CommitTable:
+    def __init__(self, hash_array, order, date_dict, tz_dict, issue_indptr, issue_code, issue_vocab):
+        """
+        Columnar version of the log message info (date_repo_dict).
+        Rows are sorted by commit hash, so the hash -> row index is a binary search
+        on hash_array (no dict is built). Each column is a numpy array and
+        a table saved by save() can be opened with mmap_mode='r'.
+
+        Arguments:
+        hash_array [np.array<bytes>] -- commit hashes (sorted)
+        order [np.array<int64>] -- row indices in the original order (the order of git log)
+        date_dict [dict<date key, np.array<int64>>] -- epoch seconds for author_date and commit_date (NO_DATE if None)
+        tz_dict [dict<date key, np.array<int32>>] -- utc offset seconds for author_date and commit_date
+        issue_indptr [np.array<int64>] -- issue ids of row i are issue_vocab[issue_code[issue_indptr[i]:issue_indptr[i+1]]]
+        issue_code [np.array<int32>] -- indices of issue_vocab
+        issue_vocab [np.array<str>] -- all issue ids
+        """
+        self.hash_array = hash_array
+        self.order = order
+        self.date_dict = date_dict
+        self.tz_dict = tz_dict
+        self.issue_indptr = issue_indptr
+        self.issue_code = issue_code
+        self.issue_vocab = issue_vocab
+
+        self._tz_cache = {}
+
+    def __len__(self):
+        return len(self.hash_array)
+
+    @classmethod
+    def from_dict(cls, date_repo_dict):
+        """
+        Arguments:
+        date_repo_dict [dict<commit hash, dict<key name, data>>] -- key name list: author_date, commit_date, issue_id
+        """
+        hash_list = list(date_repo_dict.keys())
+        num_hash = len(hash_list)
+        width = max([len(commit_hash) for commit_hash in hash_list], default=40)
+        org_hash_array = np.array([commit_hash.encode('ascii') for commit_hash in hash_list], dtype="S{0}".format(width))
+        sort_idx = np.argsort(org_hash_array, kind='stable')
+        order = np.empty(num_hash, dtype=np.int64)
+        order[sort_idx] = np.arange(num_hash, dtype=np.int64)
+
+        date_dict = {}
+        tz_dict = {}
+        for key in DATE_KEY_LIST:
+            epoch_array = np.full(num_hash, NO_DATE, dtype=np.int64)
+            tz_array = np.zeros(num_hash, dtype=np.int32)
+            for row, commit_hash in enumerate(hash_list):
+                date = date_repo_dict[commit_hash][key]
+                if date is None:
+                    continue
+                assert date.microsecond==0, "git dates do not have microseconds: {0}".format(commit_hash)
+                epoch_array[row] = int(date.timestamp())
+                tz_array[row] = int(date.utcoffset().total_seconds())
+            date_dict[key] = epoch_array[sort_idx]
+            tz_dict[key] = tz_array[sort_idx]
+
+        issue_vocab_dict = {}
+        issue_code = []
+        issue_indptr = np.zeros(num_hash+1, dtype=np.int64)
+        for row, org_row in enumerate(sort_idx):
+            for issue_id in sorted(date_repo_dict[hash_list[org_row]]['issue_id']):
+                if not issue_id in issue_vocab_dict:
+                    issue_vocab_dict[issue_id] = len(issue_vocab_dict)
+                issue_code.append(issue_vocab_dict[issue_id])
+            issue_indptr[row+1] = len(issue_code)
+
+        return cls(org_hash_array[sort_idx], order, date_dict, tz_dict, issue_indptr,
+                   np.array(issue_code, dtype=np.int32), np.array(list(issue_vocab_dict.keys()), dtype=str))
+
+    @classmethod
+    def from_pickle(cls, log_message_info_path):
+        return cls.from_dict(util.load_pickle(log_message_info_path))
+
+    def save(self, table_dir):
+        os.makedirs(table_dir, exist_ok=True)
+        array_dict = {'hash': self.hash_array, 'order': self.order, 'issue_indptr': self.issue_indptr,
+                      'issue_code': self.issue_code, 'issue_vocab': self.issue_vocab}
+        for key in DATE_KEY_LIST:
+            array_dict[key] = self.date_dict[key]
+            array_dict["{0}_tz".format(key)] = self.tz_dict[key]
+        for name, array in array_dict.items():
+            np.save(os.path.join(table_dir, "{0}.npy".format(name)), array)
+
+    @classmethod
+    def load(cls, table_dir, mmap_mode='r'):
+        def _load(name):
+            return np.load(os.path.join(table_dir, "{0}.npy".format(name)), mmap_mode=mmap_mode)
+
+        return cls(_load('hash'), _load('order'),
+                   {key: _load(key) for key in DATE_KEY_LIST},
+                   {key: _load("{0}_tz".format(key)) for key in DATE_KEY_LIST},
+                   _load('issue_indptr'), _load('issue_code'), np.load(os.path.join(table_dir, "issue_vocab.npy")))
+
+    def rows(self, hash_list):
+        """
+        Return the row indices of commit hashes
+
+        Arguments:
+        hash_list [list<commit hash>] -- commit hashes
+
+        Returns:
+        row_array [np.array<int64>] -- row index for each commit hash
+        """
+        key_array = np.array([commit_hash.encode('ascii') for commit_hash in hash_list], dtype=self.hash_array.dtype)
+        row_array = np.searchsorted(self.hash_array, key_array)
+        found = row_array < len(self.hash_array)
+        found[found] = self.hash_array[row_array[found]] == key_array[found]
+        if not found.all():
+            raise KeyError(hash_list[int(np.argmin(found))])
+        return row_array
+
+    def row(self, commit_hash):
+        return int(self.rows([commit_hash])[0])
+
+    def hash(self, row):
+        return self.hash_array[row].decode('ascii')
+
+    def epoch(self, key, hash_list=None):
+        """
+        Return the epoch seconds of a date key (author_date or commit_date)
+        for each commit hash in hash_list (all rows in the table order if None)
+        """
+        if hash_list is None:
+            return np.asarray(self.date_dict[key])
+        return np.asarray(self.date_dict[key])[self.rows(hash_list)]
+
+    def date(self, key, row):
+        epoch = int(self.date_dict[key][row])
+        if epoch == NO_DATE:
+            return None
+        offset = int(self.tz_dict[key][row])
+        if not offset in self._tz_cache:
+            self._tz_cache[offset] = timezone(timedelta(seconds=offset))
+        return datetime.fromtimestamp(epoch, self._tz_cache[offset])
+
+    def issue_ids(self, row):
+        codes = self.issue_code[self.issue_indptr[row]:self.issue_indptr[row+1]]
+        return set(self.issue_vocab[codes].tolist())
+
+    def row_dict(self, row):
+        return {'issue_id': self.issue_ids(row),
+                'author_date': self.date('author_date', row),
+                'commit_date': self.date('commit_date', row)}
+
+    def dict_view(self):
+        return CommitTableDictView(self)
+
+    def to_dict(self):
+        return {self.hash(row): self.row_dict(row) for row in self.order}
+
+
+class CommitTableDictView(Mapping):
+    def __init__(self, table):
+        """
+        Read-only dict<commit hash, dict<key name, data>> view of a CommitTable.
+        It behaves as the old log_message_info pickle (date_repo_dict), but
+        the row dict of a commit is built only when the commit is looked up.
+        """
+        self.table = table
+        self._row_cache = {}
+
+    def __getitem__(self, commit_hash):
+        if not commit_hash in self._row_cache:
+            self._row_cache[commit_hash] = self.table.row_dict(self.table.row(commit_hash))
+        return self._row_cache[commit_hash]
+
+    def __contains__(self, commit_hash):
+        try:
+            self.table.row(commit_hash)
+        except (KeyError, UnicodeEncodeError):
+            return False
+        return True
+
+    def __iter__(self):
+        for row in self.table.order:
+            yield self.table.hash(row)
+
+    def __len__(self):
+        return len(self.table)
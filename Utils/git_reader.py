@@ -3,6 +3,9 @@ import subprocess
 import sys
 import re
 from datetime import datetime as dt
+from datetime import timedelta, timezone
+
+from Utils import cat_file_reader
 
 """
 Get commit hash list (following time flow)
@@ -88,6 +91,77 @@ def git_log_all_without_merge(dirname):
     return log
 
 
+"""
+Iterate over all logs one commit at a time.
+We read `git log -z` with a NUL separated --pretty=format from the pipe,
+so the memory usage does not depend on the size of the history.
+"""
+def iter_git_log(dirname, no_merges=False, rev_list=None):
+    """
+    Arguments:
+    dirname [string] -- path to repository
+    no_merges [bool] -- if True, skip merge commits (--no-merges)
+    rev_list [list<string>] -- revisions given to git log through --stdin (e.g., [new tip, "^old tip"]). if None, we use --all
+
+    Yields:
+    record [dict<key name, data>] -- key name list: commit_hash, parent_list, author_date, commit_date, message
+                                     author_date and commit_date are datetime objects; message is the raw message (%B)
+    """
+    command = ['git', '-C', '{}'.format(dirname), 'log', '-z', '--date=raw',
+               '--pretty=format:%H%x1f%P%x1f%ad%x1f%cd%x1f%B']
+    if no_merges:
+        command.append('--no-merges')
+    if rev_list is None:
+        command.append('--all')
+    else:
+        command.append('--stdin')
+    command.append('--')
+
+    for token in _iter_nul_separated(command, stdin_list=rev_list):
+        commit_hash, parents, author_date, commit_date, message = token.decode('utf-8', 'replace').split("\x1f", 4)
+        yield {'commit_hash': commit_hash,
+               'parent_list': parents.split(),
+               'author_date': parse_raw_date(author_date),
+               'commit_date': parse_raw_date(commit_date),
+               'message': message}
+
+def parse_raw_date(raw_date):
+    """
+    Convert a date in --date=raw format (e.g., "1592614800 +0900") to a datetime object
+    """
+    timestamp, offset = raw_date.split()
+    sign = -1 if offset[0] == "-" else 1
+    tz = timezone(sign*timedelta(hours=int(offset[1:3]), minutes=int(offset[3:5])))
+    return dt.fromtimestamp(int(timestamp), tz)
+
+def format_fuller_message(message):
+    """
+    Return the rows of a commit message as `git log --pretty=fuller` shows them.
+    Concretely, git skips the leading blank lines, removes the trailing whitespace of each line,
+    expands tabs, indents each line by four spaces, and removes the trailing blank lines.
+    The rows are split in the same way as git_log_all(...).splitlines()
+
+    Arguments:
+    message [string] -- raw commit message (%B)
+
+    Returns:
+    row_list [list<string>] -- rows of the message
+    """
+    row_list = []
+    for line in message.split("\n"):
+        line = line.rstrip(" \t\r\n")
+        if not line and not row_list:
+            continue
+        row_list.append("    " + line.expandtabs(8))
+    while row_list and not row_list[-1].strip(" \t\r\n"):
+        row_list.pop()
+
+    text = "\n".join(row_list)
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text.splitlines()
+
+
 """
 Get all modified files (that exist in the previous commit already) in a commit.
 if it is a new added file in that commit, (e.g., 
@@ -113,37 +187,197 @@ def get_all_modified_files(repodir, commit_hash):
     
     return files
 
+def _iter_nul_separated(command, chunk_size=1 << 16, stdin_list=None):
+    """
+    Run a git command and yield its NUL separated output tokens (bytes) one by one
+    without buffering the whole output.
+    If stdin_list is given, each element is written to the stdin of the command as a line
+    (git reads all of them before it starts writing its output).
+    """
+    if stdin_list is None:
+        proc = subprocess.Popen(command, stdout=subprocess.PIPE)
+    else:
+        proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        proc.stdin.write("".join([row + "\n" for row in stdin_list]).encode('utf-8'))
+        proc.stdin.close()
+    try:
+        rest = b""
+        while True:
+            chunk = proc.stdout.read(chunk_size)
+            if not chunk:
+                break
+            token_list = (rest + chunk).split(b"\0")
+            rest = token_list.pop()
+            for token in token_list:
+                yield token
+        if rest:
+            yield rest
+    finally:
+        proc.stdout.close()
+        return_code = proc.wait()
+    if return_code != 0:
+        raise subprocess.CalledProcessError(return_code, command)
+
+
+_C_QUOTE_DICT = {0x07: "\\a", 0x08: "\\b", 0x09: "\\t", 0x0a: "\\n", 0x0b: "\\v",
+                 0x0c: "\\f", 0x0d: "\\r", 0x22: '\\"', 0x5c: "\\\\"}
+
+def quote_path(raw_path):
+    """
+    Quote a path in the same way as git does without -z (core.quotePath=true).
+    E.g., b'caf\\xc3\\xa9.md' -> '"caf\\\\303\\\\251.md"'
+    """
+    if all(0x20 <= c < 0x7f and c != 0x22 and c != 0x5c for c in raw_path):
+        return raw_path.decode('ascii')
+
+    quoted = []
+    for c in raw_path:
+        if c in _C_QUOTE_DICT:
+            quoted.append(_C_QUOTE_DICT[c])
+        elif c < 0x20 or c >= 0x7f:
+            quoted.append("\\{0:03o}".format(c))
+        else:
+            quoted.append(chr(c))
+    return '"{0}"'.format("".join(quoted))
+
+"""
+Get all modified files for every commit in the repository with one git log process.
+The semantics is the same as get_all_modified_files (git diff-tree -r --diff-filter=ACMRTUX):
+- merge commits and the root commit have no modified files
+- renames are not detected (a renamed file appears as an added file)
+The status filter is applied here instead of git's --diff-filter, since git log
+drops the commits without any matching file and we need to know that such commits were covered.
+"""
+def get_all_modified_files_all_commits(repodir):
+    command = ['git', '-c', 'log.showRoot=false', '-C', '{}'.format(repodir), 'log', '--all',
+               '--no-renames', '--name-status', '-z', '--pretty=format:%H']
+
+    return_dict = {}
+    cur_file_list = None
+    status = None
+    state = "header"
+    for token in _iter_nul_separated(command):
+        if state == "header":
+            if token == b"":
+                continue
+            commit_hash, sep, status = token.decode('ascii').partition("\n")
+            cur_file_list = []
+            return_dict[commit_hash] = cur_file_list
+            if sep:
+                state = "path"
+                num_path = 2 if status[0] in "RC" else 1
+        elif state == "path":
+            num_path -= 1
+            if num_path > 0:
+                continue
+            if status[0] in "ACMRTUX":
+                cur_file_list.append(quote_path(token))
+            state = "status"
+        else:
+            if token == b"":
+                state = "header"
+                continue
+            status = token.decode('ascii')
+            num_path = 2 if status[0] in "RC" else 1
+            state = "path"
+
+    return return_dict
+
+"""
+Get the tip of every ref (and HEAD)
+"""
+def get_ref_tips(repodir):
+    ref_list = subprocess.check_output(
+            ['git', '-C', '{}'.format(repodir), 'for-each-ref', '--format=%(objectname) %(refname)'],
+            universal_newlines=True
+            ).splitlines()
+
+    return_dict = {}
+    for row in ref_list:
+        oid, refname = row.split(" ", 1)
+        return_dict[refname] = oid
+
+    try:
+        return_dict['HEAD'] = subprocess.check_output(
+                ['git', '-C', '{}'.format(repodir), 'rev-parse', '--verify', '-q', 'HEAD'],
+                universal_newlines=True
+                ).strip()
+    except subprocess.CalledProcessError:
+        pass # unborn branch
+
+    return return_dict
+
+def count_unreachable_commits(repodir, old_tip_list, new_tip_list):
+    """
+    Count the commits that are reachable from old_tip_list but not from new_tip_list.
+    If it is not 0, some history was rewritten (e.g., force-push) or dropped (e.g., deleted branch).
+    If an old tip does not exist anymore, git fails and we raise subprocess.CalledProcessError.
+
+    Arguments:
+    repodir [string] -- path to repository
+    old_tip_list [list<commit hash>] -- ref tips in the previous run
+    new_tip_list [list<commit hash>] -- current ref tips
+
+    Returns:
+    num_commit [int] -- number of the commits
+    """
+    rev_list = list(old_tip_list) + ["^{0}".format(tip) for tip in new_tip_list]
+    num_commit = subprocess.check_output(
+            ['git', '-C', '{}'.format(repodir), 'rev-list', '--count', '--stdin'],
+            input="".join([row + "\n" for row in rev_list]),
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True
+            )
+    return int(num_commit)
+
+def get_git_dir(repodir):
+    return subprocess.check_output(
+            ['git', '-C', '{}'.format(repodir), 'rev-parse', '--absolute-git-dir'],
+            universal_newlines=True
+            ).strip()
+
+
 """
 Get the content of a file in a specific commit.
 Here we retrieve the content before applying the modification in this commit
-if it is a newly added commit (/dev/null), return "fatal: Invalid object name '{commit hash}^'."
+if it is a newly added commit (/dev/null), raise cat_file_reader.GitObjectMissing
+(a subprocess.CalledProcessError as `git show` did).
+
+The content is read through the shared `git cat-file --batch` processes
+of this repository (see Utils/cat_file_reader.py), not by a new `git show` process.
 """
 def get_entier_file(repodir, commit_hash, f_path):
-    try:
-        content = subprocess.check_output(
-                ['git', '-C', '{}'.format(repodir), 'show', '{0}^:{1}'.format(commit_hash, f_path)],
-                universal_newlines=True
-                )
-    except UnicodeDecodeError:
-        content = subprocess.check_output(
-                ['git', '-C', '{}'.format(repodir), 'show', '{0}^:{1}'.format(commit_hash, f_path)]
-                ).decode('utf-8','replace')
-    
-    return content
+    return show_object(repodir, '{0}^:{1}'.format(commit_hash, f_path))
 
 
 def get_cur_entier_file(repodir, commit_hash, f_path):
+    return show_object(repodir, '{0}:{1}'.format(commit_hash, f_path))
+
+def show_object(repodir, obj_name):
+    """
+    Return the same text with `git show {obj_name}` for a blob or a tree.
+
+    Arguments:
+    repodir [string] -- path to repository
+    obj_name [string] -- object name, e.g., "{commit hash}:{file path}"
+
+    Returns:
+    content [string] -- content of the object
+    """
+    pool = cat_file_reader.get_reader_pool(repodir)
+    obj_type, content = pool.read_object(obj_name)
+    if obj_type == "tree":
+        # git show lists the entries of a tree
+        entry_list = pool.read_tree(obj_name)
+        names = [name + "/" if entry_type == "tree" else name for mode, entry_type, oid, name in entry_list]
+        return "tree {0}\n\n".format(obj_name) + "".join([name + "\n" for name in names])
+
     try:
-        content = subprocess.check_output(
-                ['git', '-C', '{}'.format(repodir), 'show', '{0}:{1}'.format(commit_hash, f_path)],
-                universal_newlines=True
-                )
+        content = content.decode('utf-8')
     except UnicodeDecodeError:
-        content = subprocess.check_output(
-                ['git', '-C', '{}'.format(repodir), 'show', '{0}:{1}'.format(commit_hash, f_path)]
-                ).decode('utf-8','replace')
-    
-    return content
+        return content.decode('utf-8','replace')
+    # same with universal_newlines=True
+    return content.replace('\r\n', '\n').replace('\r', '\n')
 
 def ignore_somecode(text):
     """
@@ -0,0 +1,84 @@
+import hashlib
+import os
+
+from Utils import util
+from Utils import git_reader
+
+
+def get_ref_state_key(repodir):
+    """
+    Return a key that identifies the current state of HEAD and all refs.
+    The key changes if any ref is created, deleted, or moved.
+
+    Arguments:
+    repodir [string] -- path to repository
+
+    Returns:
+    key [string] -- sha1 of the (refname, object id) list
+    """
+    ref_tips_dict = git_reader.get_ref_tips(repodir)
+    state = "\n".join(["{0} {1}".format(refname, ref_tips_dict[refname]) for refname in sorted(ref_tips_dict.keys())])
+    return hashlib.sha1(state.encode('utf-8')).hexdigest()
+
+
+def load_modified_file_index(repodir, index_dir=None, verbose=0):
+    """
+    Load the modified files of all the commits in the repository.
+    The index is stored as a pickle file keyed by the state of HEAD and refs, so
+    all ILAs (PH, MT, PU, and GS) share one `git log` execution per repository state.
+    If there is no index for the current state, we build it with
+    git_reader.get_all_modified_files_all_commits and store it.
+
+    Arguments:
+    repodir [string] -- path to repository
+    index_dir [string] -- directory to store the index. if None, we use {{ git dir }}/ila
+
+    Returns:
+    modified_file_repo_dict [dict<commit hash, list<modified files>>] -- modified files list for each commit hash
+    """
+    if index_dir is None:
+        index_dir = os.path.join(git_reader.get_git_dir(repodir), "ila")
+
+    index_path = os.path.join(index_dir, "modified_files_{0}.pickle".format(get_ref_state_key(repodir)))
+    if os.path.exists(index_path):
+        if verbose > 0:
+            print("Load modified files index: {0}".format(index_path))
+        return util.load_pickle(index_path)
+
+    if verbose > 0:
+        print("Build modified files index: {0}".format(index_path))
+    modified_file_repo_dict = git_reader.get_all_modified_files_all_commits(repodir)
+
+    os.makedirs(index_dir, exist_ok=True)
+    temp_path = "{0}.{1}.tmp".format(index_path, os.getpid())
+    util.dump_pickle(temp_path, modified_file_repo_dict)
+    os.replace(temp_path, index_path)
+
+    return modified_file_repo_dict
+
+
+def extract_modified_file_repo(repodir, hash_list, index_dir=None):
+    """
+    Extract all modified files for each commit hash in the (org) repository
+
+    Arguments:
+    repodir [string] -- path to repository
+    hash_list [list<commit hash>] -- studied commit hash list
+    index_dir [string] -- directory to store the index (see load_modified_file_index)
+
+    Returns:
+    return_dict [dict<commit hash, list<modified files>>] -- modified files list for each commit hash
+    """
+
+    print("Extract modified files")
+    modified_file_repo_dict = load_modified_file_index(repodir, index_dir=index_dir)
+
+    return_dict = {}
+    for commit_hash in hash_list:
+        if commit_hash in modified_file_repo_dict:
+            return_dict[commit_hash] = list(modified_file_repo_dict[commit_hash])
+        else:
+            # not reachable from any ref (or an abbreviated hash)
+            return_dict[commit_hash] = git_reader.get_all_modified_files(repodir, commit_hash)
+
+    return return_dict
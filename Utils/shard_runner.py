@@ -0,0 +1,236 @@
+import hashlib
+import heapq
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from Utils import util
+
+
+def partition_issue_id_list(issue_id_list, cost_list, num_shards):
+    """
+    Split issue ids into shards with the longest processing time first rule:
+    the most expensive issue is assigned to the shard with the smallest total cost.
+
+    Arguments:
+    issue_id_list [list<issue id>] -- issue ids
+    cost_list [list<float>] -- cost for each issue id (e.g., text length)
+    num_shards [int] -- number of shards
+
+    Returns:
+    shard_list [list<list<issue id>>] -- issue ids for each shard (the same order with issue_id_list in each shard)
+    """
+    shard_heap = [(0, idx_shard) for idx_shard in range(num_shards)]
+    shard_idx_list = [None]*len(issue_id_list)
+    for idx in sorted(range(len(issue_id_list)), key=lambda idx: (-cost_list[idx], idx)):
+        total_cost, idx_shard = heapq.heappop(shard_heap)
+        shard_idx_list[idx] = idx_shard
+        heapq.heappush(shard_heap, (total_cost + cost_list[idx], idx_shard))
+
+    shard_list = [[] for _ in range(num_shards)]
+    for idx, issue_id in enumerate(issue_id_list):
+        shard_list[shard_idx_list[idx]].append(issue_id)
+    return shard_list
+
+
+def text_length_cost(issue_id_list, dsc_issue_dict, comment_issue_dict):
+    """
+    Cost of each issue for TS, GS, and MT: the length of the description and comments (+1)
+    """
+    cost_list = []
+    for issue_id in issue_id_list:
+        cost = 1
+        for text_dict in (dsc_issue_dict, comment_issue_dict):
+            if not text_dict.get(issue_id) is None:
+                cost += len(text_dict[issue_id])
+        cost_list.append(cost)
+    return cost_list
+
+
+def input_digest(ila_class, ila_kwargs, hash_list, run_args):
+    """
+    Digest of the input of the shards except the issue ids: ila_class, ila_kwargs, hash_list, and run_args
+    (with the size and modification time of the files whose paths are in run_args, e.g., the log message pickle file)
+    """
+    file_stat_list = [(arg, os.stat(arg).st_size, os.stat(arg).st_mtime_ns) for arg in run_args if isinstance(arg, str) and os.path.isfile(arg)]
+    state = (ila_class.__module__, ila_class.__qualname__, ila_kwargs, list(hash_list), run_args, file_stat_list)
+    return hashlib.blake2b(pickle.dumps(state, protocol=4), digest_size=16).hexdigest()
+
+
+def _run_shard(ila_class, ila_kwargs, parallel_iteration, hash_list, issue_id_list, target_issue_id_list, run_args, result_path):
+    ila_obj = ila_class(parallel_iteration=parallel_iteration, **ila_kwargs)
+    issue2hash_dict = ila_obj.run(hash_list, issue_id_list, target_issue_id_list, *run_args)
+
+    temp_path = "{0}.{1}.tmp".format(result_path, os.getpid())
+    util.dump_pickle(temp_path, issue2hash_dict)
+    os.replace(temp_path, result_path) # done marker
+    return parallel_iteration
+
+
+class ShardRunner:
+    def __init__(self, ila_class, ila_kwargs=None, num_shards=25, n_jobs=4, work_dir="./data/shards", max_retry=2, shared_memory=0, verbose=0):
+        """
+        Run TS (NtextSimilarity), GS (Comment), or MT (NSDSimilarity) for all issues with parallel iterations
+        in a process pool, and merge their results.
+
+        The issues are split into num_shards shards with cost balancing (text length of each issue).
+        Shard k (k = 1, ..., num_shards) is run with parallel_iteration=k, so the similarity outputs
+        are the same as the manual parallel execution (e.g., cosine_similarity_dict_ite{{ k }}.pickle for PU
+        with max_iteration=num_shards).
+        The result of a shard is stored in {{ work_dir }}/issue2hash_ite{{ k }}.pickle when the shard finishes;
+        finished shards are not run again while the input is the same (get_partition), and failed (or crashed) shards
+        are retried up to max_retry times.
+
+        Arguments:
+        ila_class [class] -- NtextSimilarity, Comment, or NSDSimilarity
+        ila_kwargs [dict<string, value>] -- arguments of ila_class except parallel_iteration
+        num_shards [int] -- number of shards (parallel iterations)
+        n_jobs [int] -- number of processes
+        work_dir [string] -- directory to store the partition and the result of each shard
+        max_retry [int] -- maximum number of retries for a shard
+        shared_memory [int] -- if 1 (and ila_kwargs has tfidf_artifact_dir), the tfidf matrices of the artifact are placed
+                               in shared memory and the workers use them without copying (TS/tfidf_artifact.py).
+                               if the artifact does not exist, the first shard is run alone to build it.
+        """
+        self.ila_class = ila_class
+        self.ila_kwargs = {} if ila_kwargs is None else ila_kwargs
+        self.num_shards = num_shards
+        self.n_jobs = n_jobs
+        self.work_dir = work_dir
+        self.max_retry = max_retry
+        self.shared_memory = shared_memory
+        self.verbose = verbose
+
+    def result_path(self, parallel_iteration):
+        return os.path.join(self.work_dir, "issue2hash_ite{0}.pickle".format(parallel_iteration))
+
+    def get_partition(self, hash_list, issue_id_list, dsc_issue_dict, comment_issue_dict, run_args):
+        """
+        Return the issue ids of each shard. The partition is stored in the work directory with the digest of the other input
+        (input_digest), and reused while the issue id list and the digest are the same (the finished shards stay valid).
+        Otherwise, the results of the finished shards are removed.
+        """
+        partition_path = os.path.join(self.work_dir, "partition.pickle")
+        digest = input_digest(self.ila_class, self.ila_kwargs, hash_list, run_args)
+        if os.path.exists(partition_path):
+            partition = util.load_pickle(partition_path)
+            if partition['issue_id_list']==list(issue_id_list) and len(partition['shard_list'])==self.num_shards \
+               and partition.get('input_digest')==digest:
+                return partition['shard_list']
+            # the input was changed: the previous results are not valid anymore
+            for parallel_iteration in range(1, len(partition['shard_list'])+1):
+                if os.path.exists(self.result_path(parallel_iteration)):
+                    os.remove(self.result_path(parallel_iteration))
+
+        cost_list = text_length_cost(issue_id_list, dsc_issue_dict, comment_issue_dict)
+        shard_list = partition_issue_id_list(list(issue_id_list), cost_list, self.num_shards)
+        util.dump_pickle(partition_path, {'issue_id_list': list(issue_id_list), 'shard_list': shard_list, 'input_digest': digest})
+        return shard_list
+
+    def run(self, hash_list, issue_id_list, dsc_issue_dict, comment_issue_dict, run_args):
+        """
+        Arguments:
+        hash_list [list<commit hash>] -- studied commit hash list
+        issue_id_list [list<issue id>] -- studied issue id list (all of them are the target issues)
+        dsc_issue_dict [dict<issue id, description>] -- used for the cost of each issue
+        comment_issue_dict [dict<issue id, comments (a string)>] -- used for the cost of each issue
+        run_args [tuple] -- arguments of ila_class.run after target_issue_id_list, e.g.,
+                            (dsc_issue_dict, comment_issue_dict, log_message_without_issueid_path, output_dir) for NtextSimilarity
+
+        Returns:
+        issue2hash_dict [dict<issue id, list<commit hash>>] -- merged result of all shards
+        """
+        os.makedirs(self.work_dir, exist_ok=True)
+        shard_list = self.get_partition(hash_list, issue_id_list, dsc_issue_dict, comment_issue_dict, run_args)
+
+        pending_list = [parallel_iteration for parallel_iteration in range(1, self.num_shards+1)
+                        if not os.path.exists(self.result_path(parallel_iteration))]
+        if self.verbose > 0:
+            print("shard runner -- {0}/{1} shards to run".format(len(pending_list), self.num_shards))
+
+        tfidf_artifact_dir = self.ila_kwargs.get('tfidf_artifact_dir')
+        if self.shared_memory==0 or tfidf_artifact_dir is None or len(pending_list)==0:
+            self.run_pending(pending_list, shard_list, hash_list, issue_id_list, run_args)
+        else:
+            from TS import tfidf_artifact
+
+            if not tfidf_artifact.exists(tfidf_artifact_dir):
+                # the first shard fits and saves the artifact
+                self.run_pending(pending_list[:1], shard_list, hash_list, issue_id_list, run_args)
+                pending_list = pending_list[1:]
+            with tfidf_artifact.SharedTfidfArtifact.create(tfidf_artifact_dir) as shared_artifact:
+                self.run_pending(pending_list, shard_list, hash_list, issue_id_list, run_args,
+                                 initializer=tfidf_artifact.attach_shared, initargs=(shared_artifact.handle(),))
+
+        issue2hash_dict = self.merge()
+        return {issue_id: issue2hash_dict[issue_id] for issue_id in dict.fromkeys(issue_id_list) if issue_id in issue2hash_dict}
+
+    def run_pending(self, pending_list, shard_list, hash_list, issue_id_list, run_args, initializer=None, initargs=()):
+        """
+        Run the shards of pending_list in a process pool (with retries)
+
+        Arguments:
+        pending_list [list<int>] -- parallel iterations to run
+        shard_list [list<list<issue id>>] -- issue ids for each shard
+        initializer [function] -- initializer of the worker processes
+        initargs [tuple] -- arguments of initializer
+        """
+        for num_try in range(self.max_retry+1):
+            if len(pending_list)==0:
+                break
+            if num_try > 0 and self.verbose > 0:
+                print("shard runner -- retry {0}: {1}".format(num_try, pending_list))
+
+            try:
+                with ProcessPoolExecutor(max_workers=self.n_jobs, initializer=initializer, initargs=initargs) as executor:
+                    future_dict = {executor.submit(_run_shard, self.ila_class, self.ila_kwargs, parallel_iteration,
+                                                   hash_list, issue_id_list, shard_list[parallel_iteration-1], run_args,
+                                                   self.result_path(parallel_iteration)): parallel_iteration
+                                   for parallel_iteration in pending_list}
+                    for future in as_completed(future_dict):
+                        try:
+                            future.result()
+                            if self.verbose > 0:
+                                print("shard runner -- done: {0}".format(future_dict[future]))
+                        except Exception as e:
+                            print("shard runner -- failed: {0} ({1!r})".format(future_dict[future], e))
+            except BrokenProcessPool:
+                pass # a worker crashed; we check the done markers below
+            pending_list = [parallel_iteration for parallel_iteration in pending_list
+                            if not os.path.exists(self.result_path(parallel_iteration))]
+
+        assert len(pending_list)==0, "Shards failed after {0} retries: {1}".format(self.max_retry, pending_list)
+
+    def merge(self):
+        """
+        Merge the results of all shards
+
+        Returns:
+        issue2hash_dict [dict<issue id, list<commit hash>>] -- issue id to list of commit hashes
+        """
+        issue2hash_dict = {}
+        for parallel_iteration in range(1, self.num_shards+1):
+            for issue_id, hash_list in util.load_pickle(self.result_path(parallel_iteration)).items():
+                if not issue_id in issue2hash_dict:
+                    issue2hash_dict[issue_id] = []
+                issue2hash_dict[issue_id].extend(hash_list)
+        return issue2hash_dict
+
+    def merge_similarity(self, output_dir):
+        """
+        Merge the similarity outputs of all shards in output_dir
+
+        Returns:
+        cosine_similarity [SimilarityStore or dict<issue id, dict<commit hash, cosine similarity>>] --
+            the similarity store if the shards wrote it (it already has all shards). otherwise, the merged pickle files
+        """
+        from TS import similarity_store
+
+        if os.path.exists(similarity_store.get_store_dir(output_dir)):
+            return similarity_store.SimilarityStore(similarity_store.get_store_dir(output_dir))
+
+        cosine_similarity_dict = {}
+        for parallel_iteration in range(1, self.num_shards+1):
+            cosine_similarity_dict.update(util.load_pickle("{0}/cosine_similarity_dict_ite{1}.pickle".format(output_dir, parallel_iteration)))
+        return cosine_similarity_dict
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+
+def to_epoch_us(date):
+    """
+    Convert a datetime object to epoch microseconds (int).
+    We use microseconds so that the comparisons are exactly the same as those of datetime objects
+    (the issue dates have milliseconds). A naive datetime object is regarded as UTC.
+    """
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return (date - EPOCH)//ONE_MICROSECOND
+
+def timedelta_us(delta):
+    return delta//ONE_MICROSECOND
+
+
+def commit_epoch_array(date_repo_dict, hash_list, date_key):
+    """
+    Return the epoch microseconds of a date key for each commit hash
+
+    Arguments:
+    date_repo_dict [dict<commit hash, dict<key name, data>>] -- key name list: author_date, commit_date, author, committer, issue_id
+    hash_list [list<commit hash>] -- studied commit hash list
+    date_key [string] -- author_date or commit_date
+
+    Returns:
+    epoch_array [np.array<int64>] -- epoch microseconds (the same order with hash_list)
+    """
+    table = getattr(date_repo_dict, "table", None)
+    if table is not None:
+        # CommitTableDictView: read the column directly
+        return table.epoch(date_key, hash_list).astype(np.int64)*1000000
+
+    return np.array([to_epoch_us(date_repo_dict[commit_hash][date_key]) for commit_hash in hash_list], dtype=np.int64)
+
+def issue_epoch_array(date_issue_dict, issue_id_list, date_key):
+    """
+    Return the epoch microseconds of a date key for each issue id
+
+    Arguments:
+    date_issue_dict [dict<issue id, dict<date keyword, date (datetime object)>>] -- date keywords are created, updated, and resolutiondate
+    issue_id_list [list<issue id>] -- studied issue id list
+    date_key [string] -- created, updated, or resolutiondate
+
+    Returns:
+    epoch_array [np.array<int64>] -- epoch microseconds (the same order with issue_id_list)
+    """
+    return np.array([to_epoch_us(date_issue_dict[issue_id][date_key]) for issue_id in issue_id_list], dtype=np.int64)
+
+
+class Timeline:
+    def __init__(self, epoch_array):
+        """
+        Commit dates sorted once for interval queries
+
+        Arguments:
+        epoch_array [np.array<int64>] -- epoch microseconds for each commit (hash_list order)
+        """
+        self.order = np.argsort(epoch_array, kind='stable')
+        self.sorted_epoch = epoch_array[self.order]
+
+    def window(self, lower_array, upper_array):
+        """
+        Find the commits whose date is in [lower, upper] for each query
+
+        Arguments:
+        lower_array [np.array<int64>] -- lower bounds (epoch microseconds)
+        upper_array [np.array<int64>] -- upper bounds (epoch microseconds)
+
+        Returns:
+        lo_array [np.array<int64>] -- start position in self.order for each query
+        hi_array [np.array<int64>] -- end position in self.order for each query (the commits are self.order[lo:hi])
+        """
+        lo_array = np.searchsorted(self.sorted_epoch, lower_array, side='left')
+        hi_array = np.searchsorted(self.sorted_epoch, upper_array, side='right')
+        return lo_array, np.maximum(lo_array, hi_array)
+
+    def join(self, lower_array, upper_array):
+        """
+        Interval join between queries and commits
+
+        Returns:
+        query_idx [np.array<int64>] -- query index of each matched pair
+        commit_idx [np.array<int64>] -- commit index (hash_list order) of each matched pair
+        """
+        lo_array, hi_array = self.window(lower_array, upper_array)
+        count_array = hi_array - lo_array
+        query_idx = np.repeat(np.arange(len(lo_array), dtype=np.int64), count_array)
+        # position in self.order: lo of the query + rank within the query
+        offset_array = np.cumsum(count_array) - count_array
+        position = np.arange(count_array.sum(), dtype=np.int64) - np.repeat(offset_array - lo_array, count_array)
+        return query_idx, self.order[position]
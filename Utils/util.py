@@ -1,3 +1,4 @@
+import os
 import pickle
 import sqlite3
 import sys
@@ -17,6 +18,25 @@ def load_pickle(f_name):
     return data
 
 
+def load_log_message_info(log_message_info_path):
+    """
+    Load the log message info (date_repo_dict).
+
+    Arguments:
+    log_message_info_path [string] -- path to *_log_message_info.pickle, or a directory of
+                                      the CommitTable (Utils/commit_table.py) that is opened with mmap
+
+    Returns:
+    date_repo_dict [dict<commit hash, dict<key name, data>>] -- key name list: author_date, commit_date, issue_id
+                                                                 (a read-only dict view for a CommitTable)
+    """
+    if os.path.isdir(log_message_info_path):
+        from Utils import commit_table # numpy is needed only for the table
+        return commit_table.CommitTable.load(log_message_info_path).dict_view()
+
+    return load_pickle(log_message_info_path)
+
+
 def replace_cregit_hash_to_org(data_dict, hash_dict):
 
     return_dict = {}
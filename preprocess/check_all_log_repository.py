@@ -134,6 +134,37 @@ class ExtractCommitMessage:
 
         return return_dict
 
+    def parse_log_records(self, record_iter):
+        """
+        Same as parse_log, but read the commits one by one from git_reader.iter_git_log
+        instead of the whole `git log --pretty=fuller` output
+
+        Arguments:
+        record_iter [iterator<dict<key name, data>>] -- commit records yielded by git_reader.iter_git_log
+
+        Returns:
+        return_dict [dict<commit hash, dict<key name, data>>] -- key name list: author_date, commit_date, issue_id
+        """
+        re_msg = re.compile(r'^\s+(.*)$')
+        re_issue_id = re.compile(r'{0}-[0-9]*'.format(self.apache_issue_id_prefix))
+
+        return_dict = {}
+        for record in record_iter:
+            commit_hash = record['commit_hash']
+            if commit_hash in return_dict:
+                continue
+            return_dict[commit_hash] = {}
+            self.initialize_dict(return_dict[commit_hash])
+            return_dict[commit_hash]['author_date'] = record['author_date']
+            return_dict[commit_hash]['commit_date'] = record['commit_date']
+
+            for row in git_reader.format_fuller_message(record['message']):
+                issue_ids = self.match_issue_regexp(row, re_msg, re_issue_id)
+                for issue_id in issue_ids:
+                    return_dict[commit_hash]['issue_id'].add(issue_id)
+
+        return return_dict
+
 
     def count_issue(self, parsed_log_dict):
         issue_id_list = []
@@ -151,9 +182,7 @@ class ExtractCommitMessage:
 
 
     def process_log(self):
-        log = git_reader.git_log_all(self.repo_dir)
-
-        parsed_log_dict = self.parse_log(log)
+        parsed_log_dict = self.parse_log_records(git_reader.iter_git_log(self.repo_dir))
         util.dump_pickle("{0}/{1}_log_message_info.pickle".format(self.output_dir,
                                                                   self.p_name),
                                                                   parsed_log_dict)
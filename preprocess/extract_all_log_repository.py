@@ -0,0 +1,226 @@
+import os
+import re
+import subprocess
+
+from Utils import util
+from Utils import git_reader
+
+
+class ExtractAllCommitMessage:
+    def __init__(self, repo_dir=None, p_name=None, apache_issue_id_prefix=None, output_dir=None, verbose=0, incremental=0, commit_table=0):
+        """
+        repo_dir: [str] -- path to the target repository directory
+        p_name: [str] -- project name
+        apache_issue_id_prefix [str] -- apache's issue id. E.g., HADOOP. If no prefix, we use the upper project name
+        output_dir [str] -- output the result in this directory
+        verbose: [int] -- if it is not zero, this script shows the basict information
+        incremental: [int] -- if it is not zero, we only read the commits added since the previous run
+                              and merge them into the existing pickle files (see process_log_incremental)
+        commit_table: [int] -- if it is not zero, we also output the log message info as a CommitTable
+                               ({{ output_dir }}/{{ p_name }}_log_message_info_table), which can be given to
+                               the ILAs instead of the pickle file and is opened with mmap
+
+        This class walks the history only once and outputs the results of
+        both ExtractCommitMessage and ExtractRawCommitMessage.
+
+        OUTPUT:
+        The results are outputted in output_dir as pickle files
+        ({{ output_dir }}/{{ p_name }}_log_message_info.pickle).
+        ({{ output_dir }}/{{ p_name }}_log_message.pickle).
+        ({{ output_dir }}/{{ p_name }}_log_message_without_issueid.pickle).
+        The first one is a dictionary: dict<commit hash, dict<info name, info data>>
+        (info name can be found at initialize_dict).
+        The others are dictionaries: dict<commit hash, commit log messages>
+        In addition, the ref tips that we read are stored in
+        ({{ output_dir }}/{{ p_name }}_log_state.pickle) for the incremental mode.
+        """
+        self.repo_dir = repo_dir
+        self.p_name = p_name
+
+        if apache_issue_id_prefix is None:
+            self.apache_issue_id_prefix = p_name.upper()
+        else:
+            self.apache_issue_id_prefix = apache_issue_id_prefix
+
+        if output_dir is None:
+            self.output_dir = "./data_{0}".format(self.apache_issue_id_prefix)
+        else:
+            self.output_dir = output_dir
+
+        self.verbose = verbose
+        self.incremental = incremental
+        self.commit_table = commit_table
+
+        assert not self.repo_dir is None, "Need to give the repository path"
+        assert not self.p_name is None, "Need to give the project name"
+
+        self.re_msg = re.compile(r'^\s+(.*)$')
+        self.re_issue_id = re.compile(r'{0}-[0-9]*'.format(self.apache_issue_id_prefix))
+
+    def initialize_dict(self, dic):
+        dic['issue_id'] = set()
+        dic['author_date'] = None
+        dic['commit_date'] = None
+
+    def parse_record(self, record):
+        """
+        Parse a commit record of git_reader.iter_git_log
+
+        Returns:
+        info_dict [dict<key name, data>] -- key name list: author_date, commit_date, issue_id
+        message [string] -- log message
+        message_without_issueid [string] -- log message (issue ids are replaced with ISSUE_ID)
+        """
+        info_dict = {}
+        self.initialize_dict(info_dict)
+        info_dict['author_date'] = record['author_date']
+        info_dict['commit_date'] = record['commit_date']
+
+        row_list = []
+        for row in git_reader.format_fuller_message(record['message']):
+            match = self.re_msg.match(row)
+            if match:
+                info_dict['issue_id'].update(self.re_issue_id.findall(match.group(1)))
+                row_list.append(match.group(0) + "\n")
+        message = "".join(row_list)
+
+        return info_dict, message, self.re_issue_id.sub("ISSUE_ID", message)
+
+    def parse_log_records(self, record_iter):
+        """
+        Arguments:
+        record_iter [iterator<dict<key name, data>>] -- commit records yielded by git_reader.iter_git_log
+
+        Returns:
+        log_info_dict [dict<commit hash, dict<key name, data>>] -- key name list: author_date, commit_date, issue_id
+        log_message_dict [dict<commit hash, commit log message>] -- log message for each commit
+        log_message_without_issueid_dict [dict<commit hash, commit log message>] -- log message for each commit (issue ids are replaced with ISSUE_ID)
+        """
+        log_info_dict = {}
+        log_message_dict = {}
+        log_message_without_issueid_dict = {}
+        for record in record_iter:
+            commit_hash = record['commit_hash']
+            if commit_hash in log_info_dict:
+                continue
+
+            log_info_dict[commit_hash], log_message_dict[commit_hash], log_message_without_issueid_dict[commit_hash] = self.parse_record(record)
+
+        return log_info_dict, log_message_dict, log_message_without_issueid_dict
+
+    def count_issue(self, log_info_dict):
+        issue_id_list = []
+        for commit_hash in log_info_dict.keys():
+            issue_id_list.extend(log_info_dict[commit_hash]['issue_id'])
+
+        print("number of commit: {0}".format(len(log_info_dict)))
+        print("number of issue: {0}".format(len(issue_id_list)))
+        print("number of unique issue: {0}".format(len(set(issue_id_list))))
+
+    def dump(self, log_info_dict, log_message_dict, log_message_without_issueid_dict):
+        util.dump_pickle("{0}/{1}_log_message_info.pickle".format(self.output_dir, self.p_name),
+                         log_info_dict)
+        util.dump_pickle("{0}/{1}_log_message.pickle".format(self.output_dir, self.p_name),
+                         log_message_dict)
+        util.dump_pickle("{0}/{1}_log_message_without_issueid.pickle".format(self.output_dir, self.p_name),
+                         log_message_without_issueid_dict)
+        if self.commit_table!=0:
+            from Utils import commit_table
+            commit_table.CommitTable.from_dict(log_info_dict).save("{0}/{1}_log_message_info_table".format(self.output_dir, self.p_name))
+
+    def state_path(self):
+        return "{0}/{1}_log_state.pickle".format(self.output_dir, self.p_name)
+
+    def dump_state(self, ref_tips_dict):
+        util.dump_pickle(self.state_path(), {'ref_tips': ref_tips_dict,
+                                             'apache_issue_id_prefix': self.apache_issue_id_prefix})
+
+    def process_log(self):
+        # read the ref tips before the log so that commits pushed during the run are read next time
+        ref_tips_dict = git_reader.get_ref_tips(self.repo_dir)
+        parsed_dict_list = self.parse_log_records(git_reader.iter_git_log(self.repo_dir))
+        self.dump(*parsed_dict_list)
+        self.dump_state(ref_tips_dict)
+
+        if self.verbose!=0:
+            self.count_issue(parsed_dict_list[0])
+
+    def check_incremental(self, ref_tips_dict):
+        """
+        Check whether we can update the previous results incrementally
+
+        Arguments:
+        ref_tips_dict [dict<ref name, object id>] -- current ref tips
+
+        Returns:
+        old_tip_list [list<object id>] -- ref tips in the previous run. None if we need a full rebuild
+        """
+        path_list = [self.state_path()] + ["{0}/{1}_{2}.pickle".format(self.output_dir, self.p_name, name)
+                                           for name in ["log_message_info", "log_message", "log_message_without_issueid"]]
+        if not all([os.path.exists(path) for path in path_list]):
+            if self.verbose!=0:
+                print("No previous result: full rebuild")
+            return None
+
+        state = util.load_pickle(self.state_path())
+        if state['apache_issue_id_prefix']!=self.apache_issue_id_prefix:
+            if self.verbose!=0:
+                print("Issue id prefix was changed: full rebuild")
+            return None
+
+        old_tip_list = sorted(set(state['ref_tips'].values()))
+        try:
+            num_unreachable = git_reader.count_unreachable_commits(self.repo_dir, old_tip_list,
+                                                                   sorted(set(ref_tips_dict.values())))
+        except subprocess.CalledProcessError:
+            num_unreachable = -1 # an old tip was removed from the repository
+        if num_unreachable!=0:
+            if self.verbose!=0:
+                print("History was rewritten (force-push or deleted refs): full rebuild")
+            return None
+
+        return old_tip_list
+
+    def process_log_incremental(self):
+        """
+        Read only the commits reachable from the current ref tips but not from the ref tips of
+        the previous run (git log <new tips> ^<old tips>), and merge them into the previous results.
+        If the previous commits are not reachable anymore (history rewrite),
+        we rebuild all the results with process_log.
+        """
+        ref_tips_dict = git_reader.get_ref_tips(self.repo_dir)
+        old_tip_list = self.check_incremental(ref_tips_dict)
+        if old_tip_list is None:
+            self.process_log()
+            return
+
+        rev_list = sorted(set(ref_tips_dict.values())) + ["^{0}".format(tip) for tip in old_tip_list]
+        new_dict_list = self.parse_log_records(git_reader.iter_git_log(self.repo_dir, rev_list=rev_list))
+        if self.verbose!=0:
+            print("number of new commit: {0}".format(len(new_dict_list[0])))
+
+        parsed_dict_list = []
+        for name, new_dict in zip(["log_message_info", "log_message", "log_message_without_issueid"], new_dict_list):
+            old_dict = util.load_pickle("{0}/{1}_{2}.pickle".format(self.output_dir, self.p_name, name))
+            # the newer commits come first in the same way as git log
+            for commit_hash in old_dict.keys():
+                if not commit_hash in new_dict:
+                    new_dict[commit_hash] = old_dict[commit_hash]
+            parsed_dict_list.append(new_dict)
+        self.dump(*parsed_dict_list)
+        self.dump_state(ref_tips_dict)
+
+        if self.verbose!=0:
+            self.count_issue(parsed_dict_list[0])
+
+    def run(self):
+        if self.incremental!=0:
+            self.process_log_incremental()
+        else:
+            self.process_log()
+
+
+
+if __name__=="__main__":
+    ins = ExtractAllCommitMessage(repo_dir="./../repository/avro", p_name="avro", apache_issue_id_prefix="AVRO", verbose=1)
+    ins.run()
@@ -57,36 +57,70 @@ class ExtractRawCommitMessage:
         Returns:
         return_dict [dict<commit hash, dict<key name, data>>] -- key name list: author_date, commit_date, author, committer, issue_id
         """
-        re_commit = r'^commit ([0-9a-f]{5,40})$'
-        re_msg = r'^\s+(.*)$'
-        re_issue_id = r'{0}-[0-9]*'.format(self.apache_issue_id_prefix)
+        re_commit = re.compile(r'^commit ([0-9a-f]{5,40})$')
+        re_msg = re.compile(r'^\s+(.*)$')
+        re_issue_id = re.compile(r'{0}-[0-9]*'.format(self.apache_issue_id_prefix))
+
+        # collect the rows for each commit and join them at the end
+        # (+= on the message strings is quadratic for long messages)
+        row_list_dict = {}
+        cur_row_list = None
+        for row in log.splitlines():
+            match = re_commit.match(row)
+            if match:
+                if not match.group(1) in row_list_dict:
+                    row_list_dict[match.group(1)] = []
+                cur_row_list = row_list_dict[match.group(1)]
 
+            match = re_msg.match(row)
+            if match:
+                cur_row_list.append(match.group(0) + "\n")
 
         return_dict = {}
         return_dict_without_issueid = {}
-        cur_commit_hash = None
-        for row in log.splitlines():
-            commit_hash = self.match_basic_regexp(row, re_commit)
-            if commit_hash:
-                cur_commit_hash = commit_hash
-                if not cur_commit_hash in return_dict:
-                    return_dict[cur_commit_hash] = ""
-                    return_dict_without_issueid[cur_commit_hash] = ""
-
-            match = re.match(re_msg, row)
-            if match:
-                return_dict[cur_commit_hash] += match.group(0) + "\n"
-                return_dict_without_issueid[cur_commit_hash] += re.sub(re_issue_id, "ISSUE_ID", match.group(0) + "\n")
+        for commit_hash in row_list_dict.keys():
+            return_dict[commit_hash] = "".join(row_list_dict[commit_hash])
+            return_dict_without_issueid[commit_hash] = re_issue_id.sub("ISSUE_ID", return_dict[commit_hash])
+
+        return return_dict, return_dict_without_issueid
+
+    def parse_log_records(self, record_iter):
+        """
+        Same as parse_log, but read the commits one by one from git_reader.iter_git_log
+        instead of the whole `git log --pretty=fuller` output
 
+        Arguments:
+        record_iter [iterator<dict<key name, data>>] -- commit records yielded by git_reader.iter_git_log
+
+        Returns:
+        return_dict [dict<commit hash, commit log message>] -- log message for each commit
+        return_dict_without_issueid [dict<commit hash, commit log message>] -- log message for each commit (issue ids are replaced with ISSUE_ID)
+        """
+        re_msg = re.compile(r'^\s+(.*)$')
+        re_issue_id = re.compile(r'{0}-[0-9]*'.format(self.apache_issue_id_prefix))
+
+        return_dict = {}
+        return_dict_without_issueid = {}
+        for record in record_iter:
+            commit_hash = record['commit_hash']
+            if commit_hash in return_dict:
+                continue
+
+            row_list = []
+            for row in git_reader.format_fuller_message(record['message']):
+                match = re_msg.match(row)
+                if match:
+                    row_list.append(match.group(0) + "\n")
+            message = "".join(row_list)
+
+            return_dict[commit_hash] = message
+            return_dict_without_issueid[commit_hash] = re_issue_id.sub("ISSUE_ID", message)
 
         return return_dict, return_dict_without_issueid
 
 
     def process_log(self):
-        log = git_reader.git_log_all(self.repo_dir)
-        #print(log)
-
-        parsed_log_dict, parsed_log_dict_without_issueid = self.parse_log(log)
+        parsed_log_dict, parsed_log_dict_without_issueid = self.parse_log_records(git_reader.iter_git_log(self.repo_dir))
         util.dump_pickle("{0}/{1}_log_message.pickle".format(self.output_dir, self.p_name),
                          parsed_log_dict)
         util.dump_pickle("{0}/{1}_log_message_without_issueid.pickle".format(self.output_dir,self.p_name),
@@ -2,6 +2,7 @@
 from GS import comment
 from Utils import util
 from Utils import git_reader
+from Utils import modified_file_index
 import sqlite3
 import glob
 import re
@@ -67,15 +68,7 @@ def extract_modified_file_repo(repodir, hash_list):
     return_dict [dict<commit hash, list<modified files>>] -- modified files list for each commit hash
     """
 
-    print("Extract modified files")
-    return_dict = {}
-    num_hash_list = len(hash_list)
-    for idx, commit_hash in enumerate(hash_list):
-        if idx%1000==0:
-            print("{0}/{1}".format(idx, num_hash_list))
-        return_dict[commit_hash] = git_reader.get_all_modified_files(repodir, commit_hash)
-
-    return return_dict
+    return modified_file_index.extract_modified_file_repo(repodir, hash_list)
 
 def _extract_all_javadoc(f_path):
     re_javadoc = r"\s*comment\(Type=JavadocComment\):\s*$"
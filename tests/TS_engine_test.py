@@ -0,0 +1,173 @@
+import os
+import random
+import shutil
+import tempfile
+
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from TS import ntext_similarity
+from TS import similarity_store
+from Utils import util
+
+"""
+Equivalence test of the engines and options of NtextSimilarity on a synthetic corpus:
+each engine ("matrix", "apss", "lsh", top_k, and the "hashing" vectorizer) against engine="pairwise",
+and the incremental mode (incremental_model_dir) against a full refit after each update.
+preprocess_text is replaced with lower(), so the NLTK resources are not needed.
+
+Run it in the root directory of this repository:
+$ python -m tests.TS_engine_test
+"""
+
+THRESHOLD_COSINE_SIM = 0.2
+
+
+class LowerNtextSimilarity(ntext_similarity.NtextSimilarity):
+    def preprocess_text(self, text):
+        return text.lower()
+
+
+class SyntheticCorpus:
+    def __init__(self, seed=0, num_term=2000):
+        """
+        Random issues and commits (Zipf-like terms). Some commits reuse the terms of an issue,
+        so that there are pairs above THRESHOLD_COSINE_SIM.
+        """
+        self.rnd = random.Random(seed)
+        self.term_list = ["w{0}".format(idx) for idx in range(num_term)]
+        self.weight_list = [1/(idx+1)**0.5 for idx in range(num_term)]
+        self.dsc_issue_dict = {}
+        self.comment_issue_dict = {}
+        self.log_msg_repo_dict = {}
+
+    def text(self, max_length):
+        return " ".join(self.rnd.choices(self.term_list, weights=self.weight_list, k=self.rnd.randint(1, max_length)))
+
+    def add(self, num_issue, num_commit):
+        """
+        Add num_issue issues and num_commit commits (and the related commits of the new issues)
+        """
+        for _ in range(num_commit):
+            self.log_msg_repo_dict["{0:040x}".format(self.rnd.getrandbits(160))] = self.text(15)
+        for _ in range(num_issue):
+            issue_id = "SYN-{0}".format(len(self.dsc_issue_dict))
+            self.dsc_issue_dict[issue_id] = self.rnd.choice([None, self.text(40)])
+            self.comment_issue_dict[issue_id] = self.rnd.choice([None, "", self.text(60)])
+            issue_term_list = " ".join(text for text in (self.dsc_issue_dict[issue_id], self.comment_issue_dict[issue_id]) if text).split()
+            for _ in range(self.rnd.randint(0, 2) if issue_term_list else 0):
+                related_text = " ".join(self.rnd.sample(issue_term_list, min(len(issue_term_list), 8)) + [self.text(4)])
+                self.log_msg_repo_dict["{0:040x}".format(self.rnd.getrandbits(160))] = related_text
+
+    def hash_list(self):
+        return list(self.log_msg_repo_dict)
+
+    def issue_id_list(self):
+        return list(self.dsc_issue_dict)
+
+
+def compare_ntext(corpus, output_dir, **kwargs):
+    """
+    Returns:
+    return_dict [dict<issue id, list<commit hash>>] -- result of compare_ntext
+    """
+    ntext_similarity_obj = LowerNtextSimilarity(THRESHOLD_COSINE_SIM=THRESHOLD_COSINE_SIM, **kwargs)
+    return ntext_similarity_obj.compare_ntext(corpus.dsc_issue_dict, corpus.comment_issue_dict, corpus.log_msg_repo_dict,
+                                              corpus.hash_list(), corpus.issue_id_list(), corpus.issue_id_list(), output_dir)
+
+
+def load_scores(output_dir):
+    return util.load_pickle(ntext_similarity.get_cosine_similarity_path(output_dir, 0))
+
+
+def link_set(return_dict):
+    return set((issue_id, commit_hash) for issue_id, hash_list in return_dict.items() for commit_hash in hash_list)
+
+
+def run():
+    work_dir = tempfile.mkdtemp()
+
+    def new_output_dir(name):
+        output_dir = os.path.join(work_dir, name)
+        os.makedirs(output_dir)
+        return output_dir
+
+    try:
+        corpus = SyntheticCorpus()
+        corpus.add(60, 600)
+
+        pairwise_dict = compare_ntext(corpus, new_output_dir("pairwise"), engine="pairwise")
+        pairwise_scores = load_scores(os.path.join(work_dir, "pairwise"))
+        pairwise_links = link_set(pairwise_dict)
+        assert len(pairwise_links) > 0, "no pair above the threshold"
+
+        # matrix: the same links and similarities (all pairs)
+        matrix_dict = compare_ntext(corpus, new_output_dir("matrix"), engine="matrix", block_memory_mb=1)
+        assert matrix_dict==pairwise_dict, "matrix: links are different"
+        assert load_scores(os.path.join(work_dir, "matrix"))==pairwise_scores, "matrix: similarities are different"
+        print("matrix: OK")
+
+        # apss: the same links, and only the pairs above the threshold
+        apss_dict = compare_ntext(corpus, new_output_dir("apss"), engine="apss", block_memory_mb=1)
+        assert link_set(apss_dict)==pairwise_links, "apss: links are different"
+        apss_scores = load_scores(os.path.join(work_dir, "apss"))
+        assert all(abs(score - pairwise_scores[issue_id][commit_hash]) < 1e-12
+                   for issue_id, score_dict in apss_scores.items() for commit_hash, score in score_dict.items()), "apss: similarities are different"
+        assert not ntext_similarity.has_all_scores(os.path.join(work_dir, "apss"), 0)
+        print("apss: OK")
+
+        # top_k: the k most similar commits above the threshold
+        top_k = 3
+        for engine in ("matrix", "apss"):
+            top_k_dict = compare_ntext(corpus, new_output_dir("top_k_{0}".format(engine)), engine=engine, top_k=top_k)
+            for issue_id in corpus.issue_id_list():
+                linked_score_list = sorted((pairwise_scores[issue_id][commit_hash] for commit_hash in pairwise_dict.get(issue_id, [])), reverse=True)
+                found_hash_list = top_k_dict.get(issue_id, [])
+                assert len(found_hash_list)==min(top_k, len(linked_score_list)), "top_k ({0}): number of commits of {1}".format(engine, issue_id)
+                found_score_list = [pairwise_scores[issue_id][commit_hash] for commit_hash in found_hash_list]
+                assert all(abs(found - expected) < 1e-12 for found, expected in zip(found_score_list, linked_score_list)), \
+                    "top_k ({0}): commits of {1} are not the most similar".format(engine, issue_id)
+            print("top_k ({0}): OK".format(engine))
+
+        # lsh: approximate, but the found links are correct and have the same similarities as the matrix engine
+        lsh_dict = compare_ntext(corpus, new_output_dir("lsh"), engine="lsh", lsh_max_candidate_ratio=None, lsh_low_recall="warn")
+        assert link_set(lsh_dict) <= pairwise_links, "lsh: a link is not above the threshold"
+        assert all(score==pairwise_scores[issue_id][commit_hash] for issue_id, score_dict in load_scores(os.path.join(work_dir, "lsh")).items()
+                   for commit_hash, score in score_dict.items()), "lsh: similarities are different"
+        print("lsh: OK (found {0} of {1} links)".format(len(link_set(lsh_dict)), len(pairwise_links)))
+
+        # hashing vectorizer: the same as the tfidf vectorizer while no two terms have the same hash
+        n_hash_features = 2**22
+        term_hash = HashingVectorizer(n_features=n_hash_features, alternate_sign=False, norm=None).transform(corpus.term_list).indices
+        assert len(np.unique(term_hash))==len(corpus.term_list), "hashing: two terms have the same hash (change n_hash_features)"
+        hashing_output_dir = new_output_dir("hashing")
+        hashing_dict = compare_ntext(corpus, hashing_output_dir, vectorizer="hashing", n_hash_features=n_hash_features, similarity_store=1, block_memory_mb=1)
+        assert link_set(hashing_dict)==pairwise_links, "hashing: links are different"
+        store = similarity_store.SimilarityStore(similarity_store.get_store_dir(hashing_output_dir))
+        issue_id_list, hash_list = zip(*sorted(pairwise_links))
+        stored_score = store.lookup_batch(list(issue_id_list), list(hash_list))
+        expected_score = np.array([pairwise_scores[issue_id][commit_hash] for issue_id, commit_hash in zip(issue_id_list, hash_list)])
+        assert np.allclose(stored_score, expected_score, rtol=0, atol=1e-6), "hashing: similarities are different"
+        print("hashing: OK")
+
+        # incremental: the same as a full refit after each update
+        incremental_corpus = SyntheticCorpus(seed=1)
+        model_dir = os.path.join(work_dir, "incremental_model")
+        incremental_output_dir = new_output_dir("incremental")
+        for num_update, (num_issue, num_commit) in enumerate([(40, 400), (10, 100), (5, 50)]):
+            incremental_corpus.add(num_issue, num_commit)
+            incremental_dict = compare_ntext(incremental_corpus, incremental_output_dir, incremental_model_dir=model_dir)
+            refit_output_dir = new_output_dir("refit_{0}".format(num_update))
+            refit_dict = compare_ntext(incremental_corpus, refit_output_dir)
+            assert incremental_dict==refit_dict, "incremental: links are different (update {0})".format(num_update)
+            assert load_scores(incremental_output_dir)==load_scores(refit_output_dir), "incremental: similarities are different (update {0})".format(num_update)
+        print("incremental: OK")
+
+        print("TEST DONE")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__=="__main__":
+
+    run()
@@ -0,0 +1,47 @@
+from preprocess.extract_all_log_repository import ExtractAllCommitMessage
+from Utils import util
+
+
+def run():
+    ins = ExtractAllCommitMessage(repo_dir="./../repository/avro",
+                                  p_name="avro", apache_issue_id_prefix="AVRO",
+                                  output_dir="./../preprocess/data_AVRO", verbose=1)
+    ins.run()
+
+    def test(test_data, target_data, key_list=None):
+        test_hash_list = sorted(list(test_data.keys()))
+        target_hash_list = sorted(list(target_data.keys()))
+
+        # check length
+        assert len(test_hash_list) == len(target_hash_list), "{0} and {1}".format(len(test_hash_list), len(target_hash_list))
+
+        # check contents
+        for test_hash, target_hash in zip(test_hash_list, target_hash_list):
+            assert test_hash==target_hash, "commit hash is not same"
+
+            if key_list is None:
+                assert test_data[test_hash]==target_data[target_hash], "content is different"
+            else:
+                for target_row in key_list:
+                    assert test_data[test_hash][target_row]==target_data[target_hash][target_row], "content is different: {0}".format(target_row)
+
+        print("TEST DONE")
+
+    test_info_data = util.load_pickle("./test_data/avro_log_message_info.pickle")
+    test_org_data = util.load_pickle("./test_data/avro_log_message.pickle")
+    test_mod_data = util.load_pickle("./test_data/avro_log_message_without_issueid.pickle")
+
+    target_data = util.load_pickle("./../preprocess/data_AVRO/avro_log_message_info.pickle")
+    test(test_info_data, target_data, ["issue_id", "author_date", "commit_date"])
+    target_data = util.load_pickle("./../preprocess/data_AVRO/avro_log_message.pickle")
+    test(test_org_data, target_data)
+    target_data = util.load_pickle("./../preprocess/data_AVRO/avro_log_message_without_issueid.pickle")
+    test(test_mod_data, target_data)
+
+
+
+
+if __name__=="__main__":
+
+
+    run()
@@ -0,0 +1,58 @@
+import os
+import statistics
+import subprocess
+import sys
+
+"""
+Startup benchmark: the time to import the ILA modules that use TS in a fresh interpreter,
+and the heavy libraries that were loaded by the import (they must be imported lazily).
+
+Run it in the root directory of this repository:
+$ python -m tests.startup_benchmark
+"""
+
+MODULE_LIST = ["TS.ntext_similarity", "GS.comment", "MT.nsd_similarity", "PU.pu_link"]
+HEAVY_MODULE_LIST = ["nltk", "sklearn", "scipy"]
+
+CODE = """
+import sys
+import time
+start = time.perf_counter()
+import {0}
+print(time.perf_counter() - start)
+print(",".join(module for module in {1!r} if module in sys.modules))
+"""
+
+
+def measure(module, num_run=5):
+    """
+    Arguments:
+    module [string] -- module name
+    num_run [int] -- number of fresh interpreters
+
+    Returns:
+    median_time [float] -- median import time (seconds)
+    heavy_module_list [list<string>] -- heavy modules that were loaded by the import
+    """
+    time_list = []
+    heavy_module_list = []
+    for _ in range(num_run):
+        output = subprocess.run([sys.executable, "-c", CODE.format(module, HEAVY_MODULE_LIST)],
+                                cwd=os.getcwd(), capture_output=True, text=True, check=True).stdout.splitlines()
+        time_list.append(float(output[-2]))
+        heavy_module_list = [heavy_module for heavy_module in output[-1].split(",") if heavy_module]
+    return statistics.median(time_list), heavy_module_list
+
+
+def run(num_run=5):
+    for module in MODULE_LIST:
+        median_time, heavy_module_list = measure(module, num_run)
+        print("{0:<24} {1:8.1f} ms  heavy modules: {2}".format(module, median_time*1000,
+                                                             ", ".join(heavy_module_list) if heavy_module_list else "-"))
+        assert len(heavy_module_list)==0, "{0} imports {1} at startup".format(module, heavy_module_list)
+    print("BENCHMARK DONE")
+
+
+if __name__=="__main__":
+
+    run()
@@ -0,0 +1,41 @@
+import random
+
+from TS import regex_tokenizer
+from Utils import util
+from tests import TS_test
+
+"""
+Equivalence report of the regex tokenizer (TS/regex_tokenizer.py) against nltk.word_tokenize
+on a sample of the issue descriptions, comments, and log messages (the NLTK resources are needed).
+
+Run it in the root directory of this repository:
+$ python -m tests.tokenizer_equivalence_report
+"""
+
+
+def sample_corpus(db_path, log_message_without_issueid_path, num_sample=2000, seed=0):
+    """
+    Returns:
+    text_list [list<string>] -- num_sample texts of each kind (descriptions, comments, and log messages)
+    """
+    rnd = random.Random(seed)
+    text_list = []
+    for text_dict in (TS_test.extract_description(db_path), TS_test.extract_comment(db_path),
+                      util.load_pickle(log_message_without_issueid_path)):
+        kind_text_list = [text for text in text_dict.values() if not text is None]
+        text_list.extend(rnd.sample(kind_text_list, min(num_sample, len(kind_text_list))))
+    return text_list
+
+
+def run(num_sample=2000):
+    db_path = "./../tests/test_data/exp15/avro_issue_field_data.db"
+    log_message_without_issueid_path = "./../preprocess/data_AVRO/avro_log_message_without_issueid.pickle"
+
+    report = regex_tokenizer.equivalence_report(sample_corpus(db_path, log_message_without_issueid_path, num_sample))
+    regex_tokenizer.print_report(report)
+    print("REPORT DONE")
+
+
+if __name__=="__main__":
+
+    run()